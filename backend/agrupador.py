@@ -0,0 +1,191 @@
+"""
+Agrupación de llamadas idénticas en curso (single-flight)
+
+Cuando llegan a la vez varias peticiones con la misma clave (por ejemplo,
+el mismo prompt para OpenAI), solo la primera hace la llamada; las demás
+esperan ese mismo resultado. En streaming, los eventos de la única llamada
+se reparten a todos los suscriptores.
+
+- Cada clave tiene un tiempo máximo: al vencer, todos reciben TimeoutError.
+- Si un suscriptor se cancela (por ejemplo, el cliente se desconectó), los
+  demás siguen recibiendo el resultado; la llamada solo se cancela cuando ya
+  no queda nadie esperándola.
+- Cada suscriptor de un stream tiene su propia cola: uno lento no frena a
+  los demás ni a la llamada.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Marca de fin de un stream en las colas de los suscriptores
+_FIN_STREAM = object()
+
+
+class _LlamadaCompartida:
+    """Una llamada en curso y cuántas peticiones la esperan"""
+    
+    def __init__(self, tarea: asyncio.Task):
+        self.tarea = tarea
+        self.esperando = 0
+
+
+class _StreamCompartido:
+    """Un stream en curso, los eventos emitidos y las colas de sus suscriptores"""
+    
+    def __init__(self):
+        self.tarea: Optional[asyncio.Task] = None
+        self.eventos: List[Any] = []
+        self.colas: List[asyncio.Queue] = []
+
+
+class AgrupadorLlamadas:
+    """Single-flight para llamadas asíncronas y streams identificados por una clave"""
+    
+    def __init__(self, nombre: str):
+        """
+        Args:
+            nombre: Nombre para identificar el agrupador en /api/health
+        """
+        self.nombre = nombre
+        self._llamadas: Dict[Hashable, _LlamadaCompartida] = {}
+        self._streams: Dict[Hashable, _StreamCompartido] = {}
+        self.llamadas = 0
+        self.agrupadas = 0
+        self.tiempos_agotados = 0
+        self.canceladas = 0
+    
+    async def ejecutar(
+        self,
+        clave: Hashable,
+        funcion: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Ejecuta `funcion` una sola vez para todas las peticiones concurrentes con la misma clave
+        
+        Args:
+            clave: Clave canónica de la llamada
+            funcion: Función asíncrona que hace la llamada real
+            timeout: Segundos máximos para la llamada compartida (None = sin límite)
+        
+        Returns:
+            Resultado de la llamada (compartido por todas las peticiones)
+        
+        Raises:
+            asyncio.TimeoutError: Si la llamada compartida supera el timeout
+            Exception: La excepción de `funcion`, para todas las peticiones
+        """
+        llamada = self._llamadas.get(clave)
+        if llamada is None:
+            self.llamadas += 1
+            tarea = asyncio.create_task(self._con_timeout(funcion(), timeout))
+            llamada = self._llamadas[clave] = _LlamadaCompartida(tarea)
+            tarea.add_done_callback(lambda _: self._quitar(self._llamadas, clave, llamada))
+        else:
+            self.agrupadas += 1
+        
+        llamada.esperando += 1
+        try:
+            # shield: cancelar una petición no cancela la llamada de las demás
+            return await asyncio.shield(llamada.tarea)
+        finally:
+            llamada.esperando -= 1
+            if llamada.esperando == 0 and not llamada.tarea.done():
+                # Nadie espera ya el resultado: no seguir gastando la llamada
+                self.canceladas += 1
+                llamada.tarea.cancel()
+    
+    async def difundir(
+        self,
+        clave: Hashable,
+        productor: Callable[[], AsyncIterator[Any]],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        """
+        Recorre un stream compartido por todas las peticiones concurrentes con la misma clave
+        
+        Quien llega con el stream ya empezado recibe primero los eventos anteriores.
+        
+        Args:
+            clave: Clave canónica del stream
+            productor: Función que crea el generador asíncrono real
+            timeout: Segundos máximos para el stream completo (None = sin límite)
+        
+        Yields:
+            Los eventos del stream, en orden
+        
+        Raises:
+            asyncio.TimeoutError: Si el stream supera el timeout
+            Exception: La excepción del productor, para todos los suscriptores
+        """
+        stream = self._streams.get(clave)
+        if stream is None:
+            self.llamadas += 1
+            stream = self._streams[clave] = _StreamCompartido()
+            stream.tarea = asyncio.create_task(self._con_timeout(self._producir(stream, productor), timeout))
+            stream.tarea.add_done_callback(lambda tarea: self._terminar_stream(clave, stream, tarea))
+        else:
+            self.agrupadas += 1
+        
+        cola: asyncio.Queue = asyncio.Queue()
+        for evento in stream.eventos:
+            cola.put_nowait(evento)
+        stream.colas.append(cola)
+        try:
+            while True:
+                evento = await cola.get()
+                if evento is _FIN_STREAM:
+                    return
+                if isinstance(evento, BaseException):
+                    raise evento
+                yield evento
+        finally:
+            stream.colas.remove(cola)
+            if not stream.colas and not stream.tarea.done():
+                # Nadie lee ya el stream: cerrarlo (libera la conexión con el proveedor)
+                self.canceladas += 1
+                stream.tarea.cancel()
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Contadores de uso del agrupador"""
+        return {
+            "en_curso": len(self._llamadas) + len(self._streams),
+            "llamadas": self.llamadas,
+            "agrupadas": self.agrupadas,
+            "tiempos_agotados": self.tiempos_agotados,
+            "canceladas": self.canceladas
+        }
+    
+    async def _con_timeout(self, corrutina: Awaitable[Any], timeout: Optional[float]) -> Any:
+        try:
+            return await asyncio.wait_for(corrutina, timeout)
+        except asyncio.TimeoutError:
+            self.tiempos_agotados += 1
+            raise
+    
+    @staticmethod
+    async def _producir(stream: _StreamCompartido, productor: Callable[[], AsyncIterator[Any]]):
+        generador = productor()
+        try:
+            async for evento in generador:
+                stream.eventos.append(evento)
+                for cola in stream.colas:
+                    cola.put_nowait(evento)
+        finally:
+            await generador.aclose()
+    
+    def _terminar_stream(self, clave: Hashable, stream: _StreamCompartido, tarea: asyncio.Task):
+        self._quitar(self._streams, clave, stream)
+        if tarea.cancelled():
+            # Solo llega a algún suscriptor si se canceló con lectores (por ejemplo, al apagar)
+            final = RuntimeError("El stream compartido se canceló")
+        else:
+            final = tarea.exception() or _FIN_STREAM
+        for cola in stream.colas:
+            cola.put_nowait(final)
+    
+    @staticmethod
+    def _quitar(registro: Dict[Hashable, Any], clave: Hashable, valor: Any):
+        # Solo quitar si la clave no se ha reutilizado para una llamada nueva
+        if registro.get(clave) is valor:
+            del registro[clave]
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark de la extracción de destinos (destinos.py)
+
+Mide el costo de extraer el destino de una pregunta con el diccionario
+incluido y con un índice ampliado a 50.000 destinos sintéticos (el tamaño
+de un volcado de GeoNames), y comprueba que las coincidencias respetan los
+límites de palabra.
+
+Uso (desde backend/):
+    python benchmarks/bench_destinos.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import destinos
+from destinos import Destino, IndiceDestinos, cargar_destinos_incluidos, extraer_destino
+
+PREGUNTAS = [
+    "¿Qué hacer en París en junio con un presupuesto de 1500 euros?",
+    "Quiero un itinerario de 5 días por Tokio y Kioto, me gusta la comida y los museos",
+    "Vuelo de Madrid a Nueva York en diciembre, ¿qué barrios me recomiendas?",
+    "Busco un viaje romántico por Europa con playas tranquilas y buena gastronomía",
+    "Planificar un viaje de mochilero por Europa del Este: Praga, Budapest, Cracovia y Viena " * 5,
+]
+
+SILABAS = ["ba", "ko", "ri", "ta", "len", "mor", "vi", "sa", "ne", "dru", "pol", "xe", "qui", "ran", "to"]
+
+
+def nombre_sintetico(generador: random.Random) -> str:
+    palabras = generador.randint(1, 3)
+    return " ".join(
+        "".join(generador.choice(SILABAS) for _ in range(generador.randint(2, 4)))
+        for _ in range(palabras)
+    )
+
+
+def crear_indice_grande(total: int = 50000) -> IndiceDestinos:
+    """Índice con el diccionario incluido más 'total' destinos sintéticos"""
+    generador = random.Random(42)
+    indice = IndiceDestinos()
+    cargar_destinos_incluidos(indice)
+    while len(indice) < total:
+        destino = Destino(nombre_sintetico(generador), "XX", 0.0, 0.0, generador.randint(15000, 10**6))
+        indice.agregar(destino, fijo=False)
+    return indice
+
+
+def verificar_limites_de_palabra():
+    """Comprueba coincidencias más largas y palabras completas"""
+    assert extraer_destino("Un viaje romántico por Europa") is None
+    assert extraer_destino("Quiero ir a Roma en mayo").nombre == "Roma"
+    assert extraer_destino("Vuelo de Madrid a nueva york").nombre == "Nueva York"
+    assert extraer_destino("Qué ver en Ciudad de México").nombre == "Ciudad de México"
+    assert extraer_destino("Playas cerca de Río de Janeiro").nombre == "Río de Janeiro"
+
+
+def main():
+    verificar_limites_de_palabra()
+    print("Coincidencias por palabra completa correctas")
+
+    repeticiones = 2000
+    for nombre, indice in (("incluido", destinos.indice_destinos), ("50.000", crear_indice_grande())):
+        destinos.indice_destinos = indice
+        mejor = min(timeit.repeat(
+            lambda: [extraer_destino(pregunta) for pregunta in PREGUNTAS],
+            number=repeticiones,
+            repeat=5
+        ))
+        por_pregunta = mejor / (repeticiones * len(PREGUNTAS)) * 1e6
+        print(f"{nombre:>9} ({len(indice):>6} alias): {por_pregunta:6.1f} µs por pregunta")
+
+
+if __name__ == "__main__":
+    main()
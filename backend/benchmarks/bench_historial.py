@@ -0,0 +1,119 @@
+"""
+Micro-benchmark del recorte del historial (limitar_historial_por_tokens)
+
+Compara la implementación anterior (insert(1, mensaje) dentro del bucle, más
+la copia filtrada y el recuento completo que hacía después
+construir_mensajes_chatgpt) con la pasada única hacia atrás actual, sobre
+historiales de 1.000 a 10.000 mensajes, y verifica que ambas eligen los
+mismos mensajes.
+
+Se mide con un modelo de contexto pequeño (caben pocos mensajes) y con uno
+de 128k (caben miles). Los conteos de tokens ya están en la caché en ambos
+casos, así que se mide solo el recorte.
+
+Uso (desde backend/):
+    python benchmarks/bench_historial.py
+"""
+
+import os
+import sys
+import timeit
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Que los conteos de los historiales más largos quepan en la caché
+os.environ.setdefault("OPENAI_TOKENS_CACHE_MAX", "50000")
+
+from openai_config import (
+    MODEL_TOKEN_LIMITS,
+    ContadorAproximado,
+    configurar_contador_tokens,
+    estimar_tokens_mensajes,
+    limitar_historial_por_tokens
+)
+
+TAMANOS = [1000, 5000, 10000]
+MODELOS = ["gpt-3.5-turbo", "gpt-4o"]
+MAX_TOKENS = 1500
+RESERVA = 600
+
+
+def crear_historial(total: int) -> List[Dict[str, str]]:
+    """Historial alternando usuario y asistente, con el system prompt y la pregunta al final"""
+    historial = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Mensaje {i}: ¿qué ver en Lisboa, Oporto y Coímbra en {i % 12 + 1} días? " * (1 + i % 3)
+        }
+        for i in range(total)
+    ]
+    return historial + [
+        {"role": "system", "content": "Eres ViajeIA, un asistente experto en viajes. " * 20},
+        {"role": "user", "content": "¿Y si agrego Sevilla al final del viaje?"}
+    ]
+
+
+def limitar_anterior(mensajes: List[Dict[str, str]], modelo: str) -> List[Dict[str, str]]:
+    """Implementación anterior de limitar_historial_por_tokens + el post-proceso de main.py"""
+    max_context_tokens = MODEL_TOKEN_LIMITS.get(modelo, 4096)
+    tokens_disponibles = max_context_tokens - MAX_TOKENS - RESERVA
+    
+    mensaje_sistema = None
+    otros_mensajes = []
+    for mensaje in mensajes:
+        if mensaje.get("role") == "system":
+            mensaje_sistema = mensaje
+        else:
+            otros_mensajes.append(mensaje)
+    
+    mensajes_limitados = [mensaje_sistema]
+    tokens_usados = estimar_tokens_mensajes(mensajes_limitados, modelo)
+    for mensaje in reversed(otros_mensajes):
+        # Mismo costo por mensaje que la versión actual (sin repetir el inicio de la respuesta)
+        tokens_mensaje = estimar_tokens_mensajes([mensaje], modelo)
+        if tokens_usados + tokens_mensaje <= tokens_disponibles:
+            mensajes_limitados.insert(1, mensaje)
+            tokens_usados += tokens_mensaje
+        else:
+            break
+    
+    # Post-proceso de construir_mensajes_chatgpt: copia filtrada y recuento completo
+    historial_sin_system = [m for m in mensajes_limitados if m.get("role") != "system"]
+    if historial_sin_system[-1].get("content") != mensajes[-1].get("content"):
+        mensajes_limitados.append(mensajes[-1])
+    estimar_tokens_mensajes(mensajes_limitados, modelo)
+    return mensajes_limitados
+
+
+def main():
+    # Contador determinista (no depende de que tiktoken esté instalado) y sin
+    # inicio de respuesta, para que las dos versiones sumen exactamente lo mismo
+    contador = ContadorAproximado()
+    contador.tokens_por_respuesta = 0
+    configurar_contador_tokens(contador)
+    
+    for modelo in MODELOS:
+        for total in TAMANOS:
+            mensajes = crear_historial(total)
+            anterior = limitar_anterior(mensajes, modelo)
+            actual, tokens = limitar_historial_por_tokens(mensajes, modelo, MAX_TOKENS, RESERVA)
+            assert actual == anterior, (modelo, total)
+            assert tokens == estimar_tokens_mensajes(actual, modelo)
+            
+            repeticiones = 20
+            t_anterior = min(timeit.repeat(lambda: limitar_anterior(mensajes, modelo), number=repeticiones, repeat=3))
+            t_actual = min(timeit.repeat(
+                lambda: limitar_historial_por_tokens(mensajes, modelo, MAX_TOKENS, RESERVA),
+                number=repeticiones,
+                repeat=3
+            ))
+            print(
+                f"{modelo:>14} {total:>6} mensajes ({len(actual):>5} conservados): "
+                f"anterior {t_anterior / repeticiones * 1e3:8.2f} ms, "
+                f"actual {t_actual / repeticiones * 1e3:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
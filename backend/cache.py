@@ -0,0 +1,142 @@
+"""
+Caché en memoria con TTL y desalojo LRU para ViajeIA
+
+Usada para no repetir llamadas a servicios externos (clima, etc.).
+Soporta caché negativa (recordar que algo no existe durante menos tiempo)
+y agrupación de peticiones: N peticiones concurrentes por la misma clave
+producen una sola llamada al servicio externo.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Registro de cachés para exponer sus estadísticas
+_caches_registradas: Dict[str, "CacheTTL"] = {}
+
+
+class CacheTTL:
+    """Caché LRU acotada con expiración por entrada"""
+    
+    def __init__(self, nombre: str, max_entradas: int, ttl: float, ttl_negativo: Optional[float] = None):
+        """
+        Args:
+            nombre: Nombre de la caché (para estadísticas)
+            max_entradas: Número máximo de entradas antes de desalojar la menos usada
+            ttl: Segundos de vida de una entrada
+            ttl_negativo: Segundos de vida de un resultado vacío (None). Si es None, no se guardan
+        """
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._entradas: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._en_curso: Dict[Hashable, asyncio.Task] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.agrupadas = 0
+        _caches_registradas[nombre] = self
+    
+    def obtener(self, clave: Hashable) -> Tuple[bool, Any]:
+        """
+        Busca una entrada vigente.
+        
+        Args:
+            clave: Clave de la entrada
+            
+        Returns:
+            Tupla (encontrado, valor)
+        """
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            expira_en, valor = entrada
+            if expira_en > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return True, valor
+            # Expirada: eliminarla
+            del self._entradas[clave]
+        self.fallos += 1
+        return False, None
+    
+    def guardar(self, clave: Hashable, valor: Any, ttl: Optional[float] = None):
+        """
+        Guarda una entrada, desalojando la menos usada si se supera el tamaño máximo.
+        
+        Args:
+            clave: Clave de la entrada
+            valor: Valor a guardar (None se trata como resultado negativo)
+            ttl: Segundos de vida (por defecto, ttl o ttl_negativo de la caché)
+        """
+        if ttl is None:
+            ttl = self.ttl if valor is not None else self.ttl_negativo
+        if not ttl:
+            return
+        
+        self._entradas[clave] = (time.monotonic() + ttl, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojos += 1
+    
+    async def obtener_o_calcular(self, clave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Devuelve la entrada en caché o la calcula una sola vez aunque haya
+        varias peticiones concurrentes por la misma clave.
+        
+        Si `calcular` lanza una excepción, el resultado no se guarda y la
+        excepción se propaga a todas las peticiones que esperaban.
+        
+        Args:
+            clave: Clave de la entrada
+            calcular: Función asíncrona que obtiene el valor si no está en caché
+            
+        Returns:
+            Valor en caché o recién calculado
+        """
+        encontrado, valor = self.obtener(clave)
+        if encontrado:
+            return valor
+        
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = asyncio.create_task(self._calcular_y_guardar(clave, calcular))
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+        else:
+            self.agrupadas += 1
+        
+        # shield: si una petición se cancela, la llamada compartida sigue para las demás
+        return await asyncio.shield(tarea)
+    
+    async def _calcular_y_guardar(self, clave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        valor = await calcular()
+        self.guardar(clave, valor)
+        return valor
+    
+    def limpiar(self):
+        """Elimina todas las entradas"""
+        self._entradas.clear()
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Contadores de uso de la caché"""
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "agrupadas": self.agrupadas
+        }
+
+
+def obtener_estadisticas_caches() -> Dict[str, Dict[str, int]]:
+    """
+    Obtiene las estadísticas de todas las cachés registradas
+    
+    Returns:
+        Diccionario {nombre_cache: estadisticas}
+    """
+    return {nombre: cache.estadisticas() for nombre, cache in _caches_registradas.items()}
@@ -0,0 +1,153 @@
+"""
+Caché persistente de fotos de destinos (Unsplash)
+
+Las fotos de una ciudad casi no cambian y la cuota de Unsplash es baja
+(50 peticiones/hora en modo demo), así que los resultados se guardan
+con un TTL largo en una base SQLite local que sobrevive a reinicios.
+Las entradas vencidas se siguen usando como respaldo cuando Unsplash
+rechaza la petición (403/429).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from logger_config import logger
+
+# Importar constantes de configuración
+try:
+    from config import FOTOS_CACHE_DB, FOTOS_CACHE_TTL
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    FOTOS_CACHE_DB = "fotos_cache.sqlite3"
+    FOTOS_CACHE_TTL = 7 * 24 * 3600
+
+ClaveFotos = Tuple[str, int, str]  # (ciudad normalizada, cantidad, orientación)
+
+
+class CacheFotos:
+    """Caché de fotos en memoria respaldada por SQLite"""
+    
+    def __init__(self, ruta_db: Optional[str] = FOTOS_CACHE_DB, ttl: float = FOTOS_CACHE_TTL):
+        """
+        Args:
+            ruta_db: Archivo SQLite donde persistir la caché (None o "" para solo memoria)
+            ttl: Segundos durante los que una entrada se considera vigente
+        """
+        self.ruta_db = ruta_db or None
+        self.ttl = ttl
+        self._entradas: Dict[ClaveFotos, Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        self.aciertos = 0
+        self.fallos = 0
+        self.respaldos = 0
+    
+    def abrir(self):
+        """Abre la base de datos y carga las entradas en memoria"""
+        if not self.ruta_db or self._conexion is not None:
+            return
+        try:
+            self._conexion = sqlite3.connect(self.ruta_db, check_same_thread=False)
+            self._conexion.execute(
+                """CREATE TABLE IF NOT EXISTS fotos (
+                    ciudad TEXT NOT NULL,
+                    cantidad INTEGER NOT NULL,
+                    orientacion TEXT NOT NULL,
+                    guardado_en REAL NOT NULL,
+                    urls TEXT NOT NULL,
+                    PRIMARY KEY (ciudad, cantidad, orientacion)
+                )"""
+            )
+            self._conexion.commit()
+            filas = self._conexion.execute(
+                "SELECT ciudad, cantidad, orientacion, guardado_en, urls FROM fotos"
+            ).fetchall()
+            for ciudad, cantidad, orientacion, guardado_en, urls in filas:
+                self._entradas[(ciudad, cantidad, orientacion)] = (guardado_en, json.loads(urls))
+            logger.info(f"Caché de fotos cargada desde {self.ruta_db} ({len(filas)} entradas)")
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"No se pudo abrir la caché de fotos, se usará solo memoria: {e}")
+            self._conexion = None
+    
+    def cerrar(self):
+        """Cierra la base de datos"""
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+    
+    def obtener(self, clave: ClaveFotos) -> Tuple[Optional[List[str]], bool]:
+        """
+        Busca las fotos de una clave, aunque estén vencidas.
+        
+        Args:
+            clave: (ciudad normalizada, cantidad, orientación)
+            
+        Returns:
+            Tupla (fotos o None, vigente)
+        """
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return None, False
+        guardado_en, fotos = entrada
+        vigente = time.time() - guardado_en < self.ttl
+        if vigente:
+            self.aciertos += 1
+        else:
+            self.fallos += 1
+        return fotos, vigente
+    
+    def obtener_respaldo(self, clave: ClaveFotos) -> Optional[List[str]]:
+        """
+        Devuelve las fotos guardadas aunque estén vencidas (cuando Unsplash no responde).
+        
+        Args:
+            clave: (ciudad normalizada, cantidad, orientación)
+            
+        Returns:
+            Lista de URLs o None si nunca se guardaron
+        """
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        self.respaldos += 1
+        return entrada[1]
+    
+    def guardar(self, clave: ClaveFotos, fotos: List[str]):
+        """
+        Guarda las fotos de una clave en memoria y en disco.
+        
+        Args:
+            clave: (ciudad normalizada, cantidad, orientación)
+            fotos: Lista de URLs
+        """
+        guardado_en = time.time()
+        self._entradas[clave] = (guardado_en, fotos)
+        try:
+            with self._lock:
+                # cerrar() puede haber cerrado la conexión desde otro hilo
+                if self._conexion is None:
+                    return
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO fotos VALUES (?, ?, ?, ?, ?)",
+                    (*clave, guardado_en, json.dumps(fotos))
+                )
+                self._conexion.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error al guardar fotos en caché: {e}")
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Contadores de uso de la caché"""
+        return {
+            "entradas": len(self._entradas),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "respaldos": self.respaldos
+        }
+
+
+# Caché global de fotos
+cache_fotos = CacheFotos()
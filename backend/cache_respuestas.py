@@ -0,0 +1,264 @@
+"""
+Caché de respuestas de ChatGPT para preguntas repetidas
+
+Muchas consultas son casi idénticas ("plan de 5 días en París con presupuesto
+medio"). Esta caché guarda las respuestas por contexto canónico (destino,
+mes del viaje, rango de presupuesto, preferencia, modelo y temperature) y,
+dentro de cada contexto, busca la pregunta por coincidencia exacta o por
+similitud de tokens (Jaccard), calculada localmente.
+
+El destino que se menciona en la pregunta también forma parte del contexto,
+y las preguntas que difieren en algún número ("5 días" vs "7 días"), en un
+destino o en una negación ("no recomiendas") nunca se consideran equivalentes.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+from normalizacion import normalizar
+from destinos import extraer_destinos
+
+# Importar constantes de configuración
+try:
+    from config import (
+        RESPUESTAS_CACHE_ACTIVA,
+        RESPUESTAS_CACHE_TTL,
+        RESPUESTAS_CACHE_MAX_ENTRADAS,
+        RESPUESTAS_CACHE_SIMILITUD
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    RESPUESTAS_CACHE_ACTIVA = True
+    RESPUESTAS_CACHE_TTL = 3600
+    RESPUESTAS_CACHE_MAX_ENTRADAS = 1000
+    RESPUESTAS_CACHE_SIMILITUD = 0.8
+
+# Palabras que no aportan significado a la comparación de preguntas
+PALABRAS_VACIAS = frozenset([
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los', 'me', 'mi',
+    'para', 'por', 'que', 'se', 'un', 'una', 'unos', 'unas', 'y', 'o', 'es', 'quiero',
+    'puedes', 'podrias', 'favor', 'hola', 'the', 'an', 'and', 'in', 'of', 'to', 'for',
+    'i', 'my', 'please', 'want'
+])
+
+# Palabras que invierten el sentido de una pregunta
+PALABRAS_NEGACION = frozenset([
+    'no', 'ni', 'nunca', 'jamas', 'tampoco', 'sin', 'evitar', 'not', 'never', 'without', 'dont', 'avoid'
+])
+
+# Límites superiores (USD) de los rangos de presupuesto
+RANGOS_PRESUPUESTO = [(500, "bajo"), (1500, "medio"), (4000, "alto")]
+
+ClaveContexto = Tuple[Any, ...]
+
+
+def normalizar_pregunta(texto: str) -> str:
+    """Minúsculas, sin acentos, sin puntuación y con espacios simples"""
+    return normalizar(texto, sin_puntuacion=True)
+
+
+def tokens_significativos(pregunta_normalizada: str) -> FrozenSet[str]:
+    """Conjunto de palabras de la pregunta sin palabras vacías"""
+    return frozenset(t for t in pregunta_normalizada.split() if t not in PALABRAS_VACIAS)
+
+
+def tokens_criticos(pregunta_normalizada: str, tokens: FrozenSet[str]) -> FrozenSet[str]:
+    """
+    Partes de la pregunta que deben coincidir para reutilizar una respuesta parecida
+    
+    Args:
+        pregunta_normalizada: Pregunta normalizada con normalizar_pregunta()
+        tokens: Sus tokens significativos
+    
+    Returns:
+        Números, negaciones y destinos mencionados (estos con prefijo "@")
+    """
+    criticos = {t for t in tokens if t.isdigit() or t in PALABRAS_NEGACION}
+    criticos.update(f"@{d.nombre}|{d.pais}" for d in extraer_destinos(pregunta_normalizada))
+    return frozenset(criticos)
+
+
+def rango_presupuesto(presupuesto: Optional[str]) -> Optional[str]:
+    """Convierte un presupuesto ("2.000", "$1500") en un rango ("medio", "alto"...)"""
+    if not presupuesto:
+        return None
+    texto = str(presupuesto).strip().replace(',', '').replace('$', '')
+    try:
+        valor = float(texto)
+    except ValueError:
+        # Presupuesto descriptivo ("económico", "medio"): usar el texto normalizado
+        return normalizar_pregunta(texto)
+    for limite, nombre in RANGOS_PRESUPUESTO:
+        if valor < limite:
+            return nombre
+    return "lujo"
+
+
+def mes_de_fecha(fecha: Optional[str]) -> Optional[str]:
+    """Reduce una fecha ISO ("2025-06-15") a su mes ("2025-06"); otros formatos se normalizan"""
+    if not fecha:
+        return None
+    try:
+        return date.fromisoformat(fecha.strip()[:10]).strftime("%Y-%m")
+    except ValueError:
+        return normalizar_pregunta(fecha)
+
+
+class CacheRespuestas:
+    """Caché LRU de respuestas con coincidencia exacta y aproximada"""
+    
+    def __init__(
+        self,
+        activa: bool = RESPUESTAS_CACHE_ACTIVA,
+        ttl: float = RESPUESTAS_CACHE_TTL,
+        max_entradas: int = RESPUESTAS_CACHE_MAX_ENTRADAS,
+        similitud_minima: float = RESPUESTAS_CACHE_SIMILITUD
+    ):
+        """
+        Args:
+            activa: Si es False, la caché nunca devuelve ni guarda respuestas
+            ttl: Segundos de vida de cada respuesta
+            max_entradas: Número máximo de respuestas guardadas
+            similitud_minima: Similitud Jaccard mínima (0-1) para la coincidencia aproximada
+        """
+        self.activa = activa
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.similitud_minima = similitud_minima
+        # contexto -> {pregunta_normalizada: (expira_en, tokens, tokens_criticos, respuesta)}
+        self._por_contexto: Dict[ClaveContexto, Dict[str, Tuple[float, FrozenSet[str], FrozenSet[str], dict]]] = {}
+        # Orden LRU global de (contexto, pregunta_normalizada)
+        self._orden: "OrderedDict[Tuple[ClaveContexto, str], None]" = OrderedDict()
+        self.aciertos_exactos = 0
+        self.aciertos_aproximados = 0
+        self.fallos = 0
+        self.desalojos = 0
+    
+    @staticmethod
+    def clave_contexto(
+        contexto: Any,
+        modelo: str,
+        temperature: float,
+        destino_pregunta: Optional[str] = None
+    ) -> ClaveContexto:
+        """
+        Construye la clave canónica del contexto del formulario.
+        
+        Args:
+            contexto: Contexto del formulario (destino, fecha, presupuesto, preferencia) o None
+            modelo: Modelo de OpenAI
+            temperature: Temperature de la generación
+            destino_pregunta: Destino mencionado en la pregunta (si lo hay)
+            
+        Returns:
+            Tupla que identifica el contexto
+        """
+        destino = getattr(contexto, "destino", None)
+        preferencia = getattr(contexto, "preferencia", None)
+        return (
+            normalizar_pregunta(destino) if destino else None,
+            normalizar_pregunta(destino_pregunta) if destino_pregunta else None,
+            mes_de_fecha(getattr(contexto, "fecha", None)),
+            rango_presupuesto(getattr(contexto, "presupuesto", None)),
+            normalizar_pregunta(preferencia) if preferencia else None,
+            modelo,
+            round(temperature, 2)
+        )
+    
+    def buscar(self, pregunta: str, clave_contexto: ClaveContexto) -> Optional[dict]:
+        """
+        Busca una respuesta para la pregunta en el contexto dado.
+        
+        Args:
+            pregunta: Pregunta del usuario
+            clave_contexto: Clave obtenida con clave_contexto()
+            
+        Returns:
+            Respuesta guardada o None si no hay coincidencia
+        """
+        if not self.activa:
+            return None
+        
+        entradas = self._por_contexto.get(clave_contexto)
+        if not entradas:
+            self.fallos += 1
+            return None
+        
+        ahora = time.monotonic()
+        pregunta_norm = normalizar_pregunta(pregunta)
+        
+        # 1. Coincidencia exacta
+        entrada = entradas.get(pregunta_norm)
+        if entrada and entrada[0] > ahora:
+            self._orden.move_to_end((clave_contexto, pregunta_norm))
+            self.aciertos_exactos += 1
+            return entrada[3]
+        
+        # 2. Coincidencia aproximada dentro del mismo contexto
+        tokens = tokens_significativos(pregunta_norm)
+        criticos = tokens_criticos(pregunta_norm, tokens)
+        mejor, mejor_similitud = None, 0.0
+        for otra_pregunta, (expira_en, otros_tokens, otros_criticos, respuesta) in entradas.items():
+            if expira_en <= ahora or not tokens or not otros_tokens:
+                continue
+            if criticos != otros_criticos:
+                continue
+            similitud = len(tokens & otros_tokens) / len(tokens | otros_tokens)
+            if similitud > mejor_similitud:
+                mejor, mejor_similitud = (otra_pregunta, respuesta), similitud
+        
+        if mejor and mejor_similitud >= self.similitud_minima:
+            self._orden.move_to_end((clave_contexto, mejor[0]))
+            self.aciertos_aproximados += 1
+            return mejor[1]
+        
+        self.fallos += 1
+        return None
+    
+    def guardar(self, pregunta: str, clave_contexto: ClaveContexto, respuesta: dict):
+        """
+        Guarda una respuesta, desalojando las menos usadas si se supera el tamaño máximo.
+        
+        Args:
+            pregunta: Pregunta del usuario
+            clave_contexto: Clave obtenida con clave_contexto()
+            respuesta: Diccionario de respuesta a reutilizar
+        """
+        if not self.activa:
+            return
+        
+        pregunta_norm = normalizar_pregunta(pregunta)
+        entradas = self._por_contexto.setdefault(clave_contexto, {})
+        tokens = tokens_significativos(pregunta_norm)
+        entradas[pregunta_norm] = (
+            time.monotonic() + self.ttl,
+            tokens,
+            tokens_criticos(pregunta_norm, tokens),
+            respuesta
+        )
+        self._orden[(clave_contexto, pregunta_norm)] = None
+        self._orden.move_to_end((clave_contexto, pregunta_norm))
+        
+        while len(self._orden) > self.max_entradas:
+            (contexto_viejo, pregunta_vieja), _ = self._orden.popitem(last=False)
+            entradas_viejas = self._por_contexto.get(contexto_viejo, {})
+            entradas_viejas.pop(pregunta_vieja, None)
+            if not entradas_viejas:
+                self._por_contexto.pop(contexto_viejo, None)
+            self.desalojos += 1
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Contadores de uso de la caché"""
+        return {
+            "entradas": len(self._orden),
+            "max_entradas": self.max_entradas,
+            "aciertos_exactos": self.aciertos_exactos,
+            "aciertos_aproximados": self.aciertos_aproximados,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos
+        }
+
+
+# Caché global de respuestas
+cache_respuestas = CacheRespuestas()
@@ -0,0 +1,292 @@
+"""
+Circuit breakers para los servicios externos (OpenWeatherMap, Unsplash, ExchangeRate API)
+
+Cada servicio tiene un circuito que mira sus últimas peticiones:
+
+- cerrado: las peticiones salen normalmente. Si en la ventana de las
+  últimas CIRCUITO_VENTANA peticiones la fracción de errores (timeouts,
+  fallos de conexión, 429 y 5xx) o de respuestas lentas supera su umbral,
+  el circuito se abre. Una petición que quien llama cancela (por su propio
+  timeout o por el plazo de la consulta) después de CIRCUITO_LATENCIA_LENTA
+  segundos cuenta como lenta.
+- abierto: las peticiones fallan al instante con CircuitoAbierto, sin
+  esperar el timeout del servicio; quien llama usa la caché o responde sin
+  ese dato. Pasados CIRCUITO_ESPERA_APERTURA segundos pasa a semiabierto.
+- semiabierto: deja salir una petición de prueba a la vez. Si responde bien
+  y a tiempo el circuito se cierra; si no, vuelve a abrirse.
+
+El circuito también guarda las latencias recientes de las respuestas
+correctas, de las que sale el p95 que usan las peticiones cubiertas
+(hedged) de http_client.
+"""
+
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import httpx  # pyright: ignore[reportMissingImports]
+from logger_config import logger
+import metricas
+
+# Importar constantes de configuración
+try:
+    from config import (
+        CIRCUITO_VENTANA,
+        CIRCUITO_MIN_PETICIONES,
+        CIRCUITO_UMBRAL_ERRORES,
+        CIRCUITO_LATENCIA_LENTA,
+        CIRCUITO_UMBRAL_LENTAS,
+        CIRCUITO_ESPERA_APERTURA
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    CIRCUITO_VENTANA = 20
+    CIRCUITO_MIN_PETICIONES = 10
+    CIRCUITO_UMBRAL_ERRORES = 0.5
+    CIRCUITO_LATENCIA_LENTA = 2.0
+    CIRCUITO_UMBRAL_LENTAS = 0.8
+    CIRCUITO_ESPERA_APERTURA = 30
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+# Valor numérico de cada estado para /metrics
+_VALOR_ESTADO = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+
+# Latencias recientes que se guardan para calcular el p95
+_MUESTRAS_LATENCIA = 200
+
+
+class CircuitoAbierto(httpx.TransportError):
+    """
+    El circuito del servicio está abierto y la petición no se envió
+    
+    Hereda de httpx.TransportError para que quien ya maneja los fallos de
+    conexión de un servicio trate igual un circuito abierto.
+    """
+
+
+class Circuito:
+    """Circuit breaker de un servicio con ventana de las últimas peticiones"""
+    
+    def __init__(
+        self,
+        nombre: str,
+        ventana: int = CIRCUITO_VENTANA,
+        min_peticiones: int = CIRCUITO_MIN_PETICIONES,
+        umbral_errores: float = CIRCUITO_UMBRAL_ERRORES,
+        latencia_lenta: float = CIRCUITO_LATENCIA_LENTA,
+        umbral_lentas: float = CIRCUITO_UMBRAL_LENTAS,
+        espera_apertura: float = CIRCUITO_ESPERA_APERTURA
+    ):
+        """
+        Args:
+            nombre: Nombre del servicio
+            ventana: Últimas peticiones que se evalúan
+            min_peticiones: Peticiones en la ventana antes de poder abrir el circuito
+            umbral_errores: Fracción de errores que abre el circuito (0-1)
+            latencia_lenta: Segundos a partir de los que una respuesta cuenta como lenta
+            umbral_lentas: Fracción de respuestas lentas que abre el circuito (0-1)
+            espera_apertura: Segundos abierto antes de dejar pasar una prueba
+        """
+        self.nombre = nombre
+        self.min_peticiones = min_peticiones
+        self.umbral_errores = umbral_errores
+        self.latencia_lenta = latencia_lenta
+        self.umbral_lentas = umbral_lentas
+        self.espera_apertura = espera_apertura
+        self.estado = CERRADO
+        # Ventana de (error, lenta) con los totales llevados al día
+        self._ventana: Deque[Tuple[bool, bool]] = deque(maxlen=max(1, ventana))
+        self._errores = 0
+        self._lentas = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._latencias: Deque[float] = deque(maxlen=_MUESTRAS_LATENCIA)
+        self._p95: Optional[float] = None
+        self._p95_pendientes = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+    
+    def permitir(self) -> bool:
+        """
+        Comprueba si una petición puede salir (llamar justo antes de enviarla)
+        
+        Returns:
+            True si la petición es la prueba del circuito semiabierto
+            (hay que pasarlo a registrar() o cancelar())
+        
+        Raises:
+            CircuitoAbierto: Si el circuito está abierto o ya hay una prueba en curso
+        """
+        if self.estado == CERRADO:
+            return False
+        if self.estado == ABIERTO and time.monotonic() - self._abierto_desde >= self.espera_apertura:
+            self._cambiar_estado(SEMIABIERTO)
+        if self.estado == SEMIABIERTO and not self._prueba_en_curso:
+            self._prueba_en_curso = True
+            return True
+        self.rechazadas += 1
+        raise CircuitoAbierto(f"Circuito de {self.nombre} abierto")
+    
+    def registrar(self, latencia: float, error: bool, prueba: bool = False):
+        """
+        Registra el resultado de una petición que salió
+        
+        Args:
+            latencia: Segundos que tardó la petición
+            error: Si falló por timeout, conexión, 429 o 5xx
+            prueba: Lo que devolvió permitir() para esta petición
+        """
+        lenta = not error and latencia >= self.latencia_lenta
+        if not error:
+            self._latencias.append(latencia)
+            self._p95_pendientes += 1
+        self._registrar_resultado(error, lenta, prueba)
+    
+    def _registrar_resultado(self, error: bool, lenta: bool, prueba: bool):
+        """Cuenta un resultado en la ventana y abre o cierra el circuito"""
+        if prueba:
+            self._prueba_en_curso = False
+            if error or lenta:
+                self._abrir()
+            else:
+                self._cerrar()
+            return
+        if self.estado != CERRADO:
+            # Petición que salió antes de abrirse el circuito
+            return
+        
+        if len(self._ventana) == self._ventana.maxlen:
+            error_viejo, lenta_vieja = self._ventana[0]
+            self._errores -= error_viejo
+            self._lentas -= lenta_vieja
+        self._ventana.append((error, lenta))
+        self._errores += error
+        self._lentas += lenta
+        
+        total = len(self._ventana)
+        if total >= self.min_peticiones and (
+            self._errores / total >= self.umbral_errores or self._lentas / total >= self.umbral_lentas
+        ):
+            self._abrir()
+    
+    def cancelar(self, latencia: float, prueba: bool):
+        """
+        Registra una petición cancelada por quien llama antes de tener respuesta
+        
+        Quien llama suele cortar con su propio timeout (asyncio.wait_for) o con
+        el plazo de la consulta. Si la petición ya llevaba más de latencia_lenta
+        segundos, cuenta como lenta (no entra en el p95, que es de respuestas
+        reales). Si se canceló antes, no dice nada del servicio y solo se libera
+        la prueba.
+        
+        Args:
+            latencia: Segundos que llevaba la petición al cancelarse
+            prueba: Lo que devolvió permitir() para esta petición
+        """
+        if latencia >= self.latencia_lenta:
+            self._registrar_resultado(False, True, prueba)
+        elif prueba:
+            self._prueba_en_curso = False
+    
+    def p95(self, min_muestras: int = 20) -> Optional[float]:
+        """
+        Percentil 95 de la latencia de las respuestas correctas recientes
+        
+        Args:
+            min_muestras: Muestras necesarias para dar un valor
+        
+        Returns:
+            Segundos, o None si todavía no hay suficientes muestras
+        """
+        if len(self._latencias) < min_muestras:
+            return None
+        # Recalcular cada pocas muestras: ordenar 200 valores en cada petición no compensa
+        if self._p95 is None or self._p95_pendientes >= 10:
+            ordenadas = sorted(self._latencias)
+            self._p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+            self._p95_pendientes = 0
+        return self._p95
+    
+    def _abrir(self):
+        self._abierto_desde = time.monotonic()
+        self._prueba_en_curso = False
+        self.aperturas += 1
+        self._cambiar_estado(ABIERTO)
+        logger.warning(
+            f"Circuito de {self.nombre} abierto durante {self.espera_apertura:g}s "
+            f"({self._errores} errores y {self._lentas} lentas en {len(self._ventana)} peticiones)"
+        )
+    
+    def _cerrar(self):
+        self._ventana.clear()
+        self._errores = 0
+        self._lentas = 0
+        self._cambiar_estado(CERRADO)
+        logger.info(f"Circuito de {self.nombre} cerrado")
+    
+    def _cambiar_estado(self, estado: str):
+        self.estado = estado
+        for observador in _observadores:
+            observador()
+    
+    def estadisticas(self) -> Dict[str, float]:
+        """Estado y contadores del circuito"""
+        p95 = self.p95()
+        return {
+            "estado": self.estado,
+            "errores_ventana": self._errores,
+            "lentas_ventana": self._lentas,
+            "peticiones_ventana": len(self._ventana),
+            "aperturas": self.aperturas,
+            "rechazadas": self.rechazadas,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+# Circuitos por servicio y funciones a avisar cuando alguno cambia de estado
+_circuitos: Dict[str, Circuito] = {}
+_observadores: List[Callable[[], None]] = []
+
+
+def obtener_circuito(servicio: str, crear: bool = True) -> Optional[Circuito]:
+    """
+    Obtiene el circuito de un servicio
+    
+    El circuito se conserva aunque el cliente HTTP del servicio se vuelva a crear.
+    
+    Args:
+        servicio: Nombre del servicio
+        crear: Crearlo si no existe
+    
+    Returns:
+        Circuito del servicio (None si no existe y crear es False)
+    """
+    circuito = _circuitos.get(servicio)
+    if circuito is None and crear:
+        circuito = _circuitos[servicio] = Circuito(servicio)
+    return circuito
+
+
+def observar_circuitos(funcion: Callable[[], None]):
+    """Registra una función sin argumentos que se llama cada vez que un circuito cambia de estado"""
+    _observadores.append(funcion)
+
+
+def metricas_circuitos() -> List[metricas.FamiliaMetricas]:
+    """Estado y rechazos de los circuitos para /metrics"""
+    return [
+        ("viajeia_circuito_estado", "gauge",
+         "Estado del circuito de cada servicio (0 cerrado, 1 semiabierto, 2 abierto)",
+         [({"servicio": nombre}, _VALOR_ESTADO[c.estado]) for nombre, c in _circuitos.items()]),
+        ("viajeia_circuito_aperturas_total", "counter",
+         "Veces que se abrió el circuito de cada servicio",
+         [({"servicio": nombre}, c.aperturas) for nombre, c in _circuitos.items()]),
+        ("viajeia_circuito_rechazadas_total", "counter",
+         "Peticiones no enviadas por circuito abierto",
+         [({"servicio": nombre}, c.rechazadas) for nombre, c in _circuitos.items()])
+    ]
+
+
+metricas.registro.agregar_colector(metricas_circuitos)
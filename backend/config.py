@@ -85,3 +85,163 @@ RATE_LIMIT_ESTADISTICAS = int(os.getenv("RATE_LIMIT_ESTADISTICAS", "10"))  # Con
 # Valores más altos = más creativo, valores más bajos = más determinista
 AI_TEMPERATURE = float(os.getenv("AI_TEMPERATURE", "0.8"))
 
+
+# ============================================================================
+# CONTROL DE ADMISIÓN DE LLAMADAS A OPENAI
+# ============================================================================
+
+# Llamadas simultáneas a OpenAI por modelo; el resto espera en una cola acotada
+OPENAI_MAX_CONCURRENTES = int(os.getenv("OPENAI_MAX_CONCURRENTES", "8"))
+
+# Límites propios por modelo, con el formato "gpt-4=2,gpt-4-turbo=4"
+OPENAI_MAX_CONCURRENTES_MODELOS = {
+    modelo.strip(): int(limite)
+    for modelo, _, limite in (
+        par.partition("=") for par in os.getenv("OPENAI_MAX_CONCURRENTES_MODELOS", "").split(",") if "=" in par
+    )
+}
+
+OPENAI_MAX_COLA = int(os.getenv("OPENAI_MAX_COLA", "50"))  # Llamadas en espera por modelo antes de responder 503
+OPENAI_ESPERA_MAXIMA = float(os.getenv("OPENAI_ESPERA_MAXIMA", "20"))  # Segundos en cola antes de responder 503
+
+# ============================================================================
+# PLAZOS POR CONSULTA
+# ============================================================================
+
+# Tiempo máximo de cada endpoint, repartido entre clima, fotos y ChatGPT (al vencer responde 504)
+PLAZO_PLANIFICAR = float(os.getenv("PLAZO_PLANIFICAR", "90"))
+PLAZO_PLANIFICAR_STREAM = float(os.getenv("PLAZO_PLANIFICAR_STREAM", "180"))  # Incluye toda la generación
+
+PLAZO_MINIMO_OPCIONAL = float(os.getenv("PLAZO_MINIMO_OPCIONAL", "1"))  # Segundos mínimos para lanzar clima o fotos
+PLAZO_RESERVA_OPENAI = float(os.getenv("PLAZO_RESERVA_OPENAI", "15"))  # Segundos que el clima deja libres a ChatGPT
+PLAZO_MARGEN_TRANSPORTE = float(os.getenv("PLAZO_MARGEN_TRANSPORTE", "0.5"))  # Margen para que venza antes el timeout de httpx
+
+# ============================================================================
+# SERVICIOS EXTERNOS (CLIENTE HTTP)
+# ============================================================================
+
+# Timeouts en segundos por servicio externo
+OPENWEATHER_TIMEOUT = float(os.getenv("OPENWEATHER_TIMEOUT", "5"))
+UNSPLASH_TIMEOUT = float(os.getenv("UNSPLASH_TIMEOUT", "10"))
+EXCHANGERATE_TIMEOUT = float(os.getenv("EXCHANGERATE_TIMEOUT", "5"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))  # Respuesta completa (incluido el streaming)
+
+# Tamaño del pool de conexiones por servicio
+HTTP_MAX_CONEXIONES = int(os.getenv("HTTP_MAX_CONEXIONES", "50"))  # Conexiones simultáneas por host
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))  # Conexiones ociosas que se reutilizan
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # Segundos antes de cerrar una conexión ociosa
+
+# Circuit breakers por servicio externo: con muchos errores o respuestas lentas
+# en las últimas peticiones, se deja de llamar al servicio durante un tiempo
+CIRCUITO_VENTANA = int(os.getenv("CIRCUITO_VENTANA", "20"))  # Últimas peticiones que se evalúan
+CIRCUITO_MIN_PETICIONES = int(os.getenv("CIRCUITO_MIN_PETICIONES", "10"))  # Peticiones antes de poder abrirse
+CIRCUITO_UMBRAL_ERRORES = float(os.getenv("CIRCUITO_UMBRAL_ERRORES", "0.5"))  # Fracción de errores que lo abre
+CIRCUITO_LATENCIA_LENTA = float(os.getenv("CIRCUITO_LATENCIA_LENTA", "2"))  # Segundos que cuentan como lenta
+CIRCUITO_UMBRAL_LENTAS = float(os.getenv("CIRCUITO_UMBRAL_LENTAS", "0.8"))  # Fracción de lentas que lo abre
+CIRCUITO_ESPERA_APERTURA = float(os.getenv("CIRCUITO_ESPERA_APERTURA", "30"))  # Segundos abierto antes de probar
+
+# Peticiones cubiertas (hedged): si un GET tarda más que el p95 del servicio,
+# se lanza un segundo intento y se usa la primera respuesta.
+# Servicios separados por comas (ej: "openweather,exchangerate"); vacío lo desactiva
+HTTP_COBERTURA_SERVICIOS = [
+    servicio.strip() for servicio in os.getenv("HTTP_COBERTURA_SERVICIOS", "").split(",") if servicio.strip()
+]
+HTTP_COBERTURA_MIN_MUESTRAS = int(os.getenv("HTTP_COBERTURA_MIN_MUESTRAS", "20"))  # Respuestas antes de cubrir
+HTTP_COBERTURA_ESPERA_MINIMA = float(os.getenv("HTTP_COBERTURA_ESPERA_MINIMA", "0.05"))  # Segundos
+HTTP_COBERTURA_MAXIMA = float(os.getenv("HTTP_COBERTURA_MAXIMA", "0.1"))  # Fracción máxima de GETs con segundo intento
+
+# ============================================================================
+# SALUD DE LOS SERVICIOS EXTERNOS
+# ============================================================================
+
+# Sondas en segundo plano contra OpenAI y las APIs externas (/api/health solo lee el último resultado)
+SALUD_SONDAS_ACTIVAS = os.getenv("SALUD_SONDAS_ACTIVAS", "true").lower() in ("1", "true", "yes")
+SALUD_INTERVALO = float(os.getenv("SALUD_INTERVALO", "30"))  # Segundos entre sondas de cada servicio
+
+# Intervalos propios por servicio, con el formato "unsplash=300,openweather=120"
+# (cada sonda gasta una petición de la cuota del servicio)
+SALUD_INTERVALOS_SERVICIOS = {
+    servicio.strip(): float(intervalo)
+    for servicio, _, intervalo in (
+        par.partition("=")
+        for par in os.getenv("SALUD_INTERVALOS_SERVICIOS", "unsplash=300,openweather=120,exchangerate=300").split(",")
+        if "=" in par
+    )
+}
+
+SALUD_TIMEOUT = float(os.getenv("SALUD_TIMEOUT", "5"))  # Segundos máximos de cada sonda
+SALUD_FALLOS_CAIDO = int(os.getenv("SALUD_FALLOS_CAIDO", "3"))  # Fallos seguidos para dar un servicio por caído
+SALUD_LATENCIA_DEGRADADO = float(os.getenv("SALUD_LATENCIA_DEGRADADO", "2"))  # Segundos de sonda que cuentan como lento
+
+# ============================================================================
+# TIPOS DE CAMBIO
+# ============================================================================
+
+# Segundos entre refrescos de la tabla de tipos de cambio (por defecto: 1 hora)
+TIPO_CAMBIO_INTERVALO = float(os.getenv("TIPO_CAMBIO_INTERVALO", "3600"))
+
+# Archivo donde se guarda la última tabla descargada (vacío para desactivarlo)
+TIPO_CAMBIO_SNAPSHOT = os.getenv("TIPO_CAMBIO_SNAPSHOT", "tipos_cambio.json")
+
+# ============================================================================
+# CACHÉ DEL CLIMA
+# ============================================================================
+
+CLIMA_CACHE_TTL = float(os.getenv("CLIMA_CACHE_TTL", "600"))  # Segundos (10 minutos)
+CLIMA_CACHE_TTL_NEGATIVO = float(os.getenv("CLIMA_CACHE_TTL_NEGATIVO", "3600"))  # Ciudades no encontradas
+CLIMA_CACHE_MAX_ENTRADAS = int(os.getenv("CLIMA_CACHE_MAX_ENTRADAS", "512"))
+
+# ============================================================================
+# CACHÉ DE FOTOS (UNSPLASH)
+# ============================================================================
+
+FOTOS_CACHE_DB = os.getenv("FOTOS_CACHE_DB", "fotos_cache.sqlite3")  # Vacío para solo memoria
+FOTOS_CACHE_TTL = float(os.getenv("FOTOS_CACHE_TTL", str(7 * 24 * 3600)))  # Segundos (7 días)
+FOTOS_CALENTAR_TOP = int(os.getenv("FOTOS_CALENTAR_TOP", "10"))  # Destinos a precargar al iniciar
+
+# ============================================================================
+# CACHÉ DE RESPUESTAS DE CHATGPT
+# ============================================================================
+
+RESPUESTAS_CACHE_ACTIVA = os.getenv("RESPUESTAS_CACHE_ACTIVA", "true").lower() in ("1", "true", "yes")
+RESPUESTAS_CACHE_TTL = float(os.getenv("RESPUESTAS_CACHE_TTL", "3600"))  # Segundos (1 hora)
+RESPUESTAS_CACHE_MAX_ENTRADAS = int(os.getenv("RESPUESTAS_CACHE_MAX_ENTRADAS", "1000"))
+RESPUESTAS_CACHE_SIMILITUD = float(os.getenv("RESPUESTAS_CACHE_SIMILITUD", "0.8"))  # Jaccard mínima (0-1)
+
+# ============================================================================
+# CONVERSACIONES (SESIONES EN EL SERVIDOR)
+# ============================================================================
+
+SESIONES_DB = os.getenv("SESIONES_DB", "")  # Archivo SQLite para persistir las conversaciones (vacío para solo memoria)
+SESIONES_MAX = int(os.getenv("SESIONES_MAX", "1000"))  # Conversaciones activas en memoria (LRU)
+SESIONES_TTL = float(os.getenv("SESIONES_TTL", str(24 * 3600)))  # Segundos sin actividad antes de descartarla (1 día)
+SESIONES_TOKENS_VENTANA = int(os.getenv("SESIONES_TOKENS_VENTANA", "1500"))  # Tokens de historial enviados por turno
+
+# Resumen de los turnos que salen de la ventana (se genera en segundo plano)
+SESIONES_RESUMEN = os.getenv("SESIONES_RESUMEN", "true").lower() in ("1", "true", "yes")
+SESIONES_RESUMIR_DESDE = int(os.getenv("SESIONES_RESUMIR_DESDE", "1000"))  # Tokens fuera de la ventana antes de resumir
+SESIONES_RESUMEN_MAX_TOKENS = int(os.getenv("SESIONES_RESUMEN_MAX_TOKENS", "300"))
+
+# ============================================================================
+# ESTADÍSTICAS
+# ============================================================================
+
+STATS_EVENTOS_FILE = os.getenv("STATS_EVENTOS_FILE", "stats_eventos.jsonl")  # Log append-only de consultas
+STATS_FLUSH_INTERVALO = float(os.getenv("STATS_FLUSH_INTERVALO", "1"))  # Segundos entre escrituras del log
+STATS_COMPACTAR_CADA = int(os.getenv("STATS_COMPACTAR_CADA", "1000"))  # Eventos antes de compactar en stats.json
+
+# Precisión de HyperLogLog para usuarios únicos (error ~1.04/sqrt(2^precision))
+STATS_HLL_PRECISION = int(os.getenv("STATS_HLL_PRECISION", "14"))  # Total: 16 KB, ~0.8%
+STATS_HLL_PRECISION_DIA = int(os.getenv("STATS_HLL_PRECISION_DIA", "12"))  # Por día: 4 KB, ~1.6%
+
+# Backend: "memoria" (un solo proceso) o "sqlite" (compartido entre workers/instancias)
+STATS_BACKEND = os.getenv("STATS_BACKEND", "memoria")
+STATS_DB = os.getenv("STATS_DB", "stats.sqlite3")  # Base SQLite compartida (STATS_BACKEND=sqlite)
+
+# ============================================================================
+# DESTINOS
+# ============================================================================
+
+# Volcado opcional de GeoNames (p. ej. cities15000.txt) para ampliar el diccionario incluido
+DESTINOS_GEONAMES = os.getenv("DESTINOS_GEONAMES", "")
+DESTINOS_POBLACION_MINIMA = int(os.getenv("DESTINOS_POBLACION_MINIMA", "15000"))  # Ciudades de GeoNames a incluir
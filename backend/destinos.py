@@ -0,0 +1,272 @@
+"""
+Resolución de destinos a partir de texto
+
+Los destinos salen de un diccionario geográfico offline (data/destinos.tsv)
+con nombre, alias en español e inglés, país ISO, coordenadas y zona horaria. Opcionalmente
+se puede ampliar con un volcado de GeoNames (por ejemplo cities15000.txt,
+unas 25.000 ciudades) indicado en DESTINOS_GEONAMES.
+
+Los alias se indexan en un trie de palabras: la búsqueda recorre la pregunta
+una sola vez, devuelve la coincidencia más larga en cada posición y solo
+acepta palabras completas ("roma" no coincide dentro de "romántico"). El
+costo depende del largo del texto, no del tamaño del diccionario.
+"""
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from logger_config import logger
+from normalizacion import normalizar
+
+# Importar constantes de configuración
+try:
+    from config import DESTINOS_GEONAMES, DESTINOS_POBLACION_MINIMA
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    DESTINOS_GEONAMES = ""
+    DESTINOS_POBLACION_MINIMA = 15000
+
+RUTA_DESTINOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "destinos.tsv")
+
+# Palabras comunes en español o inglés que también son nombres de ciudades en
+# GeoNames (Sur, Este, Tours, Normal...). No se indexan como alias de una palabra.
+PALABRAS_AMBIGUAS = frozenset([
+    'como', 'este', 'sur', 'norte', 'mayo', 'once', 'media', 'sale', 'most',
+    'best', 'tours', 'nice', 'normal', 'mobile', 'reading', 'bath', 'hope',
+    'deal', 'orange', 'temple', 'liberty', 'independence', 'union', 'victoria',
+    'florida', 'esperanza', 'libertad', 'progreso', 'independencia', 'paraiso',
+    'carmen', 'dolores', 'soledad', 'trinidad', 'providencia', 'guadalupe',
+    'concepcion', 'merced', 'rosario', 'colonia', 'granja', 'palma', 'playa',
+    'plaza', 'centro', 'puerto', 'santa', 'nueva', 'nuevo', 'real', 'bar',
+    'mar', 'paz', 'luz', 'vida', 'alta', 'todos', 'santos', 'marina', 'golf',
+    'ocean', 'beach', 'city', 'hotel', 'aurora', 'eagle', 'split', 'leer'
+])
+
+# Palabras que suelen preceder al destino del viaje ("vuelo de Madrid a París")
+PALABRAS_ANTES_DEL_DESTINO = frozenset([
+    'a', 'en', 'hacia', 'para', 'visitar', 'conocer', 'recorrer',
+    'to', 'in', 'visit', 'visiting'
+])
+
+# Clave del nodo del trie que guarda el destino (ninguna palabra es una cadena vacía)
+_FIN = ""
+
+
+class Destino(NamedTuple):
+    """Ciudad o lugar del diccionario geográfico"""
+    nombre: str
+    pais: str  # Código ISO 3166-1 alfa-2
+    latitud: float
+    longitud: float
+    poblacion: int
+    zona_horaria: str = ""  # Zona IANA; vacía si es la del país
+
+
+class IndiceDestinos:
+    """Trie de palabras sobre los alias normalizados de los destinos"""
+    
+    def __init__(self):
+        self._raiz: Dict = {}
+        self._por_alias: Dict[str, Destino] = {}
+        self._alias_fijos: Set[str] = set()
+    
+    def __len__(self) -> int:
+        return len(self._por_alias)
+    
+    def agregar(self, destino: Destino, alias: Iterable[str] = (), fijo: bool = True):
+        """
+        Indexa un destino con su nombre y sus alias
+        
+        Si un alias ya existe gana el destino con más población, salvo que el
+        existente sea fijo (del diccionario incluido con la aplicación).
+        
+        Args:
+            destino: Destino a indexar
+            alias: Otros nombres del destino (en otros idiomas, sin acentos...)
+            fijo: Si el destino viene del diccionario incluido (tiene prioridad)
+        """
+        for texto in (destino.nombre, *alias):
+            clave = normalizar(texto, sin_puntuacion=True)
+            if not clave:
+                continue
+            actual = self._por_alias.get(clave)
+            if actual is not None and (clave in self._alias_fijos or actual.poblacion >= destino.poblacion):
+                continue
+            self._por_alias[clave] = destino
+            if fijo:
+                self._alias_fijos.add(clave)
+            nodo = self._raiz
+            for palabra in clave.split():
+                nodo = nodo.setdefault(palabra, {})
+            nodo[_FIN] = destino
+    
+    def coincidencias(self, palabras: List[str]) -> List[Tuple[int, int, Destino]]:
+        """
+        Busca destinos en una lista de palabras normalizadas
+        
+        Args:
+            palabras: Palabras del texto normalizado
+        
+        Returns:
+            Lista de (inicio, fin, destino) con la coincidencia más larga en
+            cada posición, sin solaparse y en orden de aparición
+        """
+        encontrados = []
+        i = 0
+        total = len(palabras)
+        while i < total:
+            nodo = self._raiz
+            mejor = None
+            j = i
+            while j < total:
+                nodo = nodo.get(palabras[j])
+                if nodo is None:
+                    break
+                j += 1
+                destino = nodo.get(_FIN)
+                if destino is not None:
+                    mejor = (j, destino)
+            if mejor is None:
+                i += 1
+            else:
+                encontrados.append((i, mejor[0], mejor[1]))
+                i = mejor[0]
+        return encontrados
+    
+    def buscar_exacto(self, nombre: str) -> Optional[Destino]:
+        """
+        Busca un destino por su nombre o alias completo
+        
+        Args:
+            nombre: Nombre del destino ("Nueva York", "new york", "NYC")
+        
+        Returns:
+            Destino o None si no está en el diccionario
+        """
+        return self._por_alias.get(normalizar(nombre, sin_puntuacion=True))
+
+
+def cargar_destinos_incluidos(indice: IndiceDestinos, ruta: str = RUTA_DESTINOS):
+    """
+    Carga el diccionario geográfico incluido con la aplicación
+    
+    Args:
+        indice: Índice donde agregar los destinos
+        ruta: Archivo TSV (nombre, país, latitud, longitud, población, alias separados por '|', zona horaria)
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            if not linea.strip() or linea.startswith('#'):
+                continue
+            nombre, pais, latitud, longitud, poblacion, alias, zona = linea.rstrip('\n').split('\t')
+            destino = Destino(nombre, pais, float(latitud), float(longitud), int(poblacion), zona)
+            indice.agregar(destino, [a for a in alias.split('|') if a])
+
+
+def cargar_geonames(indice: IndiceDestinos, ruta: str, poblacion_minima: int = DESTINOS_POBLACION_MINIMA) -> int:
+    """
+    Agrega las ciudades de un volcado de GeoNames (formato de cities15000.txt)
+    
+    Solo se usan el nombre y el nombre ASCII; los nombres alternativos de
+    GeoNames incluyen demasiadas palabras comunes en otros idiomas.
+    
+    Args:
+        indice: Índice donde agregar las ciudades
+        ruta: Archivo de GeoNames (columnas separadas por tabuladores)
+        poblacion_minima: Población mínima para incluir una ciudad
+    
+    Returns:
+        Número de ciudades agregadas
+    """
+    agregadas = 0
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            campos = linea.rstrip('\n').split('\t')
+            if len(campos) < 15:
+                continue
+            poblacion = int(campos[14] or 0)
+            if poblacion < poblacion_minima:
+                continue
+            nombres = [
+                n for n in dict.fromkeys([campos[1], campos[2]])
+                if len(n) >= 4 and normalizar(n, sin_puntuacion=True) not in PALABRAS_AMBIGUAS
+            ]
+            if not nombres:
+                continue
+            zona = campos[17] if len(campos) > 17 else ""
+            destino = Destino(nombres[0], campos[8], float(campos[4]), float(campos[5]), poblacion, zona)
+            indice.agregar(destino, nombres[1:], fijo=False)
+            agregadas += 1
+    return agregadas
+
+
+def crear_indice_destinos() -> IndiceDestinos:
+    """Crea el índice con el diccionario incluido y, si está configurado, GeoNames"""
+    indice = IndiceDestinos()
+    cargar_destinos_incluidos(indice)
+    if DESTINOS_GEONAMES:
+        try:
+            agregadas = cargar_geonames(indice, DESTINOS_GEONAMES)
+            logger.info(f"Diccionario geográfico ampliado con {agregadas} ciudades de {DESTINOS_GEONAMES}")
+        except (IOError, ValueError) as e:
+            logger.warning(f"No se pudo cargar GeoNames desde {DESTINOS_GEONAMES}: {e}")
+    return indice
+
+
+# Índice global de destinos
+indice_destinos = crear_indice_destinos()
+
+
+def extraer_destinos(texto: str) -> List[Destino]:
+    """
+    Encuentra todos los destinos mencionados en un texto
+    
+    Args:
+        texto: Texto libre (por ejemplo, la pregunta del usuario)
+    
+    Returns:
+        Destinos en orden de aparición
+    """
+    if not texto:
+        return []
+    palabras = normalizar(texto, sin_puntuacion=True).split()
+    return [destino for _, _, destino in indice_destinos.coincidencias(palabras)]
+
+
+def extraer_destino(texto: str) -> Optional[Destino]:
+    """
+    Obtiene el destino principal de un texto
+    
+    Si hay varios, se prefiere el que va precedido de "a", "en", "to"...
+    ("vuelo de Madrid a París" -> París); si no, el primero que aparece.
+    
+    Args:
+        texto: Texto libre (por ejemplo, la pregunta del usuario)
+    
+    Returns:
+        Destino o None si no se menciona ninguno
+    """
+    if not texto:
+        return None
+    palabras = normalizar(texto, sin_puntuacion=True).split()
+    encontrados = indice_destinos.coincidencias(palabras)
+    if not encontrados:
+        return None
+    for inicio, _, destino in encontrados:
+        if inicio > 0 and palabras[inicio - 1] in PALABRAS_ANTES_DEL_DESTINO:
+            return destino
+    return encontrados[0][2]
+
+
+def resolver_destino(nombre: str) -> Optional[Destino]:
+    """
+    Resuelve el nombre de un destino (por ejemplo, el del formulario)
+    
+    Args:
+        nombre: Nombre escrito por el usuario ("nueva york", "Paris, Francia")
+    
+    Returns:
+        Destino o None si no está en el diccionario
+    """
+    if not nombre:
+        return None
+    return indice_destinos.buscar_exacto(nombre) or extraer_destino(nombre)
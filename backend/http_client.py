@@ -0,0 +1,260 @@
+"""
+Cliente HTTP compartido para los servicios externos de ViajeIA
+
+Mantiene un pool de conexiones por servicio (OpenWeatherMap, Unsplash y
+ExchangeRate API) para reutilizar conexiones TCP/TLS entre peticiones.
+Los clientes se crean al iniciar la aplicación y se cierran al apagarla.
+
+Todas las peticiones pasan por el circuit breaker de su servicio (circuito.py),
+así que con el servicio caído fallan al instante en lugar de esperar el timeout.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx  # pyright: ignore[reportMissingImports]
+from logger_config import logger
+from circuito import obtener_circuito
+from metricas import ERRORES_EXTERNOS, PETICIONES_CUBIERTAS, codigo_error
+
+# Importar constantes de configuración
+try:
+    from config import (
+        OPENWEATHER_TIMEOUT,
+        UNSPLASH_TIMEOUT,
+        EXCHANGERATE_TIMEOUT,
+        HTTP_MAX_CONEXIONES,
+        HTTP_MAX_KEEPALIVE,
+        HTTP_KEEPALIVE_EXPIRY,
+        HTTP_COBERTURA_SERVICIOS,
+        HTTP_COBERTURA_MIN_MUESTRAS,
+        HTTP_COBERTURA_ESPERA_MINIMA,
+        HTTP_COBERTURA_MAXIMA
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    OPENWEATHER_TIMEOUT = 5.0
+    UNSPLASH_TIMEOUT = 10.0
+    EXCHANGERATE_TIMEOUT = 5.0
+    HTTP_MAX_CONEXIONES = 50
+    HTTP_MAX_KEEPALIVE = 20
+    HTTP_KEEPALIVE_EXPIRY = 30.0
+    HTTP_COBERTURA_SERVICIOS = []
+    HTTP_COBERTURA_MIN_MUESTRAS = 20
+    HTTP_COBERTURA_ESPERA_MINIMA = 0.05
+    HTTP_COBERTURA_MAXIMA = 0.1
+
+# HTTP/2 requiere el paquete opcional 'h2' (httpx[http2])
+try:
+    import h2  # noqa: F401  # pyright: ignore[reportMissingImports]
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+# Configuración de cada servicio externo
+# http2: se negocia vía ALPN, si el servidor no lo soporta se usa HTTP/1.1
+SERVICIOS_HTTP = {
+    "openweather": {
+        "base_url": "https://api.openweathermap.org",
+        "timeout": OPENWEATHER_TIMEOUT,
+        "http2": False,
+    },
+    "unsplash": {
+        "base_url": "https://api.unsplash.com",
+        "timeout": UNSPLASH_TIMEOUT,
+        "http2": True,
+    },
+    "exchangerate": {
+        "base_url": "https://api.exchangerate-api.com",
+        "timeout": EXCHANGERATE_TIMEOUT,
+        "http2": True,
+    },
+}
+
+# Clientes activos por servicio
+_clientes: Dict[str, httpx.AsyncClient] = {}
+
+
+class _TransporteServicio(httpx.AsyncHTTPTransport):
+    """
+    Transporte de un servicio externo con circuit breaker y peticiones cubiertas
+    
+    - Si el circuito del servicio está abierto, la petición falla al instante
+      con CircuitoAbierto (un httpx.TransportError) sin salir.
+    - Con cobertura activa, un GET que tarda más que el p95 del servicio
+      lanza un segundo intento y se usa la primera respuesta que llegue.
+    - Cuenta los errores del servicio (estados >= 400, timeouts y fallos de conexión).
+    """
+    
+    def __init__(self, servicio: str, cubrir: bool = False, **kwargs):
+        """
+        Args:
+            servicio: Nombre del servicio (clave de SERVICIOS_HTTP)
+            cubrir: Si los GET llevan un segundo intento al pasar el p95
+            **kwargs: Argumentos de httpx.AsyncHTTPTransport (limits, http2...)
+        """
+        super().__init__(**kwargs)
+        self.servicio = servicio
+        self.circuito = obtener_circuito(servicio)
+        self.cubrir = cubrir
+        self._peticiones_get = 0
+        self._cubiertas = 0
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        prueba = self.circuito.permitir()
+        inicio = time.perf_counter()
+        try:
+            if self.cubrir and not prueba and request.method == "GET":
+                response = await self._enviar_cubierta(request)
+            else:
+                response = await super().handle_async_request(request)
+        except httpx.TransportError as e:
+            ERRORES_EXTERNOS.incrementar(self.servicio, codigo_error(e))
+            self.circuito.registrar(time.perf_counter() - inicio, True, prueba)
+            raise
+        except BaseException:
+            # Cancelada por quien llama: cuenta como lenta si ya pasó de latencia_lenta
+            self.circuito.cancelar(time.perf_counter() - inicio, prueba)
+            raise
+        if response.status_code >= 400:
+            ERRORES_EXTERNOS.incrementar(self.servicio, str(response.status_code))
+        # 404 (ciudad no encontrada) o 401 no son fallos del servicio; 429 y 5xx sí
+        error = response.status_code == 429 or response.status_code >= 500
+        self.circuito.registrar(time.perf_counter() - inicio, error, prueba)
+        return response
+    
+    def _espera_cobertura(self) -> Optional[float]:
+        """Segundos antes del segundo intento, o None si este GET no se cubre"""
+        p95 = self.circuito.p95(HTTP_COBERTURA_MIN_MUESTRAS)
+        if p95 is None:
+            return None
+        # Con el servicio lento todas las peticiones pasarían el p95: acotar la carga extra
+        if self._cubiertas >= HTTP_COBERTURA_MAXIMA * self._peticiones_get:
+            return None
+        return max(p95, HTTP_COBERTURA_ESPERA_MINIMA)
+    
+    async def _enviar_cubierta(self, request: httpx.Request) -> httpx.Response:
+        """Envía un GET y, si no responde antes del p95, lanza un segundo intento"""
+        enviar = super().handle_async_request
+        self._peticiones_get += 1
+        if self._peticiones_get >= 1000:
+            # Que la proporción refleje el tráfico reciente
+            self._peticiones_get //= 2
+            self._cubiertas //= 2
+        
+        espera = self._espera_cobertura()
+        if espera is None:
+            return await enviar(request)
+        
+        primero = asyncio.create_task(enviar(request))
+        try:
+            await asyncio.wait({primero}, timeout=espera)
+        except asyncio.CancelledError:
+            primero.cancel()
+            raise
+        if primero.done():
+            return primero.result()
+        
+        self._cubiertas += 1
+        segundo = asyncio.create_task(enviar(request))
+        response, ganadora = await self._primera_respuesta([primero, segundo])
+        PETICIONES_CUBIERTAS.incrementar(self.servicio, "primero" if ganadora is primero else "segundo")
+        return response
+    
+    @staticmethod
+    async def _primera_respuesta(tareas: List[asyncio.Task]) -> Tuple[httpx.Response, asyncio.Task]:
+        """
+        Espera la primera respuesta de varios intentos y cancela (o cierra) el resto
+        
+        Returns:
+            (respuesta, tarea que la obtuvo)
+        
+        Raises:
+            httpx.TransportError: Si fallaron todos los intentos (el error del primero que falló)
+        """
+        pendientes = set(tareas)
+        response, ganadora, error = None, None, None
+        try:
+            while pendientes and response is None:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas:
+                    if tarea.exception() is not None:
+                        error = error or tarea.exception()
+                    elif response is None:
+                        response, ganadora = tarea.result(), tarea
+                    else:
+                        # Llegaron las dos a la vez: liberar la conexión de la que sobra
+                        await tarea.result().aclose()
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+        if response is None:
+            raise error
+        return response, ganadora
+
+
+def _crear_cliente(servicio: str) -> httpx.AsyncClient:
+    """
+    Crea el cliente HTTP de un servicio con su pool de conexiones
+    
+    Args:
+        servicio: Nombre del servicio (clave de SERVICIOS_HTTP)
+        
+    Returns:
+        Cliente asíncrono configurado
+    """
+    config = SERVICIOS_HTTP[servicio]
+    limites = httpx.Limits(
+        max_connections=HTTP_MAX_CONEXIONES,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(
+        base_url=config["base_url"],
+        timeout=httpx.Timeout(config["timeout"]),
+        transport=_TransporteServicio(
+            servicio,
+            cubrir=servicio in HTTP_COBERTURA_SERVICIOS,
+            limits=limites,
+            http2=config["http2"] and HTTP2_DISPONIBLE
+        )
+    )
+
+
+async def iniciar_clientes_http():
+    """Crea los clientes HTTP de todos los servicios (se llama al iniciar la aplicación)"""
+    for servicio in SERVICIOS_HTTP:
+        if servicio not in _clientes:
+            _clientes[servicio] = _crear_cliente(servicio)
+    logger.info(
+        f"Clientes HTTP iniciados: {', '.join(_clientes)} "
+        f"(HTTP/2 {'disponible' if HTTP2_DISPONIBLE else 'no disponible'})"
+    )
+
+
+async def cerrar_clientes_http():
+    """Cierra los clientes HTTP y sus conexiones (se llama al apagar la aplicación)"""
+    while _clientes:
+        _, cliente = _clientes.popitem()
+        await cliente.aclose()
+    logger.info("Clientes HTTP cerrados")
+
+
+def obtener_cliente_http(servicio: str) -> httpx.AsyncClient:
+    """
+    Obtiene el cliente HTTP compartido de un servicio
+    
+    Si la aplicación no inició los clientes (por ejemplo, en un script),
+    el cliente se crea bajo demanda.
+    
+    Args:
+        servicio: Nombre del servicio ('openweather', 'unsplash' o 'exchangerate')
+        
+    Returns:
+        Cliente asíncrono del servicio
+    """
+    cliente = _clientes.get(servicio)
+    if cliente is None or cliente.is_closed:
+        cliente = _crear_cliente(servicio)
+        _clientes[servicio] = cliente
+    return cliente
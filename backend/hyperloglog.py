@@ -0,0 +1,109 @@
+"""
+Estimador de cardinalidad HyperLogLog
+
+Cuenta elementos distintos (por ejemplo, usuarios únicos) con memoria fija:
+2^precision registros de 1 byte, sin importar cuántos elementos se agreguen.
+
+El error relativo típico (desviación estándar) es 1.04 / sqrt(2^precision):
+- precision 12 ->  4 KB, ~1.63%
+- precision 14 -> 16 KB, ~0.81%
+- precision 16 -> 64 KB, ~0.41%
+"""
+
+import base64
+import hashlib
+import math
+from typing import Optional
+
+# Tabla de 2^-k para acelerar la estimación
+_POTENCIAS_INVERSAS = [2.0 ** -k for k in range(65)]
+
+
+class HyperLogLog:
+    """Contador aproximado de elementos distintos con registros de tamaño fijo"""
+    
+    def __init__(self, precision: int = 14, registros: Optional[bytes] = None):
+        """
+        Args:
+            precision: Bits del hash usados para elegir el registro (4-18)
+            registros: Registros previos (para restaurar desde un snapshot)
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("La precisión de HyperLogLog debe estar entre 4 y 18")
+        self.precision = precision
+        self.m = 1 << precision
+        if registros is not None and len(registros) != self.m:
+            raise ValueError(
+                f"El tamaño de los registros ({len(registros)}) no coincide con la precisión {precision}"
+            )
+        self.registros = bytearray(registros) if registros is not None else bytearray(self.m)
+    
+    @property
+    def error_relativo(self) -> float:
+        """Error relativo típico (una desviación estándar) de la estimación"""
+        return 1.04 / math.sqrt(self.m)
+    
+    def agregar(self, valor: str):
+        """
+        Agrega un elemento al conjunto
+        
+        Args:
+            valor: Elemento a contar (por ejemplo, un ID de usuario)
+        """
+        x = int.from_bytes(hashlib.blake2b(valor.encode('utf-8'), digest_size=8).digest(), 'big')
+        bits_restantes = 64 - self.precision
+        indice = x >> bits_restantes
+        resto = x & ((1 << bits_restantes) - 1)
+        # Posición del primer bit a 1 en los bits restantes (1 = el bit más significativo)
+        rango = bits_restantes - resto.bit_length() + 1
+        if rango > self.registros[indice]:
+            self.registros[indice] = rango
+    
+    def estimar(self) -> int:
+        """
+        Estima cuántos elementos distintos se han agregado
+        
+        Returns:
+            Número estimado de elementos distintos
+        """
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        suma = sum(map(_POTENCIAS_INVERSAS.__getitem__, self.registros))
+        estimacion = alpha * m * m / suma
+        
+        # Corrección para cardinalidades pequeñas (conteo lineal)
+        if estimacion <= 2.5 * m:
+            vacios = self.registros.count(0)
+            if vacios:
+                estimacion = m * math.log(m / vacios)
+        
+        return int(round(estimacion))
+    
+    def fusionar(self, otro: "HyperLogLog"):
+        """
+        Une otro HyperLogLog de la misma precisión a este (unión de conjuntos)
+        
+        Args:
+            otro: HyperLogLog a fusionar
+        """
+        if otro.precision != self.precision:
+            raise ValueError("Solo se pueden fusionar HyperLogLog con la misma precisión")
+        self.registros = bytearray(map(max, self.registros, otro.registros))
+    
+    def a_texto(self) -> str:
+        """Serializa los registros en base64 (para guardarlos en JSON)"""
+        return base64.b64encode(bytes(self.registros)).decode('ascii')
+    
+    @classmethod
+    def desde_texto(cls, texto: str, precision: int) -> "HyperLogLog":
+        """
+        Restaura un HyperLogLog serializado con a_texto()
+        
+        Args:
+            texto: Registros en base64
+            precision: Precisión con la que se creó
+            
+        Returns:
+            HyperLogLog restaurado
+        """
+        return cls(precision, base64.b64decode(texto))
@@ -0,0 +1,214 @@
+"""
+Límite de peticiones y tokens por minuto para las llamadas a OpenAI
+
+OpenAI limita cada modelo en peticiones por minuto (RPM) y tokens por minuto
+(TPM). Este módulo lleva esas cuentas del lado del cliente con dos cubos de
+tokens (token bucket) por modelo, para quedarse justo por debajo de los
+límites en vez de recibir errores 429.
+
+- Cada llamada reserva 1 petición y `tokens del prompt + max_tokens` antes de
+  salir; al terminar se devuelve la diferencia con los tokens realmente usados.
+- Si no hay presupuesto, la llamada espera lo justo para que se recargue. Las
+  reservas se descuentan en orden de llegada (el cubo puede quedar en negativo
+  y cada llamada espera a que se recupere su parte), así una llamada grande no
+  queda relegada por muchas pequeñas.
+- Si la espera supera la máxima permitida, se rechaza de inmediato con
+  ServicioSaturado (la API responde 503 con Retry-After).
+- La reserva se hace antes de ocupar un hueco de la cola del modelo
+  (planificador.py), así una llamada que espera presupuesto no bloquea a
+  las demás. Si después no consigue hueco, se devuelve con liberar().
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, Optional, Tuple
+from planificador import ServicioSaturado
+
+
+class CuboTokens:
+    """Cubo de tokens que se recarga de forma continua hasta su capacidad"""
+    
+    def __init__(self, capacidad: float, por_minuto: float):
+        """
+        Args:
+            capacidad: Máximo acumulable (ráfaga permitida)
+            por_minuto: Recarga por minuto
+        """
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60
+        self.nivel = capacidad
+        self._actualizado = time.monotonic()
+    
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.nivel = min(self.capacidad, self.nivel + (ahora - self._actualizado) * self.por_segundo)
+        self._actualizado = ahora
+    
+    def disponible(self) -> float:
+        """Cantidad disponible ahora (negativa si hay reservas pendientes de recargar)"""
+        self._recargar()
+        return self.nivel
+    
+    def espera_para(self, cantidad: float) -> float:
+        """Segundos hasta que haya `cantidad` disponible (0 si ya la hay)"""
+        self._recargar()
+        if self.nivel >= cantidad:
+            return 0.0
+        return (cantidad - self.nivel) / self.por_segundo
+    
+    def consumir(self, cantidad: float):
+        """Descuenta `cantidad` (el nivel puede quedar en negativo)"""
+        self._recargar()
+        self.nivel -= cantidad
+    
+    def devolver(self, cantidad: float):
+        """Devuelve `cantidad` sin superar la capacidad"""
+        self._recargar()
+        self.nivel = min(self.capacidad, self.nivel + cantidad)
+
+
+class ReservaTokens:
+    """Presupuesto reservado por una llamada, pendiente de ajustar con el uso real"""
+    
+    def __init__(self, modelo: str, tokens: int):
+        self.modelo = modelo
+        self.tokens = tokens
+        self.ajustada = False
+
+
+class _PresupuestoModelo:
+    """Cubos de peticiones y tokens por minuto de un modelo y sus contadores"""
+    
+    def __init__(self, rpm: int, tpm: int):
+        self.peticiones = CuboTokens(rpm, rpm)
+        self.tokens = CuboTokens(tpm, tpm)
+        self.reservas = 0
+        self.esperas = 0
+        self.rechazadas = 0
+        self.tokens_devueltos = 0
+
+
+class LimitadorTokens:
+    """Presupuesto de RPM y TPM por modelo para las llamadas a OpenAI"""
+    
+    def __init__(self, limites: Dict[str, Tuple[int, int]], margen: float = 1.0):
+        """
+        Args:
+            limites: Modelo -> (peticiones por minuto, tokens por minuto)
+            margen: Fracción de los límites que se usa (ej: 0.9 = quedarse al 90%)
+        """
+        self._presupuestos: Dict[str, _PresupuestoModelo] = {
+            modelo: _PresupuestoModelo(max(1, int(rpm * margen)), max(1, int(tpm * margen)))
+            for modelo, (rpm, tpm) in limites.items()
+        }
+    
+    async def reservar(self, modelo: str, tokens: int, espera_maxima: Optional[float] = None) -> ReservaTokens:
+        """
+        Reserva una petición y `tokens` tokens, esperando si hace falta
+        
+        Args:
+            modelo: Modelo de OpenAI (sin límites configurados no se limita)
+            tokens: Tokens estimados del prompt más max_tokens de la respuesta
+            espera_maxima: Segundos máximos de espera (None = sin límite)
+        
+        Returns:
+            Reserva para ajustar con el uso real (ver ajustar())
+        
+        Raises:
+            ServicioSaturado: Si la espera superaría espera_maxima o la llamada no cabe en un minuto
+        """
+        reserva = ReservaTokens(modelo, tokens)
+        presupuesto = self._presupuestos.get(modelo)
+        if presupuesto is None:
+            return reserva
+        
+        if tokens > presupuesto.tokens.capacidad:
+            presupuesto.rechazadas += 1
+            raise ServicioSaturado(
+                f"La llamada a {modelo} ({tokens} tokens) supera el límite por minuto "
+                f"({int(presupuesto.tokens.capacidad)} tokens)",
+                60
+            )
+        
+        espera = max(presupuesto.peticiones.espera_para(1), presupuesto.tokens.espera_para(tokens))
+        if espera_maxima is not None and espera > espera_maxima:
+            presupuesto.rechazadas += 1
+            raise ServicioSaturado(
+                f"Sin presupuesto de RPM/TPM para {modelo} durante {espera:.1f}s (máximo {espera_maxima:.1f}s)",
+                max(1, math.ceil(espera))
+            )
+        
+        presupuesto.peticiones.consumir(1)
+        presupuesto.tokens.consumir(tokens)
+        presupuesto.reservas += 1
+        if espera > 0:
+            presupuesto.esperas += 1
+            try:
+                await asyncio.sleep(espera)
+            except asyncio.CancelledError:
+                # La llamada no llegó a salir: devolver todo lo reservado
+                self.liberar(reserva)
+                raise
+        return reserva
+    
+    def liberar(self, reserva: ReservaTokens):
+        """
+        Devuelve la petición y los tokens de una llamada que no llegó a salir
+        
+        No tiene efecto si la reserva ya se ajustó con ajustar().
+        
+        Args:
+            reserva: Reserva obtenida con reservar()
+        """
+        if reserva.ajustada:
+            return
+        reserva.ajustada = True
+        presupuesto = self._presupuestos.get(reserva.modelo)
+        if presupuesto is None:
+            return
+        presupuesto.peticiones.devolver(1)
+        presupuesto.tokens.devolver(reserva.tokens)
+    
+    def ajustar(self, reserva: ReservaTokens, tokens_usados: Optional[int]):
+        """
+        Devuelve la diferencia entre los tokens reservados y los usados
+        
+        Si se usaron más de los reservados, se descuenta el exceso. Solo tiene
+        efecto la primera vez que se llama para cada reserva.
+        
+        Args:
+            reserva: Reserva obtenida con reservar()
+            tokens_usados: Tokens reales (response.usage.total_tokens) o estimados;
+                           None deja la reserva completa
+        """
+        if reserva.ajustada:
+            return
+        reserva.ajustada = True
+        presupuesto = self._presupuestos.get(reserva.modelo)
+        if presupuesto is None or tokens_usados is None:
+            return
+        diferencia = reserva.tokens - tokens_usados
+        if diferencia > 0:
+            presupuesto.tokens.devolver(diferencia)
+            presupuesto.tokens_devueltos += diferencia
+        elif diferencia < 0:
+            presupuesto.tokens.consumir(-diferencia)
+    
+    def estadisticas(self) -> Dict[str, Dict[str, float]]:
+        """Presupuesto disponible y contadores por modelo (solo modelos ya usados)"""
+        estadisticas = {}
+        for modelo, presupuesto in self._presupuestos.items():
+            if not presupuesto.reservas and not presupuesto.rechazadas:
+                continue
+            estadisticas[modelo] = {
+                "rpm_disponibles": int(presupuesto.peticiones.disponible()),
+                "rpm_limite": int(presupuesto.peticiones.capacidad),
+                "tpm_disponibles": int(presupuesto.tokens.disponible()),
+                "tpm_limite": int(presupuesto.tokens.capacidad),
+                "reservas": presupuesto.reservas,
+                "esperas": presupuesto.esperas,
+                "rechazadas": presupuesto.rechazadas,
+                "tokens_devueltos": presupuesto.tokens_devueltos
+            }
+        return estadisticas
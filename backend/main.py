@@ -1,19 +1,45 @@
 from fastapi import FastAPI, HTTPException, Request  # pyright: ignore[reportMissingImports]
 from fastapi.middleware.cors import CORSMiddleware  # pyright: ignore[reportMissingImports]
 from pydantic import BaseModel  # pyright: ignore[reportMissingImports]
-from typing import Optional, Tuple, List, Dict
+from fastapi.concurrency import run_in_threadpool  # pyright: ignore[reportMissingImports]
+from fastapi.responses import PlainTextResponse, StreamingResponse  # pyright: ignore[reportMissingImports]
+from typing import Optional, Tuple, List, Dict, AsyncIterator, Awaitable, Callable
+import json
 import os
-import requests  # pyright: ignore[reportMissingImports]
+import hashlib
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
-from openai import OpenAI  # pyright: ignore[reportMissingImports]
+from openai import AsyncOpenAI  # pyright: ignore[reportMissingImports]
 from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
-from stats import registrar_consulta, obtener_estadisticas
+from stats import registrar_consulta, obtener_estadisticas, iniciar_estadisticas, detener_estadisticas
 from security import validar_pregunta, sanitizar_texto
 from rate_limiter import setup_rate_limiter, rate_limit_planificar, rate_limit_estadisticas
 from logger_config import logger
+from http_client import iniciar_clientes_http, cerrar_clientes_http, obtener_cliente_http
+from tipo_cambio import almacen_tipos_cambio
+from cache import CacheTTL, obtener_estadisticas_caches
+from cache_fotos import cache_fotos
+from cache_respuestas import cache_respuestas
 from prompt_filter import validar_prompt, sanitizar_prompt
+from normalizacion import normalizar
+from destinos import Destino, extraer_destino, resolver_destino
+from paises import obtener_moneda, zona_horaria, desfase_utc
+from agrupador import AgrupadorLlamadas
+from planificador import PlanificadorLlamadas, ServicioSaturado, PRIORIDAD_INTERACTIVA, PRIORIDAD_SEGUNDO_PLANO
+from limitador_tokens import LimitadorTokens
+from sesiones import Conversacion, almacen_sesiones
+from prompts import PromptSistema, prompt_sistema
+from salud import monitor_salud
+from plazos import Plazo, PlazoAgotado, ClienteDesconectado, ejecutar_con_plazo
+import metricas
+from metricas import LATENCIA_ETAPAS, ERRORES_EXTERNOS, PROMPTS_RECHAZADOS, TOKENS_USADOS, codigo_error
 from openai_config import (
+    MODEL_RATE_LIMITS,
+    OPENAI_MARGEN_LIMITES,
     obtener_configuracion_openai,
+    obtener_contador_tokens,
     limitar_historial_por_tokens,
     validar_configuracion,
     estimar_tokens_mensajes,
@@ -22,16 +48,80 @@ from openai_config import (
 
 # Importar constantes de configuración
 try:
-    from config import SYSTEM_PROMPT, AI_TEMPERATURE
+    from config import (
+        AI_TEMPERATURE,
+        CLIMA_CACHE_TTL,
+        CLIMA_CACHE_TTL_NEGATIVO,
+        CLIMA_CACHE_MAX_ENTRADAS,
+        FOTOS_CALENTAR_TOP,
+        OPENAI_TIMEOUT,
+        OPENAI_MAX_CONCURRENTES,
+        OPENAI_MAX_CONCURRENTES_MODELOS,
+        OPENAI_MAX_COLA,
+        OPENAI_ESPERA_MAXIMA,
+        SESIONES_RESUMEN_MAX_TOKENS,
+        SALUD_SONDAS_ACTIVAS,
+        OPENWEATHER_TIMEOUT,
+        UNSPLASH_TIMEOUT,
+        PLAZO_PLANIFICAR,
+        PLAZO_PLANIFICAR_STREAM,
+        PLAZO_RESERVA_OPENAI
+    )
 except ImportError:
     # Valores por defecto si config.py no está disponible
-    SYSTEM_PROMPT = None  # Se usará el prompt hardcodeado
     AI_TEMPERATURE = 0.8
+    CLIMA_CACHE_TTL = 600
+    CLIMA_CACHE_TTL_NEGATIVO = 3600
+    CLIMA_CACHE_MAX_ENTRADAS = 512
+    FOTOS_CALENTAR_TOP = 10
+    OPENAI_TIMEOUT = 120
+    OPENAI_MAX_CONCURRENTES = 8
+    OPENAI_MAX_CONCURRENTES_MODELOS = {}
+    OPENAI_MAX_COLA = 50
+    OPENAI_ESPERA_MAXIMA = 20
+    SESIONES_RESUMEN_MAX_TOKENS = 300
+    SALUD_SONDAS_ACTIVAS = True
+    OPENWEATHER_TIMEOUT = 5.0
+    UNSPLASH_TIMEOUT = 10.0
+    PLAZO_PLANIFICAR = 90
+    PLAZO_PLANIFICAR_STREAM = 180
+    PLAZO_RESERVA_OPENAI = 15
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
-app = FastAPI(title="ViajeIA API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los recursos compartidos al iniciar y los libera al apagar"""
+    await run_in_threadpool(iniciar_estadisticas)
+    await iniciar_clientes_http()
+    await almacen_tipos_cambio.iniciar()
+    await run_in_threadpool(cache_fotos.abrir)
+    await run_in_threadpool(almacen_sesiones.abrir)
+    # Cargar el tokenizer ahora y no en la primera consulta
+    contador = await run_in_threadpool(obtener_contador_tokens)
+    logger.info(f"Contador de tokens: {contador.nombre}")
+    # Contar ya los tokens del system prompt base
+    prompt = prompt_sistema(modelo=obtener_configuracion_openai()["modelo"])
+    logger.info(f"System prompt base: {prompt.tokens} tokens (hash {prompt.hash})")
+    tarea_calentar = asyncio.create_task(calentar_cache_fotos())
+    registrar_sondas_salud()
+    monitor_salud.iniciar(SALUD_SONDAS_ACTIVAS)
+    yield
+    await monitor_salud.detener()
+    tarea_calentar.cancel()
+    cancelar_tareas(tareas_resumen)
+    await asyncio.gather(tarea_calentar, *tareas_resumen, return_exceptions=True)
+    await almacen_tipos_cambio.detener()
+    cache_fotos.cerrar()
+    almacen_sesiones.cerrar()
+    await cerrar_clientes_http()
+    await run_in_threadpool(detener_estadisticas)
+    await client.close()
+
+
+app = FastAPI(title="ViajeIA API", version="1.0.0", lifespan=lifespan)
 
 # Configurar rate limiting
 setup_rate_limiter(app)
@@ -44,7 +134,25 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("Por favor, configura OPENAI_API_KEY en tu archivo .env")
 
-client = OpenAI(api_key=openai_api_key)
+# Cliente asíncrono: la llamada al modelo no bloquea el event loop
+client = AsyncOpenAI(api_key=openai_api_key)
+
+# Las peticiones concurrentes con el mismo prompt comparten una sola llamada a OpenAI
+agrupador_openai = AgrupadorLlamadas("openai")
+
+# Control de admisión: llamadas simultáneas por modelo y cola de espera acotada
+planificador_openai = PlanificadorLlamadas(
+    "openai",
+    max_concurrentes=OPENAI_MAX_CONCURRENTES,
+    max_cola=OPENAI_MAX_COLA,
+    limites_por_modelo=OPENAI_MAX_CONCURRENTES_MODELOS
+)
+
+# Presupuesto de peticiones y tokens por minuto de cada modelo (evita los 429 de OpenAI)
+limitador_openai = LimitadorTokens(MODEL_RATE_LIMITS, margen=OPENAI_MARGEN_LIMITES)
+
+# Resúmenes de conversaciones en curso (se cancelan al apagar)
+tareas_resumen = set()
 
 # API Key de OpenWeatherMap (opcional, no bloquea el inicio si no está)
 openweather_api_key = os.getenv("OPENWEATHER_API_KEY")
@@ -52,6 +160,14 @@ openweather_api_key = os.getenv("OPENWEATHER_API_KEY")
 # API Key de Unsplash (opcional, no bloquea el inicio si no está)
 unsplash_api_key = os.getenv("UNSPLASH_API_KEY")
 
+# Caché del clima por ciudad (las ciudades no encontradas también se recuerdan)
+cache_clima = CacheTTL(
+    "clima",
+    max_entradas=CLIMA_CACHE_MAX_ENTRADAS,
+    ttl=CLIMA_CACHE_TTL,
+    ttl_negativo=CLIMA_CACHE_TTL_NEGATIVO
+)
+
 # Configurar CORS para permitir peticiones del frontend
 # En producción, permitir el origen del frontend desplegado
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
@@ -73,6 +189,8 @@ class ContextoFormulario(BaseModel):
 class PreguntaRequest(BaseModel):
     pregunta: str
     contexto: Optional[ContextoFormulario] = None
+    usar_cache: Optional[bool] = True  # False para forzar una respuesta nueva de ChatGPT
+    conversacion_id: Optional[str] = None  # Conversación a continuar (devuelta por la respuesta anterior)
 
 
 class InfoDestino(BaseModel):
@@ -89,6 +207,7 @@ class RespuestaResponse(BaseModel):
     info_destino: Optional[InfoDestino] = None
     respuesta_cortada: Optional[bool] = False  # Indica si la respuesta se cortó por límite de tokens
     tokens_usados: Optional[int] = None  # Tokens usados en la respuesta
+    conversacion_id: Optional[str] = None  # Enviarlo en la próxima pregunta para continuar la conversación
 
 
 @app.get("/")
@@ -96,34 +215,109 @@ async def root():
     return {"message": "ViajeIA API está funcionando"}
 
 
+def sonda_http(servicio: str, url: str, **kwargs) -> Callable[[], Awaitable[None]]:
+    """
+    Crea la sonda de salud de un servicio externo
+    
+    Args:
+        servicio: Nombre del servicio en http_client
+        url: Ruta a consultar con GET
+        **kwargs: Parámetros adicionales del GET (params, headers)
+        
+    Returns:
+        Corrutina que falla si el servicio no responde 200
+    """
+    async def sonda():
+        response = await obtener_cliente_http(servicio).get(url, **kwargs)
+        if response.status_code != 200:
+            # No incluir la URL en el error: puede llevar la API key como parámetro
+            raise RuntimeError(f"{servicio} respondió con estado {response.status_code}")
+    return sonda
+
+
+async def sonda_openai():
+    """Consulta el modelo configurado (no gasta tokens)"""
+    await client.models.retrieve(obtener_configuracion_openai()["modelo"])
+
+
+def registrar_sondas_salud():
+    """Registra en el monitor de salud la sonda de cada servicio (sin API key no se sondea)"""
+    monitor_salud.registrar("openai", sonda_openai if openai_api_key else None, critico=True)
+    monitor_salud.registrar("openweather", sonda_http(
+        "openweather",
+        "/data/2.5/weather",
+        params={"lat": 0, "lon": 0, "appid": openweather_api_key}
+    ) if openweather_api_key else None)
+    monitor_salud.registrar("unsplash", sonda_http(
+        "unsplash",
+        "/photos",
+        headers={"Authorization": f"Client-ID {unsplash_api_key}"},
+        params={"per_page": 1}
+    ) if unsplash_api_key else None)
+    monitor_salud.registrar("exchangerate", sonda_http("exchangerate", "/v4/latest/USD"))
+
+
 @app.get("/api/health")
 async def health_check():
     """
     Endpoint de monitoreo de salud de la API
     
-    Retorna el estado de la API y sus dependencias principales.
+    Retorna el estado de la API y sus dependencias principales, según las
+    últimas sondas en segundo plano (no hace peticiones externas).
     Útil para sistemas de monitoreo, load balancers y health checks.
     """
+    salud = monitor_salud.resumen()
     health_status = {
-        "status": "healthy",
+        "status": salud["status"],
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "version": "1.0.0",
-        "services": {
-            "api": "operational",
-            "openai": "operational" if openai_api_key else "not_configured",
-            "openweather": "operational" if openweather_api_key else "not_configured",
-            "unsplash": "operational" if unsplash_api_key else "not_configured"
+        "services": salud["services"],
+        "dependencias": salud["dependencias"],
+        "caches": {
+            **obtener_estadisticas_caches(),
+            "fotos": cache_fotos.estadisticas(),
+            "respuestas": cache_respuestas.estadisticas(),
+            "agrupacion_openai": agrupador_openai.estadisticas(),
+            "conversaciones": almacen_sesiones.estadisticas()
+        },
+        "colas": {
+            "openai": planificador_openai.estadisticas(),
+            "presupuesto_openai": limitador_openai.estadisticas()
         }
     }
     
-    # Determinar estado general
-    if not openai_api_key:
-        health_status["status"] = "degraded"
-        health_status["message"] = "OpenAI API key no configurada"
+    if salud["motivo"]:
+        health_status["message"] = salud["motivo"]
     
     return health_status
 
 
+@app.get("/api/health/live")
+async def liveness_check():
+    """
+    Liveness: el proceso está vivo y el event loop responde
+    
+    No depende de ningún servicio externo; si falla, hay que reiniciar la instancia.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """
+    Readiness: la instancia puede recibir consultas
+    
+    Responde 503 mientras la API inicia, hasta la primera sonda de OpenAI y
+    mientras OpenAI esté caído. Los servicios opcionales (clima, fotos, tipos
+    de cambio) no la sacan del balanceador: sin ellos las respuestas solo
+    llegan con menos información.
+    """
+    listo, motivo = monitor_salud.listo()
+    if not listo:
+        raise HTTPException(status_code=503, detail=motivo)
+    return {"status": "ready"}
+
+
 @app.get("/api/estadisticas")
 @rate_limit_estadisticas()
 async def obtener_estadisticas_endpoint(request: Request):
@@ -132,7 +326,8 @@ async def obtener_estadisticas_endpoint(request: Request):
     """
     try:
         logger.info("Solicitud de estadísticas recibida")
-        stats = obtener_estadisticas()
+        # Con STATS_BACKEND=sqlite la lectura es E/S bloqueante: fuera del event loop
+        stats = await run_in_threadpool(obtener_estadisticas)
         return stats
     except Exception as e:
         # Log el error completo
@@ -145,77 +340,352 @@ async def obtener_estadisticas_endpoint(request: Request):
         )
 
 
-@app.post("/api/planificar", response_model=RespuestaResponse)
-@rate_limit_planificar()
-async def planificar_viaje(request: Request, pregunta_request: PreguntaRequest):
+def metricas_colas_y_caches() -> List[metricas.FamiliaMetricas]:
+    """Métricas de las cachés y de la cola de OpenAI, leídas de sus propios contadores"""
+    caches = {
+        **obtener_estadisticas_caches(),
+        "fotos": cache_fotos.estadisticas(),
+        "respuestas": cache_respuestas.estadisticas()
+    }
+    aciertos = [
+        ({"cache": nombre}, e.get("aciertos", e.get("aciertos_exactos", 0) + e.get("aciertos_aproximados", 0)))
+        for nombre, e in caches.items()
+    ]
+    agrupacion = agrupador_openai.estadisticas()
+    aciertos.append(({"cache": "agrupacion_openai"}, agrupacion["agrupadas"]))
+    colas = planificador_openai.estadisticas()
+    return [
+        ("viajeia_cache_aciertos_total", "counter", "Aciertos de cada caché",
+         aciertos),
+        ("viajeia_cache_fallos_total", "counter", "Fallos de cada caché",
+         [({"cache": nombre}, e["fallos"]) for nombre, e in caches.items()]
+         + [({"cache": "agrupacion_openai"}, agrupacion["llamadas"])]),
+        ("viajeia_cache_entradas", "gauge", "Entradas guardadas en cada caché",
+         [({"cache": nombre}, e["entradas"]) for nombre, e in caches.items()]),
+        ("viajeia_openai_en_curso", "gauge", "Llamadas a OpenAI en curso por modelo",
+         [({"modelo": modelo}, c["en_curso"]) for modelo, c in colas.items()]),
+        ("viajeia_openai_en_cola", "gauge", "Llamadas a OpenAI esperando turno por modelo",
+         [({"modelo": modelo}, c["en_cola"]) for modelo, c in colas.items()]),
+        ("viajeia_openai_rechazadas_total", "counter", "Llamadas a OpenAI rechazadas por saturación por modelo",
+         [({"modelo": modelo}, c["rechazadas"] + c["vencidas"]) for modelo, c in colas.items()])
+    ]
+
+
+metricas.registro.agregar_colector(metricas_colas_y_caches)
+
+
+@app.get("/metrics")
+async def metricas_endpoint():
     """
-    Endpoint para procesar preguntas sobre planificación de viajes usando ChatGPT
+    Métricas en formato de texto de Prometheus
+    
+    Incluye la latencia de cada etapa de las consultas, los errores de los
+    servicios externos, las preguntas rechazadas, los tokens usados por
+    modelo y los contadores de las cachés y de la cola de OpenAI.
     """
-    try:
-        # Validar formato básico de la pregunta
-        es_valida, error_msg, pregunta_sanitizada = validar_pregunta(pregunta_request.pregunta)
-        if not es_valida:
-            logger.warning(f"Pregunta inválida rechazada (formato): {error_msg}")
-            raise HTTPException(status_code=400, detail=error_msg)
-        
-        # Validar que el prompt sea seguro y sobre viajes
-        es_seguro, error_seguridad, palabras_peligrosas = validar_prompt(pregunta_sanitizada)
-        if not es_seguro:
-            logger.warning(
-                f"Prompt peligroso o fuera de contexto rechazado: {error_seguridad}. "
-                f"Palabras detectadas: {palabras_peligrosas if palabras_peligrosas else 'N/A'}"
-            )
-            raise HTTPException(status_code=400, detail=error_seguridad)
-        
-        # Sanitizar adicionalmente el prompt
-        pregunta = sanitizar_prompt(pregunta_sanitizada)
-        contexto = pregunta_request.contexto
-        
-        logger.info(f"Nueva consulta recibida (validada): {pregunta[:50]}...")
+    return PlainTextResponse(
+        metricas.registro.exportar(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
+async def preparar_consulta(
+    pregunta_request: PreguntaRequest
+) -> Tuple[str, Optional[ContextoFormulario], Optional[str]]:
+    """
+    Valida y sanitiza la pregunta, detecta el destino y registra la consulta en estadísticas.
+    
+    Args:
+        pregunta_request: Cuerpo de la petición
         
-        # Obtener el destino (del contexto del formulario o intentar extraerlo de la pregunta)
-        destino = None
-        if contexto and contexto.destino:
-            destino = contexto.destino
-        else:
-            # Intentar extraer el destino de la pregunta (básico)
-            # Esto se puede mejorar con NLP más sofisticado
-            destino = extraer_destino_de_pregunta(pregunta)
+    Returns:
+        Tupla (pregunta_sanitizada, contexto, destino)
         
-        # Registrar consulta en estadísticas (sin bloquear la respuesta)
-        try:
+    Raises:
+        HTTPException: 400 si la pregunta no es válida o no es segura
+    """
+    # Validar formato básico de la pregunta
+    with LATENCIA_ETAPAS.medir("validacion"):
+        es_valida, error_msg, pregunta_sanitizada = validar_pregunta(pregunta_request.pregunta)
+    if not es_valida:
+        logger.warning(f"Pregunta inválida rechazada (formato): {error_msg}")
+        PROMPTS_RECHAZADOS.incrementar("formato")
+        raise HTTPException(status_code=400, detail=error_msg)
+    
+    # Validar que el prompt sea seguro y sobre viajes, y sanitizarlo adicionalmente
+    with LATENCIA_ETAPAS.medir("filtro_prompt"):
+        es_seguro, error_seguridad, palabras_peligrosas = validar_prompt(pregunta_sanitizada)
+        pregunta = sanitizar_prompt(pregunta_sanitizada) if es_seguro else None
+    if not es_seguro:
+        logger.warning(
+            f"Prompt peligroso o fuera de contexto rechazado: {error_seguridad}. "
+            f"Palabras detectadas: {palabras_peligrosas if palabras_peligrosas else 'N/A'}"
+        )
+        PROMPTS_RECHAZADOS.incrementar("palabras_peligrosas" if palabras_peligrosas else "fuera_de_contexto")
+        raise HTTPException(status_code=400, detail=error_seguridad)
+    contexto = pregunta_request.contexto
+    
+    logger.info(f"Nueva consulta recibida (validada): {pregunta[:50]}...")
+    
+    # Obtener el destino (del contexto del formulario o intentar extraerlo de la pregunta)
+    destino = None
+    if contexto and contexto.destino:
+        destino = contexto.destino
+    else:
+        # Buscar el destino en la pregunta (diccionario geográfico)
+        destino_encontrado = extraer_destino(pregunta)
+        destino = destino_encontrado.nombre if destino_encontrado else None
+    
+    # Registrar consulta en estadísticas (en memoria, el log se escribe en segundo plano)
+    try:
+        with LATENCIA_ETAPAS.medir("estadisticas"):
             registrar_consulta(
                 usuario_id=None,  # Se generará automáticamente
                 destino=destino,
                 pregunta=pregunta
             )
-        except Exception as e:
-            # No fallar si hay error en estadísticas
-            print(f"Error al registrar estadísticas: {e}")
+    except Exception as e:
+        # No fallar si hay error en estadísticas
+        print(f"Error al registrar estadísticas: {e}")
+    
+    return pregunta, contexto, destino
+
+
+def verificar_capacidad_openai(plazo: Optional[Plazo] = None):
+    """
+    Rechaza la consulta antes de empezar si OpenAI no la atendería a tiempo
+    
+    Args:
+        plazo: Plazo de la consulta (la espera en la cola no puede superar lo que queda)
+    
+    Raises:
+        ServicioSaturado: Si la cola del modelo está llena o la espera estimada es excesiva
+    """
+    planificador_openai.verificar_admision(
+        obtener_configuracion_openai()["modelo"],
+        PRIORIDAD_INTERACTIVA,
+        espera_maxima=plazo.limitar(OPENAI_ESPERA_MAXIMA) if plazo else OPENAI_ESPERA_MAXIMA
+    )
+
+
+def error_servicio_saturado(error: ServicioSaturado) -> HTTPException:
+    """503 con Retry-After para una consulta rechazada por el control de admisión"""
+    logger.warning(f"Consulta rechazada por saturación de OpenAI: {error}")
+    return HTTPException(
+        status_code=503,
+        detail="Hay demasiadas consultas en este momento. Por favor intenta de nuevo en unos segundos.",
+        headers={"Retry-After": str(error.reintentar_en)}
+    )
+
+
+def error_plazo_agotado(error: PlazoAgotado) -> HTTPException:
+    """504 para una consulta que superó su plazo"""
+    logger.warning(f"Consulta cancelada por plazo agotado: {error}")
+    return HTTPException(
+        status_code=504,
+        detail="La consulta tardó demasiado. Por favor intenta de nuevo en unos momentos."
+    )
+
+
+def iniciar_enriquecimiento(destino: Optional[str], plazo: Plazo) -> Dict[str, Optional[asyncio.Task]]:
+    """
+    Lanza en paralelo las consultas de clima y fotos del destino.
+    
+    Las dos son opcionales: se acotan con lo que queda del plazo y, si no
+    terminan a tiempo, la tarea devuelve None. El clima va antes de ChatGPT,
+    así que además deja libres PLAZO_RESERVA_OPENAI segundos para el modelo.
+    
+    Args:
+        destino: Nombre del destino (si es None no se lanza nada)
+        plazo: Plazo de la consulta
         
-        # Obtener información del clima si hay un destino
-        info_clima = None
-        if destino and openweather_api_key:
-            info_clima = obtener_clima_actual(destino)
+    Returns:
+        Diccionario con las tareas 'clima' y 'fotos' (None si no aplica)
+    """
+    tareas = {"clima": None, "fotos": None}
+    if destino and openweather_api_key:
+        tareas["clima"] = asyncio.create_task(plazo.opcional(
+            lambda: LATENCIA_ETAPAS.medir_corrutina(obtener_clima_actual(destino), "clima"),
+            "clima",
+            OPENWEATHER_TIMEOUT,
+            reserva=PLAZO_RESERVA_OPENAI
+        ))
+    if destino and unsplash_api_key:
+        tareas["fotos"] = asyncio.create_task(plazo.opcional(
+            lambda: LATENCIA_ETAPAS.medir_corrutina(obtener_fotos_unsplash(destino, cantidad=3), "fotos"),
+            "fotos",
+            UNSPLASH_TIMEOUT
+        ))
+    return tareas
+
+
+def cancelar_tareas(tareas):
+    """Cancela las tareas que sigan pendientes (error o cliente desconectado)"""
+    for tarea in tareas:
+        if tarea and not tarea.done():
+            tarea.cancel()
+
+
+async def abrir_conversacion(conversacion_id: Optional[str]) -> Conversacion:
+    """
+    Recupera la conversación indicada por el cliente o crea una nueva.
+    
+    Args:
+        conversacion_id: Identificador devuelto en un turno anterior (opcional)
         
-        # Obtener fotos del destino si está disponible
-        fotos = None
-        if destino and unsplash_api_key:
-            fotos = obtener_fotos_unsplash(destino, cantidad=3)
+    Returns:
+        La conversación (nueva si el identificador no existe o venció)
+    """
+    conversacion = None
+    if conversacion_id:
+        # Puede leer de SQLite si la conversación ya no está en memoria
+        conversacion = await run_in_threadpool(almacen_sesiones.obtener, conversacion_id)
+        if conversacion is None:
+            logger.info("Conversación no encontrada o vencida, se empieza una nueva")
+    return conversacion or almacen_sesiones.crear()
+
+
+async def registrar_turno(conversacion: Conversacion, pregunta: str, respuesta: str):
+    """
+    Agrega el turno a la conversación, lo guarda y, si hace falta, lanza su resumen.
+    
+    Args:
+        conversacion: Conversación en curso
+        pregunta: Pregunta del usuario (ya sanitizada)
+        respuesta: Respuesta completa generada
+    """
+    cambios = almacen_sesiones.agregar_turno(conversacion, pregunta, respuesta)
+    await run_in_threadpool(almacen_sesiones.guardar, cambios)
+    
+    if almacen_sesiones.necesita_resumen(conversacion):
+        conversacion.resumiendo = True
+        tarea = asyncio.create_task(resumir_conversacion(conversacion))
+        tareas_resumen.add(tarea)
+        tarea.add_done_callback(tareas_resumen.discard)
+
+
+async def resumir_conversacion(conversacion: Conversacion):
+    """
+    Condensa en el resumen de la conversación los mensajes que salieron de la ventana.
+    
+    Se ejecuta en segundo plano con prioridad baja en la cola de OpenAI; si
+    falla, los mensajes quedan pendientes y se reintenta en el próximo turno.
+    """
+    try:
+        pendientes, hasta_orden = conversacion.pendientes_resumen()
+        transcripcion = "\n\n".join(
+            f"{'Viajero' if mensaje['role'] == 'user' else 'ViajeIA'}: {mensaje['content']}"
+            for mensaje in pendientes
+        )
+        resumen_anterior = f"Resumen anterior:\n{conversacion.resumen}\n\n" if conversacion.resumen else ""
+        mensajes = [
+            {
+                "role": "system",
+                "content": "Resume la conversación entre un viajero y ViajeIA, un asistente de viajes, "
+                           "en un solo párrafo en español. Conserva destinos, fechas, presupuesto, "
+                           "preferencias y decisiones ya tomadas; omite saludos y detalles repetidos."
+            },
+            {"role": "user", "content": f"{resumen_anterior}Conversación:\n{transcripcion}"}
+        ]
         
-        # Obtener información completa del destino (temperatura, moneda, zona horaria)
+        resultado = await llamar_openai(
+            mensajes,
+            obtener_configuracion_openai()["modelo"],
+            SESIONES_RESUMEN_MAX_TOKENS,
+            PRIORIDAD_SEGUNDO_PLANO
+        )
+        if resultado["respuesta"]:
+            cambios = almacen_sesiones.aplicar_resumen(conversacion, resultado["respuesta"].strip(), hasta_orden)
+            await run_in_threadpool(almacen_sesiones.guardar, cambios)
+            logger.info(f"Conversación resumida ({len(pendientes)} mensajes)")
+    except Exception as e:
+        logger.warning(f"No se pudo resumir la conversación, se reintentará en el próximo turno: {e}")
+    finally:
+        conversacion.resumiendo = False
+
+
+async def atender_consulta(pregunta_request: PreguntaRequest, plazo: Plazo) -> RespuestaResponse:
+    """
+    Atiende una consulta de /api/planificar dentro de su plazo
+    
+    Args:
+        pregunta_request: Cuerpo de la petición
+        plazo: Plazo de la consulta, repartido entre clima, fotos y ChatGPT
+        
+    Returns:
+        Respuesta completa de la consulta
+    """
+    pregunta, contexto, destino = await preparar_consulta(pregunta_request)
+    verificar_capacidad_openai(plazo)
+    conversacion = await abrir_conversacion(pregunta_request.conversacion_id)
+    
+    # Lanzar en paralelo el clima y las fotos
+    tareas = iniciar_enriquecimiento(destino, plazo)
+    tarea_respuesta = None
+    try:
+        # El prompt solo depende del clima: en cuanto está listo, arranca ChatGPT
+        info_clima = await tareas["clima"] if tareas["clima"] else None
+        tarea_respuesta = asyncio.create_task(
+            generar_respuesta_con_chatgpt(
+                pregunta,
+                contexto,
+                info_clima,
+                usar_cache=pregunta_request.usar_cache,
+                conversacion=conversacion,
+                plazo=plazo
+            )
+        )
+        
+        # Mientras el modelo responde, completar la información del destino
         info_destino = None
         if destino:
-            info_destino = obtener_info_destino(destino, info_clima)
-        
-        # Llamar a ChatGPT para obtener la respuesta
-        respuesta = generar_respuesta_con_chatgpt(pregunta, contexto, info_clima)
+            with LATENCIA_ETAPAS.medir("info_destino"):
+                info_destino = await obtener_info_destino(destino, info_clima, plazo)
         
-        return RespuestaResponse(respuesta=respuesta, fotos=fotos, info_destino=info_destino)
+        fotos = await tareas["fotos"] if tareas["fotos"] else None
+        resultado = await tarea_respuesta
+    finally:
+        # Si algo falla (o el cliente se desconecta), no dejar tareas colgadas
+        cancelar_tareas([*tareas.values(), tarea_respuesta])
+    
+    # Los mensajes de error no entran en el historial
+    if not resultado.get("error"):
+        await registrar_turno(conversacion, pregunta, resultado["respuesta"])
+    
+    return RespuestaResponse(
+        respuesta=resultado["respuesta"],
+        fotos=fotos,
+        info_destino=info_destino,
+        respuesta_cortada=resultado["respuesta_cortada"],
+        tokens_usados=resultado["tokens_usados"],
+        conversacion_id=conversacion.id
+    )
+
+
+@app.post("/api/planificar", response_model=RespuestaResponse)
+@rate_limit_planificar()
+async def planificar_viaje(request: Request, pregunta_request: PreguntaRequest):
+    """
+    Endpoint para procesar preguntas sobre planificación de viajes usando ChatGPT
+    
+    La consulta tiene PLAZO_PLANIFICAR segundos: al vencer responde 504. Si
+    el cliente se desconecta antes, se cancelan sus llamadas en curso.
+    """
+    plazo = Plazo(PLAZO_PLANIFICAR)
+    try:
+        return await ejecutar_con_plazo(atender_consulta(pregunta_request, plazo), plazo, request)
     
     except HTTPException:
         # Re-lanzar HTTPException sin modificar
         raise
+    except ServicioSaturado as e:
+        raise error_servicio_saturado(e)
+    except PlazoAgotado as e:
+        raise error_plazo_agotado(e)
+    except ClienteDesconectado:
+        # Nadie va a leer la respuesta: 499 como en nginx, solo para los logs
+        logger.info("Cliente desconectado, consulta cancelada")
+        raise HTTPException(status_code=499, detail="Cliente desconectado")
     except Exception as e:
         # Log el error completo (solo en servidor)
         logger.error(f"Error al procesar consulta: {str(e)}", exc_info=True)
@@ -227,38 +697,150 @@ async def planificar_viaje(request: Request, pregunta_request: PreguntaRequest):
         )
 
 
-def extraer_destino_de_pregunta(pregunta: str) -> Optional[str]:
+def evento_sse(evento: str, datos: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/planificar/stream")
+@rate_limit_planificar()
+async def planificar_viaje_stream(request: Request, pregunta_request: PreguntaRequest):
     """
-    Intenta extraer el nombre de un destino de la pregunta del usuario.
-    Esta es una implementación básica que busca palabras clave comunes.
+    Variante en streaming (Server-Sent Events) de /api/planificar
+    
+    Eventos emitidos, en orden:
+    - info: {"info_destino": {...}, "fotos": [...], "conversacion_id": "..."} en cuanto está disponible
+    - delta: {"texto": "..."} por cada fragmento generado por ChatGPT
+    - fin: {"respuesta_cortada": bool, "finish_reason": str, "tokens_usados": int}
+    - error: {"detail": "..."} si la generación falla una vez iniciado el stream
+      (con "reintentar_en" en segundos si OpenAI está saturado)
+    
+    Si OpenAI está saturado antes de empezar, responde 503 con Retry-After.
+    El stream completo tiene PLAZO_PLANIFICAR_STREAM segundos; al vencer se
+    emite un evento error y se corta la generación.
     """
-    pregunta_lower = pregunta.lower()
+    plazo = Plazo(PLAZO_PLANIFICAR_STREAM)
+    try:
+        pregunta, contexto, destino = await preparar_consulta(pregunta_request)
+        verificar_capacidad_openai(plazo)
+        conversacion = await abrir_conversacion(pregunta_request.conversacion_id)
+    except HTTPException:
+        raise
+    except ServicioSaturado as e:
+        raise error_servicio_saturado(e)
+    except Exception as e:
+        logger.error(f"Error al procesar consulta: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Error al procesar tu solicitud. Por favor intenta más tarde."
+        )
     
-    # Lista de destinos comunes (esto se puede expandir)
-    destinos_comunes = [
-        'parís', 'paris', 'tokio', 'tokyo', 'nueva york', 'new york', 
-        'londres', 'london', 'roma', 'rome', 'barcelona', 'madrid',
-        'berlín', 'berlin', 'amsterdam', 'atenas', 'athens', 'dubai',
-        'singapur', 'singapore', 'sydney', 'sídney', 'melbourne',
-        'toronto', 'montreal', 'vancouver', 'miami', 'los angeles',
-        'san francisco', 'chicago', 'boston', 'lisboa', 'lisbon',
-        'prague', 'praga', 'viena', 'vienna', 'budapest', 'cracovia'
-    ]
+    tareas = iniciar_enriquecimiento(destino, plazo)
     
-    for destino in destinos_comunes:
-        if destino in pregunta_lower:
-            return destino.capitalize()
+    async def eventos():
+        generador = None
+        tarea_primero = None
+        try:
+            info_clima = await tareas["clima"] if tareas["clima"] else None
+            
+            # Arrancar la generación ya: la primera iteración abre la conexión con OpenAI
+            generador = generar_respuesta_stream(
+                pregunta,
+                contexto,
+                info_clima,
+                usar_cache=pregunta_request.usar_cache,
+                conversacion=conversacion,
+                plazo=plazo
+            )
+            tarea_primero = asyncio.create_task(generador.__anext__())
+            
+            info_destino = None
+            if destino:
+                with LATENCIA_ETAPAS.medir("info_destino"):
+                    info_destino = await obtener_info_destino(destino, info_clima, plazo)
+            fotos = await tareas["fotos"] if tareas["fotos"] else None
+            
+            yield evento_sse("info", {
+                "info_destino": info_destino.model_dump() if info_destino else None,
+                "fotos": fotos,
+                "conversacion_id": conversacion.id
+            })
+            
+            try:
+                fragmento = await plazo.cumplir(tarea_primero, "openai_stream")
+            except StopAsyncIteration:
+                return
+            
+            partes = []
+            while True:
+                if fragmento["tipo"] == "delta":
+                    partes.append(fragmento["texto"])
+                    yield evento_sse("delta", {"texto": fragmento["texto"]})
+                else:
+                    datos = {k: v for k, v in fragmento.items() if k != "tipo"}
+                    yield evento_sse("fin", datos)
+                    await registrar_turno(conversacion, pregunta, "".join(partes))
+                
+                # Cortar la generación si el cliente ya se fue
+                if await request.is_disconnected():
+                    logger.info("Cliente desconectado, cancelando el stream de OpenAI")
+                    return
+                
+                try:
+                    fragmento = await plazo.cumplir(generador.__anext__(), "openai_stream")
+                except StopAsyncIteration:
+                    return
+        
+        except ServicioSaturado as e:
+            logger.warning(f"Stream rechazado por saturación de OpenAI: {e}")
+            yield evento_sse("error", {
+                "detail": "Hay demasiadas consultas en este momento. Por favor intenta de nuevo en unos segundos.",
+                "reintentar_en": e.reintentar_en
+            })
+        
+        except PlazoAgotado as e:
+            logger.warning(f"Stream cortado por plazo agotado: {e}")
+            yield evento_sse("error", {
+                "detail": "La respuesta tardó demasiado. Por favor intenta de nuevo en unos momentos."
+            })
+        
+        except Exception as e:
+            logger.error(f"Error durante el streaming de la respuesta: {str(e)}", exc_info=True)
+            yield evento_sse("error", {
+                "detail": "Error al generar la respuesta. Por favor intenta más tarde."
+            })
+        
+        finally:
+            cancelar_tareas(tareas.values())
+            if tarea_primero is not None and not tarea_primero.done():
+                # Esperar a que la cancelación termine antes de cerrar el generador
+                tarea_primero.cancel()
+                await asyncio.gather(tarea_primero, return_exceptions=True)
+            if generador is not None:
+                await generador.aclose()
     
-    return None
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
-def obtener_fotos_unsplash(ciudad: str, cantidad: int = 3) -> Optional[list[str]]:
+async def obtener_fotos_unsplash(
+    ciudad: str,
+    cantidad: int = 3,
+    orientacion: str = "landscape"
+) -> Optional[list[str]]:
     """
     Obtiene fotos hermosas de una ciudad usando Unsplash API.
     
+    Los resultados se guardan en una caché persistente. Si Unsplash rechaza la
+    petición (cuota agotada) o falla, se usan las fotos guardadas aunque estén vencidas.
+    
     Args:
         ciudad: Nombre de la ciudad/destino
         cantidad: Número de fotos a obtener (por defecto 3)
+        orientacion: Orientación de las fotos (por defecto "landscape")
         
     Returns:
         Lista de URLs de fotos o None si hay error
@@ -266,47 +848,80 @@ def obtener_fotos_unsplash(ciudad: str, cantidad: int = 3) -> Optional[list[str]
     if not unsplash_api_key:
         return None
     
+    clave = (normalizar_ciudad(ciudad), cantidad, orientacion)
+    fotos, vigente = cache_fotos.obtener(clave)
+    if vigente:
+        return fotos
+    
     try:
-        # URL de búsqueda de Unsplash
-        url = "https://api.unsplash.com/search/photos"
+        # Endpoint de búsqueda de Unsplash
+        url = "/search/photos"
         headers = {
             "Authorization": f"Client-ID {unsplash_api_key}"
         }
         params = {
             "query": f"{ciudad} travel destination",
             "per_page": cantidad,
-            "orientation": "landscape",  # Fotos horizontales se ven mejor
+            "orientation": orientacion,  # Fotos horizontales se ven mejor
             "order_by": "popularity"  # Las más populares suelen ser mejores
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        http = obtener_cliente_http("unsplash")
+        response = await http.get(url, headers=headers, params=params)
         
         if response.status_code == 200:
             data = response.json()
             results = data.get("results", [])
             
-            if results:
-                # Extraer URLs de las fotos en tamaño regular (óptimo para web)
-                fotos = []
-                for photo in results[:cantidad]:
-                    # Usar 'regular' que es un tamaño medio (1080px de ancho aprox)
-                    # Otros tamaños: 'raw', 'full', 'regular', 'small', 'thumb'
-                    url_foto = photo.get("urls", {}).get("regular")
-                    if url_foto:
-                        fotos.append(url_foto)
-                
-                return fotos if fotos else None
-            else:
+            # Extraer URLs de las fotos en tamaño regular (óptimo para web)
+            fotos = []
+            for photo in results[:cantidad]:
+                # Usar 'regular' que es un tamaño medio (1080px de ancho aprox)
+                # Otros tamaños: 'raw', 'full', 'regular', 'small', 'thumb'
+                url_foto = photo.get("urls", {}).get("regular")
+                if url_foto:
+                    fotos.append(url_foto)
+            
+            if not fotos:
                 return None
+            
+            await run_in_threadpool(cache_fotos.guardar, clave, fotos)
+            return fotos
         else:
-            # Si hay error, retornar None silenciosamente
+            # 403/429 suelen ser cuota agotada: usar fotos vencidas si las hay
             print(f"Error al obtener fotos de Unsplash: {response.status_code}")
-            return None
+            return cache_fotos.obtener_respaldo(clave)
     
     except Exception as e:
-        # En caso de error, retornar None sin interrumpir el flujo
+        # En caso de error, usar la caché vencida sin interrumpir el flujo
         print(f"Error al obtener fotos para {ciudad}: {str(e)}")
-        return None
+        return cache_fotos.obtener_respaldo(clave)
+
+
+async def calentar_cache_fotos(cantidad: int = 3):
+    """
+    Precarga en la caché las fotos de los destinos más consultados (según las estadísticas).
+    Se ejecuta en segundo plano al iniciar la aplicación.
+    
+    Args:
+        cantidad: Número de fotos por destino (el mismo que usa /api/planificar)
+    """
+    if not unsplash_api_key or FOTOS_CALENTAR_TOP <= 0:
+        return
+    
+    try:
+        stats = await run_in_threadpool(obtener_estadisticas)
+        destinos = [d["destino"] for d in stats.get("destinos_mas_consultados", [])][:FOTOS_CALENTAR_TOP]
+        
+        precargados = 0
+        for destino in destinos:
+            _, vigente = cache_fotos.obtener((normalizar_ciudad(destino), cantidad, "landscape"))
+            if not vigente and await obtener_fotos_unsplash(destino, cantidad=cantidad):
+                precargados += 1
+        
+        logger.info(f"Caché de fotos precargada: {precargados} destinos nuevos de {len(destinos)}")
+    except Exception as e:
+        logger.warning(f"No se pudo precargar la caché de fotos: {str(e)}")
 
 
 def obtener_codigo_moneda(ciudad: str, pais: str = "") -> Tuple[Optional[str], Optional[str]]:
@@ -314,121 +929,33 @@ def obtener_codigo_moneda(ciudad: str, pais: str = "") -> Tuple[Optional[str], O
     Obtiene el código de moneda y nombre basado en la ciudad o país.
     Retorna una tupla (codigo_moneda, nombre_moneda).
     """
-    # Mapeo de ciudades/países a códigos de moneda (ISO 4217)
-    mapeo_monedas = {
-        # Países
-        "US": ("USD", "Dólar Estadounidense"),
-        "GB": ("GBP", "Libra Esterlina"),
-        "FR": ("EUR", "Euro"),
-        "ES": ("EUR", "Euro"),
-        "IT": ("EUR", "Euro"),
-        "DE": ("EUR", "Euro"),
-        "NL": ("EUR", "Euro"),
-        "PT": ("EUR", "Euro"),
-        "AT": ("EUR", "Euro"),
-        "BE": ("EUR", "Euro"),
-        "GR": ("EUR", "Euro"),
-        "JP": ("JPY", "Yen Japonés"),
-        "CN": ("CNY", "Yuan Chino"),
-        "KR": ("KRW", "Won Surcoreano"),
-        "SG": ("SGD", "Dólar de Singapur"),
-        "AU": ("AUD", "Dólar Australiano"),
-        "NZ": ("NZD", "Dólar Neozelandés"),
-        "CA": ("CAD", "Dólar Canadiense"),
-        "MX": ("MXN", "Peso Mexicano"),
-        "BR": ("BRL", "Real Brasileño"),
-        "AR": ("ARS", "Peso Argentino"),
-        "CL": ("CLP", "Peso Chileno"),
-        "CO": ("COP", "Peso Colombiano"),
-        "PE": ("PEN", "Sol Peruano"),
-        "AE": ("AED", "Dirham de los Emiratos Árabes"),
-        "SA": ("SAR", "Riyal Saudí"),
-        "TR": ("TRY", "Lira Turca"),
-        "RU": ("RUB", "Rublo Ruso"),
-        "IN": ("INR", "Rupia India"),
-        "TH": ("THB", "Baht Tailandés"),
-        "ID": ("IDR", "Rupia Indonesia"),
-        "MY": ("MYR", "Ringgit Malayo"),
-        "PH": ("PHP", "Peso Filipino"),
-        "VN": ("VND", "Dong Vietnamita"),
-        "CH": ("CHF", "Franco Suizo"),
-        "NO": ("NOK", "Corona Noruega"),
-        "SE": ("SEK", "Corona Sueca"),
-        "DK": ("DKK", "Corona Danesa"),
-        "PL": ("PLN", "Zloty Polaco"),
-        "CZ": ("CZK", "Corona Checa"),
-        "HU": ("HUF", "Forint Húngaro"),
-        "RO": ("RON", "Leu Rumano"),
-        "EG": ("EGP", "Libra Egipcia"),
-        "ZA": ("ZAR", "Rand Sudafricano"),
-        "IL": ("ILS", "Nuevo Shekel Israelí"),
-    }
-    
-    # Mapeo de ciudades específicas (para casos donde el país no es suficiente)
-    ciudad_lower = ciudad.lower()
-    mapeo_ciudades = {
-        "paris": ("EUR", "Euro"),
-        "parís": ("EUR", "Euro"),
-        "london": ("GBP", "Libra Esterlina"),
-        "londres": ("GBP", "Libra Esterlina"),
-        "tokyo": ("JPY", "Yen Japonés"),
-        "tokio": ("JPY", "Yen Japonés"),
-        "new york": ("USD", "Dólar Estadounidense"),
-        "nueva york": ("USD", "Dólar Estadounidense"),
-        "sydney": ("AUD", "Dólar Australiano"),
-        "sídney": ("AUD", "Dólar Australiano"),
-        "dubai": ("AED", "Dirham de los Emiratos Árabes"),
-        "singapore": ("SGD", "Dólar de Singapur"),
-        "singapur": ("SGD", "Dólar de Singapur"),
-    }
-    
-    # Primero buscar por ciudad
-    for ciudad_key, moneda_info in mapeo_ciudades.items():
-        if ciudad_key in ciudad_lower:
-            return moneda_info
-    
-    # Si no se encuentra, buscar por código de país
-    if pais and pais in mapeo_monedas:
-        return mapeo_monedas[pais]
+    # Si no se conoce el país, buscar la ciudad en el diccionario geográfico
+    if not pais:
+        destino = resolver_destino(ciudad)
+        pais = destino.pais if destino else ""
     
-    # Si no se encuentra, retornar None
-    return None, None
+    # Tabla ISO 4217 por país (cargada una sola vez en paises.py)
+    return obtener_moneda(pais)
 
 
 def obtener_tipo_cambio_usd(codigo_moneda: str) -> Optional[float]:
     """
-    Obtiene el tipo de cambio de una moneda respecto al USD usando exchangerate-api.io (gratuita).
+    Obtiene el tipo de cambio de una moneda respecto al USD desde la tabla en memoria
+    (refrescada en segundo plano desde exchangerate-api.io).
     
     Args:
         codigo_moneda: Código ISO 4217 de la moneda (ej: EUR, GBP, JPY)
         
     Returns:
-        Tipo de cambio (cuántas unidades de la moneda = 1 USD) o None si hay error
+        Tipo de cambio (cuántas unidades de la moneda = 1 USD) o None si no está disponible
     """
     if not codigo_moneda or codigo_moneda == "USD":
         return 1.0  # USD respecto a USD siempre es 1
     
-    try:
-        # API gratuita de exchangerate-api.io
-        url = f"https://api.exchangerate-api.com/v4/latest/USD"
-        
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            rates = data.get("rates", {})
-            
-            if codigo_moneda in rates:
-                # La API retorna cuántas unidades de la moneda = 1 USD
-                # Para invertir: 1 unidad de la moneda = 1/rate USD
-                rate = rates[codigo_moneda]
-                return 1.0 / rate if rate != 0 else None
-        
-        return None
-    
-    except Exception as e:
-        print(f"Error al obtener tipo de cambio para {codigo_moneda}: {str(e)}")
-        return None
+    # La tabla guarda cuántas unidades de la moneda = 1 USD
+    # Para invertir: 1 unidad de la moneda = 1/rate USD
+    rate = almacen_tipos_cambio.obtener_tasa(codigo_moneda)
+    return 1.0 / rate if rate else None
 
 
 def calcular_diferencia_horaria(timezone_offset: int) -> str:
@@ -441,46 +968,61 @@ def calcular_diferencia_horaria(timezone_offset: int) -> str:
     Returns:
         String con la diferencia horaria (ej: "UTC+2", "UTC-5")
     """
-    horas = timezone_offset // 3600
-    minutos = abs((timezone_offset % 3600) // 60)
+    signo = "+" if timezone_offset >= 0 else "-"
+    horas, resto = divmod(abs(timezone_offset), 3600)
+    minutos = resto // 60
     
-    if horas >= 0:
-        if minutos > 0:
-            return f"UTC+{horas}:{minutos:02d}"
-        return f"UTC+{horas}"
-    else:
-        if minutos > 0:
-            return f"UTC{horas}:{minutos:02d}"
-        return f"UTC{horas}"
+    if minutos > 0:
+        return f"UTC{signo}{horas}:{minutos:02d}"
+    return f"UTC{signo}{horas}"
 
 
-def obtener_info_destino(ciudad: str, info_clima: Optional[dict] = None) -> Optional[InfoDestino]:
+async def obtener_info_destino(
+    ciudad: str,
+    info_clima: Optional[dict] = None,
+    plazo: Optional[Plazo] = None
+) -> Optional[InfoDestino]:
     """
     Obtiene información completa del destino: temperatura, diferencia horaria y tipo de cambio.
     
     Args:
         ciudad: Nombre de la ciudad
         info_clima: Información del clima obtenida previamente (opcional)
+        plazo: Plazo de la consulta; si no queda tiempo, no se vuelve a pedir el clima
         
     Returns:
         Objeto InfoDestino con toda la información o None si hay error
     """
     try:
+        # El país sale del diccionario geográfico (sin depender del clima)
+        destino = resolver_destino(ciudad)
+        
         # Si no tenemos info_clima, intentar obtenerla
-        if not info_clima:
-            info_clima = obtener_clima_actual(ciudad)
+        if not info_clima and plazo:
+            info_clima = await plazo.opcional(
+                lambda: obtener_clima_actual(ciudad), "clima", OPENWEATHER_TIMEOUT, reserva=PLAZO_RESERVA_OPENAI
+            )
+        elif not info_clima:
+            info_clima = await obtener_clima_actual(ciudad)
         
-        if not info_clima:
+        if not info_clima and not destino:
             return None
+        info_clima = info_clima or {}
         
         # Obtener información de temperatura
         temperatura = info_clima.get("temperatura")
         condicion = info_clima.get("descripcion")
-        pais = info_clima.get("pais", "")
-        timezone_offset = info_clima.get("timezone_offset", 0)
+        pais = destino.pais if destino else info_clima.get("pais", "")
+        
+        # Diferencia horaria: zona IANA de la ciudad o del país (con horario de verano);
+        # si no se conoce, la que informa OpenWeatherMap
+        zona = zona_horaria(pais, destino.zona_horaria if destino else "")
+        timezone_offset = desfase_utc(zona) if zona else None
+        if timezone_offset is None:
+            timezone_offset = info_clima.get("timezone_offset")
         
         # Calcular diferencia horaria
-        diferencia_horaria = calcular_diferencia_horaria(timezone_offset) if timezone_offset else None
+        diferencia_horaria = calcular_diferencia_horaria(timezone_offset) if timezone_offset is not None else None
         
         # Obtener información de moneda
         codigo_moneda, nombre_moneda = obtener_codigo_moneda(ciudad, pais)
@@ -503,10 +1045,18 @@ def obtener_info_destino(ciudad: str, info_clima: Optional[dict] = None) -> Opti
         return None
 
 
-def obtener_clima_actual(ciudad: str) -> Optional[dict]:
+def normalizar_ciudad(ciudad: str) -> str:
+    """Normaliza el nombre de una ciudad para usarlo como clave de caché ("  París " -> "paris")"""
+    return normalizar(ciudad)
+
+
+async def obtener_clima_actual(ciudad: str) -> Optional[dict]:
     """
     Obtiene el clima actual de una ciudad usando OpenWeatherMap API.
     
+    Los resultados se guardan en caché por ciudad normalizada y las peticiones
+    concurrentes por la misma ciudad comparten una sola llamada a la API.
+    
     Args:
         ciudad: Nombre de la ciudad
         
@@ -516,57 +1066,285 @@ def obtener_clima_actual(ciudad: str) -> Optional[dict]:
     if not openweather_api_key:
         return None
     
+    # Con el destino del diccionario se consulta por coordenadas y los alias
+    # ("Nueva York", "NYC") comparten la misma entrada de caché
+    destino = resolver_destino(ciudad)
+    
     try:
-        # URL de la API de OpenWeatherMap
-        url = "http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "q": ciudad,
-            "appid": openweather_api_key,
-            "units": "metric",  # Para obtener temperatura en Celsius
-            "lang": "es"  # Respuestas en español
-        }
-        
-        response = requests.get(url, params=params, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Extraer información relevante incluyendo timezone
-            timezone_offset = data.get("timezone", 0)  # Offset en segundos desde UTC
-            clima_info = {
-                "ciudad": data.get("name", ciudad),
-                "pais": data.get("sys", {}).get("country", ""),
-                "temperatura": round(data.get("main", {}).get("temp", 0)),
-                "sensacion_termica": round(data.get("main", {}).get("feels_like", 0)),
-                "descripcion": data.get("weather", [{}])[0].get("description", "").capitalize(),
-                "humedad": data.get("main", {}).get("humidity", 0),
-                "viento": round(data.get("wind", {}).get("speed", 0) * 3.6),  # Convertir m/s a km/h
-                "visibilidad": data.get("visibility", 0) / 1000 if data.get("visibility") else None,  # Convertir m a km
-                "timezone_offset": timezone_offset  # Para calcular diferencia horaria
-            }
-            
-            return clima_info
-        else:
-            # Si no se encuentra la ciudad, retornar None silenciosamente
-            return None
+        return await cache_clima.obtener_o_calcular(
+            normalizar_ciudad(destino.nombre if destino else ciudad),
+            lambda: consultar_clima_openweather(ciudad, destino)
+        )
     
     except Exception as e:
-        # En caso de error, retornar None sin interrumpir el flujo
+        # En caso de error, retornar None sin interrumpir el flujo (no se guarda en caché)
         print(f"Error al obtener clima para {ciudad}: {str(e)}")
         return None
 
 
-def generar_respuesta_con_chatgpt(
+async def consultar_clima_openweather(ciudad: str, destino: Optional[Destino] = None) -> Optional[dict]:
+    """
+    Consulta el clima actual de una ciudad directamente en OpenWeatherMap (sin caché).
+    
+    Args:
+        ciudad: Nombre de la ciudad
+        destino: Destino del diccionario geográfico (si se conoce, se consulta por coordenadas)
+        
+    Returns:
+        Diccionario con información del clima o None si la ciudad no existe
+        
+    Raises:
+        RuntimeError: Si la API responde con un error distinto de "no encontrada"
+    """
+    # URL de la API de OpenWeatherMap
+    url = "/data/2.5/weather"
+    params = {
+        "appid": openweather_api_key,
+        "units": "metric",  # Para obtener temperatura en Celsius
+        "lang": "es"  # Respuestas en español
+    }
+    if destino:
+        params["lat"] = destino.latitud
+        params["lon"] = destino.longitud
+    else:
+        params["q"] = ciudad
+    
+    http = obtener_cliente_http("openweather")
+    response = await http.get(url, params=params)
+    
+    if response.status_code == 404:
+        # Ciudad no encontrada: resultado negativo (se guarda en caché)
+        return None
+    if response.status_code != 200:
+        # No incluir la URL en el error: lleva la API key como parámetro
+        raise RuntimeError(f"OpenWeatherMap respondió con estado {response.status_code}")
+    
+    data = response.json()
+    
+    # Extraer información relevante incluyendo timezone
+    timezone_offset = data.get("timezone", 0)  # Offset en segundos desde UTC
+    return {
+        "ciudad": data.get("name", ciudad),
+        "pais": data.get("sys", {}).get("country", ""),
+        "temperatura": round(data.get("main", {}).get("temp", 0)),
+        "sensacion_termica": round(data.get("main", {}).get("feels_like", 0)),
+        "descripcion": data.get("weather", [{}])[0].get("description", "").capitalize(),
+        "humedad": data.get("main", {}).get("humidity", 0),
+        "viento": round(data.get("wind", {}).get("speed", 0) * 3.6),  # Convertir m/s a km/h
+        "visibilidad": data.get("visibility", 0) / 1000 if data.get("visibility") else None,  # Convertir m a km
+        "timezone_offset": timezone_offset  # Para calcular diferencia horaria
+    }
+
+
+def construir_mensajes_chatgpt(
+    pregunta: str,
+    contexto: Optional[ContextoFormulario] = None,
+    info_clima: Optional[dict] = None,
+    modelo: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    historial: Optional[List[Dict[str, str]]] = None,
+    tokens_historial: Optional[int] = None,
+    resumen: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], str, int, PromptSistema]:
+    """
+    Construye los mensajes para ChatGPT (system prompt + contexto + clima + historial).
+    
+    Args:
+        pregunta: Pregunta del usuario
+        contexto: Contexto del formulario (destino, fecha, presupuesto, preferencias)
+        info_clima: Información del clima actual (opcional)
+        modelo: Modelo de OpenAI a usar. Si es None, usa la configuración por defecto.
+        max_tokens: Máximo número de tokens para la respuesta. Si es None, usa la configuración por defecto.
+        historial: Lista de mensajes anteriores en formato OpenAI (opcional)
+        tokens_historial: Tokens ya contados del historial (conversaciones del servidor).
+                          Si el historial cabe entero, no se vuelve a recorrer para recortarlo.
+        resumen: Resumen de la parte de la conversación que ya no está en el historial (opcional)
+    
+    Returns:
+        Tupla (mensajes, modelo_usar, max_tokens_usar, prompt) con el system prompt ensamblado
+    
+    Raises:
+        ValueError: Si la configuración o el historial superan los límites del modelo
+    """
+    # Obtener configuración (usando valores por defecto si no se especifican)
+    config = obtener_configuracion_openai(modelo=modelo, max_tokens=max_tokens)
+    modelo_usar = config["modelo"]
+    max_tokens_usar = config["max_tokens"]
+    
+    logger.info(f"Usando modelo: {modelo_usar}, max_tokens: {max_tokens_usar}")
+    
+    # System prompt (base + viajero + resumen + clima) desde las plantillas, con sus tokens ya contados
+    prompt = prompt_sistema(contexto, info_clima, resumen, modelo_usar)
+    
+    # Construir lista de mensajes
+    mensajes = [
+        {"role": "system", "content": prompt.texto},
+        {"role": "user", "content": pregunta}
+    ]
+    tokens_sin_historial = prompt.tokens + estimar_tokens_mensajes(mensajes[1:], modelo_usar)
+    
+    # Si hay historial, agregarlo antes del último mensaje del usuario
+    tokens_mensajes = tokens_sin_historial
+    if historial and tokens_historial is not None and (
+        tokens_sin_historial + tokens_historial + max_tokens_usar <= config["max_context_tokens"]
+    ):
+        # Historial de una conversación del servidor que cabe entero: sus tokens
+        # ya están contados, no hace falta recortarlo
+        mensajes = [mensajes[0], *historial, mensajes[1]]
+        tokens_mensajes += tokens_historial
+    elif historial:
+        # Limitar historial para que no exceda los límites de tokens
+        # (la pregunta actual es el mensaje más reciente: siempre se conserva)
+        mensajes, tokens_mensajes = limitar_historial_por_tokens(
+            mensajes=historial + mensajes,
+            modelo=modelo_usar,
+            max_tokens_respuesta=max_tokens_usar,
+            reservar_tokens_sistema=prompt.tokens + 100
+        )
+        
+        logger.info(
+            f"Historial limitado: {len(historial)} mensajes originales -> "
+            f"{len(mensajes)} mensajes después del límite. "
+            f"Tokens estimados: ~{tokens_mensajes}"
+        )
+    
+    # Validar configuración antes de hacer la llamada
+    es_valido, error_validacion = validar_configuracion(
+        modelo=modelo_usar,
+        max_tokens=max_tokens_usar,
+        historial=mensajes,
+        tokens_historial=tokens_mensajes
+    )
+    
+    if not es_valido:
+        logger.error(f"Configuración inválida: {error_validacion}")
+        raise ValueError(f"Error en configuración: {error_validacion}")
+    
+    return mensajes, modelo_usar, max_tokens_usar, prompt
+
+
+def clave_cache_respuesta(pregunta: str, contexto: Optional[ContextoFormulario], modelo: Optional[str]):
+    """Clave de la caché de respuestas: contexto canónico + destino de la pregunta + modelo + temperature"""
+    if not cache_respuestas.activa:
+        return None
+    modelo_usar = obtener_configuracion_openai(modelo=modelo)["modelo"]
+    destino_pregunta = extraer_destino(pregunta)
+    return cache_respuestas.clave_contexto(
+        contexto,
+        modelo_usar,
+        AI_TEMPERATURE,
+        destino_pregunta=f"{destino_pregunta.nombre}|{destino_pregunta.pais}" if destino_pregunta else None
+    )
+
+
+def clave_llamada_openai(
+    prompt: PromptSistema,
+    mensajes: List[Dict[str, str]],
+    modelo: str,
+    max_tokens: int
+) -> str:
+    """
+    Clave canónica de una llamada a OpenAI: dos llamadas con la misma clave dan la misma respuesta
+    
+    El system prompt (mensajes[0]) entra por su hash, sin volver a serializarlo.
+    """
+    canonico = json.dumps(
+        [modelo, max_tokens, AI_TEMPERATURE, prompt.hash, mensajes[1:]],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+async def llamar_openai(
+    mensajes: List[Dict[str, str]],
+    modelo: str,
+    max_tokens: int,
+    prioridad: int = PRIORIDAD_INTERACTIVA,
+    espera_maxima: float = OPENAI_ESPERA_MAXIMA
+) -> dict:
+    """
+    Hace la llamada (sin streaming) a OpenAI y extrae el resultado
+    
+    La llamada espera primero su parte del presupuesto de peticiones y tokens
+    por minuto y después su turno en la cola del modelo, cada espera como mucho
+    espera_maxima segundos. Esperar presupuesto no ocupa un hueco de la cola.
+    
+    Returns:
+        Diccionario con respuesta, respuesta_cortada y tokens_usados
+    
+    Raises:
+        ServicioSaturado: Si no hay hueco o presupuesto para llamar al modelo a tiempo
+    """
+    tokens_prompt = estimar_tokens_mensajes(mensajes, modelo)
+    # Rechazar antes de esperar presupuesto si la cola ya está llena
+    planificador_openai.verificar_admision(modelo, prioridad, espera_maxima)
+    # Reservar prompt + max_tokens del presupuesto por minuto; se ajusta con el uso real
+    reserva = await limitador_openai.reservar(modelo, tokens_prompt + max_tokens, espera_maxima)
+    try:
+        async with planificador_openai.turno(modelo, prioridad, espera_maxima=espera_maxima):
+            try:
+                with LATENCIA_ETAPAS.medir("openai"):
+                    response = await client.chat.completions.create(
+                        model=modelo,
+                        messages=mensajes,
+                        max_tokens=max_tokens,
+                        temperature=AI_TEMPERATURE  # Configurable vía AI_TEMPERATURE en .env
+                    )
+            except Exception as e:
+                ERRORES_EXTERNOS.incrementar("openai", codigo_error(e))
+                # Sin respuesta no se generaron tokens: cobrar solo el prompt
+                limitador_openai.ajustar(reserva, tokens_prompt)
+                raise
+    except BaseException:
+        # Sin hueco en la cola (o cancelada antes de salir): devolver el presupuesto
+        limitador_openai.liberar(reserva)
+        raise
+    
+    # Extraer la respuesta generada
+    respuesta = response.choices[0].message.content
+    
+    # Detectar si la respuesta se cortó por límite de tokens
+    finish_reason = response.choices[0].finish_reason
+    respuesta_cortada = finish_reason == "length"  # "length" significa que se cortó por max_tokens
+    
+    # Obtener información de uso de tokens
+    tokens_usados = response.usage.total_tokens if hasattr(response, 'usage') and response.usage else None
+    limitador_openai.ajustar(reserva, tokens_usados)
+    if tokens_usados:
+        TOKENS_USADOS.incrementar(modelo, cantidad=tokens_usados)
+    
+    logger.info(
+        f"Respuesta generada. Cortada: {respuesta_cortada}, "
+        f"Finish reason: {finish_reason}, Tokens usados: {tokens_usados}"
+    )
+    
+    return {
+        "respuesta": respuesta,
+        "respuesta_cortada": respuesta_cortada,
+        "tokens_usados": tokens_usados
+    }
+
+
+async def generar_respuesta_con_chatgpt(
     pregunta: str,
     contexto: Optional[ContextoFormulario] = None,
     info_clima: Optional[dict] = None,
     modelo: Optional[str] = None,
     max_tokens: Optional[int] = None,
-    historial: Optional[List[Dict[str, str]]] = None
+    historial: Optional[List[Dict[str, str]]] = None,
+    usar_cache: bool = True,
+    prioridad: int = PRIORIDAD_INTERACTIVA,
+    conversacion: Optional[Conversacion] = None,
+    plazo: Optional[Plazo] = None
 ) -> dict:
     """
     Función para generar respuestas especializadas usando ChatGPT con personalidad de experto en viajes.
     
+    Las preguntas sin historial se buscan primero en la caché de respuestas
+    (coincidencia exacta o aproximada con el mismo contexto). Las peticiones
+    concurrentes con el mismo prompt esperan una sola llamada a OpenAI.
+    
     Args:
         pregunta: Pregunta del usuario
         contexto: Contexto del formulario (destino, fecha, presupuesto, preferencias)
@@ -575,184 +1353,231 @@ def generar_respuesta_con_chatgpt(
         max_tokens: Máximo número de tokens para la respuesta. Si es None, usa la configuración por defecto.
         historial: Lista de mensajes anteriores en formato OpenAI [{"role": "user/assistant", "content": "..."}]
                    Si se proporciona, se incluirá en el contexto limitado por tokens.
+        usar_cache: Si es False, no se consulta ni se actualiza la caché de respuestas
+        prioridad: Prioridad en la cola de OpenAI (PRIORIDAD_INTERACTIVA o PRIORIDAD_SEGUNDO_PLANO)
+        conversacion: Conversación guardada en el servidor; si se indica, el historial
+                      (con sus tokens ya contados) y el resumen salen de ella
+        plazo: Plazo de la consulta; acota la espera en la cola y la respuesta del modelo
     
     Returns:
         Diccionario con:
         - respuesta: Respuesta generada por ChatGPT
         - respuesta_cortada: True si la respuesta se cortó por límite de tokens
-        - tokens_usados: Número de tokens usados (si está disponible)
+        - tokens_usados: Número de tokens usados (si está disponible, 0 si viene de caché)
+        - error: True si la respuesta es un mensaje de error (solo en ese caso)
+    
+    Raises:
+        ServicioSaturado: Si no hay hueco para llamar a OpenAI a tiempo
+        PlazoAgotado: Si el plazo vence antes de la respuesta
     """
+    tokens_historial = None
+    resumen = None
+    if conversacion is not None:
+        historial, tokens_historial = conversacion.historial()
+        resumen = conversacion.resumen
+    
+    clave_cache = clave_cache_respuesta(pregunta, contexto, modelo) if usar_cache and not historial else None
+    if clave_cache:
+        respuesta_cache = cache_respuestas.buscar(pregunta, clave_cache)
+        if respuesta_cache:
+            logger.info("Respuesta obtenida de la caché de respuestas")
+            return {**respuesta_cache, "tokens_usados": 0}
+    
     try:
-        # Construir el contexto del usuario si está disponible
-        contexto_usuario = ""
-        if contexto:
-            contexto_usuario = f"""
-        
-        INFORMACIÓN DEL VIAJERO:
-        - Destino: {contexto.destino}
-        - Fecha del viaje: {contexto.fecha}
-        - Presupuesto: {contexto.presupuesto}
-        - Preferencia de viaje: {contexto.preferencia}
-        
-        IMPORTANTE: Usa esta información en todas tus respuestas para personalizar las recomendaciones. 
-        Cuando el usuario haga preguntas, siempre ten en cuenta estos detalles sobre su viaje."""
-        
-        # Agregar información del clima si está disponible
-        info_clima_str = ""
-        if info_clima:
-            visibilidad_str = f", Visibilidad: {info_clima['visibilidad']:.1f} km" if info_clima.get('visibilidad') else ""
-            info_clima_str = f"""
-        
-        CLIMA ACTUAL EN {info_clima['ciudad'].upper()} ({info_clima.get('pais', '')}):
-        - Temperatura: {info_clima['temperatura']}°C (sensación térmica: {info_clima['sensacion_termica']}°C)
-        - Condición: {info_clima['descripcion']}
-        - Humedad: {info_clima['humedad']}%
-        - Viento: {info_clima['viento']} km/h{visibilidad_str}
-        
-        IMPORTANTE: Incluye esta información del clima actual en tu respuesta, especialmente en la sección de 
-        "ä CONSEJOS LOCALES" para dar recomendaciones sobre qué ropa llevar y actividades según el clima. 
-        Si el clima es extremo (muy frío, muy caliente, lluvioso), destácalo en tus consejos."""
-        
-        # Crear el mensaje del sistema que define el rol y personalidad del asistente
-        # Usar SYSTEM_PROMPT de configuración si está disponible, sino usar el por defecto
-        system_prompt_env = os.getenv("SYSTEM_PROMPT", "")
-        if system_prompt_env:
-            # Si SYSTEM_PROMPT está configurado en .env, usarlo
-            system_message_base = system_prompt_env
-        elif SYSTEM_PROMPT and SYSTEM_PROMPT != os.getenv("SYSTEM_PROMPT", ""):
-            # Si SYSTEM_PROMPT está configurado en config.py, usarlo
-            system_message_base = SYSTEM_PROMPT
-        else:
-            # Usar prompt por defecto
-            system_message_base = """Eres ViajeIA, un asistente virtual experto en viajes con más de 15 años de experiencia 
-        ayudando a viajeros a crear experiencias inolvidables. Tienes una personalidad entusiasta, amigable y 
-        apasionada por los viajes.
-
-        CARACTERÍSTICAS DE TU PERSONALIDAD:
-        - Eres entusiasta y positivo sobre los viajes
-        - Haces preguntas inteligentes para entender mejor las necesidades del viajero
-        - Compartes consejos prácticos basados en experiencia real
-        - Usas un tono conversacional pero profesional
-        - Te emocionas cuando alguien planea un viaje especial
-
-        ESPECIALIZACIÓN:
-        - Planificación de itinerarios detallados día por día
-        - Recomendaciones de destinos según presupuesto, intereses y temporada
-        - Consejos para encontrar vuelos, hoteles y transporte
-        - Tips de viajero experimentado (qué llevar, qué evitar, cómo ahorrar)
-        - Recomendaciones gastronómicas y culturales
-        - Planificación de presupuestos realistas
-
-        FORMATO DE RESPUESTA (OBLIGATORIO):
-        SIEMPRE debes responder usando EXACTAMENTE esta estructura con estos símbolos:
-        
-        » ALOJAMIENTO: [recomendaciones de hoteles, hostales, o alojamientos según el presupuesto]
-        
-        Þ COMIDA LOCAL: [recomendaciones de restaurantes, platos típicos, y experiencias gastronómicas]
-        
-        LUGARES IMPERDIBLES: [lugares que definitivamente debe visitar el viajero]
-        
-        ä CONSEJOS LOCALES: [tips especiales, qué evitar, costumbres locales, secretos del destino]
-        
-        ø ESTIMACIÓN DE COSTOS: [desglose aproximado de gastos por categoría basado en el presupuesto]
-        
-        REGLAS IMPORTANTES:
-        - NUNCA cambies estos símbolos (», Þ, , ä, ø)
-        - SIEMPRE incluye las 5 secciones en este orden exacto
-        - Si falta información, usa la información del contexto del formulario o haz suposiciones razonables
-        - Mantén un tono entusiasta pero informativo
-        - Personaliza cada sección según el destino, presupuesto y preferencias del usuario
-        - Responde siempre en español
-        - Si hay información del clima actual, inclúyela naturalmente en tus respuestas, especialmente en los consejos locales
-        """
-        
-        system_message = system_message_base + contexto_usuario + info_clima_str
-        
-        # Obtener configuración (usando valores por defecto si no se especifican)
-        config = obtener_configuracion_openai(modelo=modelo, max_tokens=max_tokens)
-        modelo_usar = config["modelo"]
-        max_tokens_usar = config["max_tokens"]
-        
-        logger.info(f"Usando modelo: {modelo_usar}, max_tokens: {max_tokens_usar}")
-        
-        # Construir lista de mensajes
-        mensajes = [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": pregunta}
-        ]
-        
-        # Si hay historial, agregarlo antes del último mensaje del usuario
-        if historial and len(historial) > 0:
-            # Limitar historial para que no exceda los límites de tokens
-            historial_limitado = limitar_historial_por_tokens(
-                mensajes=historial + mensajes,
-                modelo=modelo_usar,
-                max_tokens_respuesta=max_tokens_usar,
-                reservar_tokens_sistema=estimar_tokens_mensajes([{"role": "system", "content": system_message}]) + 100
-            )
-            
-            # Si el historial limitado no incluye nuestro último mensaje del usuario, agregarlo
-            ultimo_mensaje = mensajes[-1]
-            historial_sin_system = [m for m in historial_limitado if m.get("role") != "system"]
-            
-            if not historial_sin_system or historial_sin_system[-1].get("content") != ultimo_mensaje.get("content"):
-                # Agregar el último mensaje del usuario si no está ya incluido
-                historial_limitado.append(ultimo_mensaje)
-            
-            mensajes = historial_limitado
-            
-            logger.info(
-                f"Historial limitado: {len(historial)} mensajes originales -> "
-                f"{len(mensajes)} mensajes después del límite. "
-                f"Tokens estimados: ~{estimar_tokens_mensajes(mensajes)}"
-            )
-        
-        # Validar configuración antes de hacer la llamada
-        es_valido, error_validacion = validar_configuracion(
-            modelo=modelo_usar,
-            max_tokens=max_tokens_usar,
-            historial=mensajes
+        mensajes, modelo_usar, max_tokens_usar, prompt = construir_mensajes_chatgpt(
+            pregunta, contexto, info_clima, modelo, max_tokens, historial, tokens_historial, resumen
         )
         
-        if not es_valido:
-            logger.error(f"Configuración inválida: {error_validacion}")
-            raise ValueError(f"Error en configuración: {error_validacion}")
-        
-        # Llamar a la API de OpenAI
-        response = client.chat.completions.create(
-            model=modelo_usar,
-            messages=mensajes,
-            max_tokens=max_tokens_usar,
-            temperature=AI_TEMPERATURE  # Configurable vía AI_TEMPERATURE en .env
+        # Llamar a la API de OpenAI (o esperar la llamada idéntica que ya está en curso).
+        # La llamada compartida conserva su propio timeout; cada consulta espera
+        # solo lo que le queda de plazo
+        espera_maxima = plazo.limitar(OPENAI_ESPERA_MAXIMA) if plazo else OPENAI_ESPERA_MAXIMA
+        llamada = agrupador_openai.ejecutar(
+            clave_llamada_openai(prompt, mensajes, modelo_usar, max_tokens_usar),
+            lambda: llamar_openai(mensajes, modelo_usar, max_tokens_usar, prioridad, espera_maxima),
+            timeout=OPENAI_TIMEOUT
         )
+        resultado = await (plazo.cumplir(llamada, "openai") if plazo else llamada)
+        # Copia propia: el resultado se comparte entre todas las peticiones agrupadas
+        resultado = dict(resultado)
         
-        # Extraer la respuesta generada
-        respuesta = response.choices[0].message.content
-        
-        # Detectar si la respuesta se cortó por límite de tokens
-        finish_reason = response.choices[0].finish_reason
-        respuesta_cortada = finish_reason == "length"  # "length" significa que se cortó por max_tokens
-        
-        # Obtener información de uso de tokens
-        tokens_usados = response.usage.total_tokens if hasattr(response, 'usage') and response.usage else None
-        
-        logger.info(
-            f"Respuesta generada. Cortada: {respuesta_cortada}, "
-            f"Finish reason: {finish_reason}, Tokens usados: {tokens_usados}"
-        )
+        # Guardar solo respuestas completas
+        if clave_cache and resultado["respuesta"] and not resultado["respuesta_cortada"]:
+            cache_respuestas.guardar(pregunta, clave_cache, resultado)
         
         # Retornar respuesta con información adicional
-        return {
-            "respuesta": respuesta,
-            "respuesta_cortada": respuesta_cortada,
-            "tokens_usados": tokens_usados
-        }
+        return resultado
     
+    except (ServicioSaturado, PlazoAgotado):
+        # El endpoint responde 503 con Retry-After o 504
+        raise
     except Exception as e:
         # Si hay un error, devolver un mensaje amigable con personalidad
         error_msg = f"¡Ups! 😅 Hubo un pequeño problema técnico mientras procesaba tu solicitud. Por favor, intenta de nuevo en un momento. Si el problema persiste, verifica tu conexión a internet. Error: {str(e)}"
         return {
             "respuesta": error_msg,
             "respuesta_cortada": False,
-            "tokens_usados": None
+            "tokens_usados": None,
+            "error": True
         }
+
+
+async def generar_respuesta_stream(
+    pregunta: str,
+    contexto: Optional[ContextoFormulario] = None,
+    info_clima: Optional[dict] = None,
+    modelo: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    historial: Optional[List[Dict[str, str]]] = None,
+    usar_cache: bool = True,
+    prioridad: int = PRIORIDAD_INTERACTIVA,
+    conversacion: Optional[Conversacion] = None,
+    plazo: Optional[Plazo] = None
+) -> AsyncIterator[dict]:
+    """
+    Variante en streaming de generar_respuesta_con_chatgpt.
+    
+    Emite los fragmentos de texto a medida que OpenAI los genera. Las peticiones
+    concurrentes con el mismo prompt comparten un solo stream de OpenAI. Si todos
+    los consumidores dejan de iterar (por ejemplo, porque los clientes se
+    desconectaron), la conexión con OpenAI se cierra de inmediato.
+    
+    Args:
+        Los mismos que generar_respuesta_con_chatgpt
+    
+    Yields:
+        Diccionarios con:
+        - {"tipo": "delta", "texto": "..."} por cada fragmento generado
+        - {"tipo": "fin", "respuesta_cortada": bool, "finish_reason": str, "tokens_usados": int}
+          al terminar (tokens_usados es una estimación: el stream no incluye 'usage')
+    
+    Raises:
+        ServicioSaturado: Si no hay hueco para llamar a OpenAI a tiempo
+    """
+    tokens_historial = None
+    resumen = None
+    if conversacion is not None:
+        historial, tokens_historial = conversacion.historial()
+        resumen = conversacion.resumen
+    
+    clave_cache = clave_cache_respuesta(pregunta, contexto, modelo) if usar_cache and not historial else None
+    if clave_cache:
+        respuesta_cache = cache_respuestas.buscar(pregunta, clave_cache)
+        if respuesta_cache:
+            logger.info("Respuesta en streaming obtenida de la caché de respuestas")
+            yield {"tipo": "delta", "texto": respuesta_cache["respuesta"]}
+            yield {
+                "tipo": "fin",
+                "respuesta_cortada": respuesta_cache["respuesta_cortada"],
+                "finish_reason": "stop",
+                "tokens_usados": 0
+            }
+            return
+    
+    mensajes, modelo_usar, max_tokens_usar, prompt = construir_mensajes_chatgpt(
+        pregunta, contexto, info_clima, modelo, max_tokens, historial, tokens_historial, resumen
+    )
+    
+    # Las peticiones concurrentes con el mismo prompt reciben los mismos fragmentos
+    # de un solo stream de OpenAI
+    difusion = agrupador_openai.difundir(
+        clave_llamada_openai(prompt, mensajes, modelo_usar, max_tokens_usar),
+        lambda: llamar_openai_stream(
+            mensajes, modelo_usar, max_tokens_usar, pregunta, clave_cache, prioridad,
+            plazo.limitar(OPENAI_ESPERA_MAXIMA) if plazo else OPENAI_ESPERA_MAXIMA
+        ),
+        timeout=OPENAI_TIMEOUT
+    )
+    try:
+        async for evento in difusion:
+            yield evento
+    finally:
+        # Dejar de recibir fragmentos en cuanto este consumidor termina
+        await difusion.aclose()
+
+
+async def llamar_openai_stream(
+    mensajes: List[Dict[str, str]],
+    modelo: str,
+    max_tokens: int,
+    pregunta: str,
+    clave_cache: Optional[Tuple],
+    prioridad: int = PRIORIDAD_INTERACTIVA,
+    espera_maxima: float = OPENAI_ESPERA_MAXIMA
+) -> AsyncIterator[dict]:
+    """
+    Hace la llamada en streaming a OpenAI y guarda la respuesta completa en la caché
+    
+    El presupuesto por minuto se reserva antes de pedir hueco en la cola de
+    OpenAI, y el hueco se ocupa mientras dura el stream. El presupuesto de
+    tokens se ajusta con una estimación de lo generado (el stream no incluye 'usage').
+    
+    Yields:
+        Los mismos eventos que generar_respuesta_stream
+    """
+    tokens_prompt = estimar_tokens_mensajes(mensajes, modelo)
+    planificador_openai.verificar_admision(modelo, prioridad, espera_maxima)
+    reserva = await limitador_openai.reservar(modelo, tokens_prompt + max_tokens, espera_maxima)
+    try:
+        async with planificador_openai.turno(modelo, prioridad, espera_maxima=espera_maxima):
+            partes = []
+            inicio = time.perf_counter()
+            try:
+                stream = await client.chat.completions.create(
+                    model=modelo,
+                    messages=mensajes,
+                    max_tokens=max_tokens,
+                    temperature=AI_TEMPERATURE,
+                    stream=True
+                )
+            except Exception as e:
+                ERRORES_EXTERNOS.incrementar("openai", codigo_error(e))
+                limitador_openai.ajustar(reserva, tokens_prompt)
+                raise
+        
+            try:
+                finish_reason = None
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        partes.append(choice.delta.content)
+                        yield {"tipo": "delta", "texto": choice.delta.content}
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+            
+                LATENCIA_ETAPAS.observar(time.perf_counter() - inicio, "openai_stream")
+                respuesta_cortada = finish_reason == "length"
+                tokens_usados = tokens_prompt + estimar_tokens("".join(partes), modelo)
+                TOKENS_USADOS.incrementar(modelo, cantidad=tokens_usados)
+            
+                logger.info(
+                    f"Respuesta en streaming generada. Cortada: {respuesta_cortada}, "
+                    f"Finish reason: {finish_reason}, Tokens estimados: {tokens_usados}"
+                )
+            
+                if clave_cache and partes and finish_reason == "stop":
+                    cache_respuestas.guardar(pregunta, clave_cache, {
+                        "respuesta": "".join(partes),
+                        "respuesta_cortada": False,
+                        "tokens_usados": tokens_usados
+                    })
+            
+                yield {
+                    "tipo": "fin",
+                    "respuesta_cortada": respuesta_cortada,
+                    "finish_reason": finish_reason,
+                    "tokens_usados": tokens_usados
+                }
+            except Exception as e:
+                ERRORES_EXTERNOS.incrementar("openai", codigo_error(e))
+                raise
+            finally:
+                # Liberar la conexión con OpenAI aunque el stream no se haya consumido completo
+                await stream.response.aclose()
+                limitador_openai.ajustar(reserva, tokens_prompt + estimar_tokens("".join(partes), modelo))
+    except BaseException:
+        # Sin hueco en la cola (o cancelada antes de salir): devolver el presupuesto
+        limitador_openai.liberar(reserva)
+        raise
@@ -0,0 +1,234 @@
+"""
+Métricas de la API en formato de texto de Prometheus (/metrics)
+
+Contadores e histogramas en memoria, sin dependencias externas:
+
+- Cada serie (combinación de etiquetas) se crea la primera vez que se usa y
+  después solo se incrementan sus números. Todo se actualiza desde el event
+  loop, así que no hace falta ningún lock; registrar una medición cuesta
+  alrededor de un microsegundo.
+- Los histogramas guardan el conteo de cada bucket sin acumular y la suma
+  acumulada se calcula al exportar, no en cada observación.
+- Los valores que ya cuentan otros módulos (aciertos de las cachés, etc.)
+  se leen al exportar mediante colectores, sin instrumentar su camino.
+"""
+
+import asyncio
+import bisect
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Buckets de latencia en segundos (de 1 ms a 60 s: etapas locales, APIs externas y OpenAI)
+BUCKETS_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Familia de métricas de un colector: (nombre, tipo, ayuda, [(etiquetas, valor)])
+FamiliaMetricas = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+
+class Contador:
+    """Contador monótono con etiquetas"""
+    
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        """
+        Args:
+            nombre: Nombre de la métrica (terminado en _total)
+            ayuda: Descripción para # HELP
+            etiquetas: Nombres de las etiquetas
+        """
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+    
+    def incrementar(self, *valores_etiquetas: str, cantidad: float = 1):
+        """Suma `cantidad` a la serie de esas etiquetas"""
+        self._valores[valores_etiquetas] = self._valores.get(valores_etiquetas, 0) + cantidad
+    
+    def exportar(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for valores, total in sorted(self._valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(total)}")
+        return lineas
+
+
+class _Medicion:
+    """Context manager que observa la duración del bloque en una serie de un histograma"""
+    
+    __slots__ = ("_histograma", "_valores", "_inicio")
+    
+    def __init__(self, histograma: "Histograma", valores: Tuple[str, ...]):
+        self._histograma = histograma
+        self._valores = valores
+    
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+    
+    def __exit__(self, tipo, *_):
+        # Una etapa cancelada (cliente desconectado) no es una duración real
+        if tipo is None or not issubclass(tipo, asyncio.CancelledError):
+            self._histograma.observar(time.perf_counter() - self._inicio, *self._valores)
+        return False
+
+
+class Histograma:
+    """Histograma con buckets fijos y etiquetas"""
+    
+    def __init__(
+        self,
+        nombre: str,
+        ayuda: str,
+        etiquetas: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_LATENCIA
+    ):
+        """
+        Args:
+            nombre: Nombre de la métrica (ej: viajeia_etapa_duracion_segundos)
+            ayuda: Descripción para # HELP
+            etiquetas: Nombres de las etiquetas
+            buckets: Límites superiores de los buckets, en orden creciente (+Inf se agrega solo)
+        """
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        # Serie -> [conteo por bucket (sin acumular) ..., conteo en +Inf, suma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+    
+    def observar(self, valor: float, *valores_etiquetas: str):
+        """Registra una observación en la serie de esas etiquetas"""
+        serie = self._series.get(valores_etiquetas)
+        if serie is None:
+            serie = self._series[valores_etiquetas] = [0] * (len(self.buckets) + 1) + [0.0]
+        serie[bisect.bisect_left(self.buckets, valor)] += 1
+        serie[-1] += valor
+    
+    def medir(self, *valores_etiquetas: str) -> _Medicion:
+        """
+        Mide la duración de un bloque
+        
+        Uso:
+            with LATENCIA_ETAPAS.medir("clima"):
+                info_clima = await obtener_clima_actual(destino)
+        """
+        return _Medicion(self, valores_etiquetas)
+    
+    async def medir_corrutina(self, corrutina: Awaitable[Any], *valores_etiquetas: str) -> Any:
+        """Espera una corrutina midiendo su duración (para medir tareas lanzadas con create_task)"""
+        with self.medir(*valores_etiquetas):
+            return await corrutina
+    
+    def exportar(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in sorted(self._series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), serie):
+                acumulado += conteo
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(serie[-1])}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+class RegistroMetricas:
+    """Métricas propias y colectores que se exportan juntos en /metrics"""
+    
+    def __init__(self):
+        self._metricas: List = []
+        self._colectores: List[Callable[[], Iterable[FamiliaMetricas]]] = []
+    
+    def registrar(self, metrica):
+        """Agrega un Contador o Histograma y lo devuelve"""
+        self._metricas.append(metrica)
+        return metrica
+    
+    def agregar_colector(self, colector: Callable[[], Iterable[FamiliaMetricas]]):
+        """
+        Agrega una función que devuelve métricas calculadas al exportar
+        
+        Args:
+            colector: Función sin argumentos que devuelve familias (nombre, tipo, ayuda, muestras)
+        """
+        self._colectores.append(colector)
+    
+    def exportar(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)"""
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exportar())
+        for colector in self._colectores:
+            for nombre, tipo, ayuda, muestras in colector():
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                for etiquetas, valor in muestras:
+                    lineas.append(f"{nombre}{_etiquetas(list(etiquetas), list(etiquetas.values()))} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+def codigo_error(error: BaseException) -> str:
+    """
+    Código para la etiqueta de un error de un servicio externo
+    
+    Args:
+        error: Excepción de httpx, del SDK de OpenAI o de asyncio
+    
+    Returns:
+        El estado HTTP ("429", "503"...), "timeout" o "conexion"
+    """
+    estado: Optional[int] = getattr(error, "status_code", None)
+    if estado is None and getattr(error, "response", None) is not None:
+        estado = getattr(error.response, "status_code", None)
+    if estado is not None:
+        return str(estado)
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    return "conexion"
+
+
+# Registro global y métricas de la API
+registro = RegistroMetricas()
+
+LATENCIA_ETAPAS = registro.registrar(Histograma(
+    "viajeia_etapa_duracion_segundos",
+    "Duración de cada etapa de una consulta",
+    ["etapa"]
+))
+ERRORES_EXTERNOS = registro.registrar(Contador(
+    "viajeia_errores_externos_total",
+    "Errores de los servicios externos por servicio y código (estado HTTP, timeout o conexion)",
+    ["servicio", "codigo"]
+))
+PROMPTS_RECHAZADOS = registro.registrar(Contador(
+    "viajeia_prompts_rechazados_total",
+    "Preguntas rechazadas por motivo",
+    ["motivo"]
+))
+TOKENS_USADOS = registro.registrar(Contador(
+    "viajeia_tokens_usados_total",
+    "Tokens usados en las llamadas a OpenAI por modelo (estimados en streaming)",
+    ["modelo"]
+))
+PETICIONES_CUBIERTAS = registro.registrar(Contador(
+    "viajeia_peticiones_cubiertas_total",
+    "GETs a servicios externos con segundo intento, por servicio y por intento que respondió primero",
+    ["servicio", "ganador"]
+))
@@ -0,0 +1,121 @@
+"""
+Normalización de texto compartida
+
+Una sola forma canónica del texto para comparar palabras: minúsculas,
+sin acentos ni diacríticos latinos (á, è, ô, ñ, ç, ã, ł, ø, ß...) y con
+espacios simples. La usan security.py, prompt_filter.py, stats.py y las
+cachés, así que todos los módulos comparan el texto de la misma forma.
+
+Todo se hace con str.translate y unicodedata (sin expresiones regulares),
+y el texto ASCII evita la descomposición Unicode.
+"""
+
+import string
+import unicodedata
+
+# Marcas diacríticas combinantes que quedan tras la descomposición NFKD
+_RANGOS_MARCAS = [
+    (0x0300, 0x036F),  # Diacríticos combinantes
+    (0x1AB0, 0x1AFF),  # Diacríticos combinantes extendidos
+    (0x1DC0, 0x1DFF),  # Diacríticos combinantes suplementarios
+    (0x20D0, 0x20FF),  # Diacríticos combinantes para símbolos
+    (0xFE20, 0xFE2F),  # Medias marcas combinantes
+]
+
+# Letras latinas que NFKD no descompone en letra base + marca
+_LETRAS_ESPECIALES = {
+    'ø': 'o', 'Ø': 'O', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
+    'ð': 'd', 'Ð': 'D', 'ħ': 'h', 'Ħ': 'H', 'ı': 'i', 'ŧ': 't', 'Ŧ': 'T',
+    'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'þ': 'th', 'Þ': 'TH'
+}
+
+_TABLA_PLEGADO = {
+    codigo: None
+    for inicio, fin in _RANGOS_MARCAS
+    for codigo in range(inicio, fin + 1)
+}
+_TABLA_PLEGADO.update(str.maketrans(_LETRAS_ESPECIALES))
+
+# Caracteres de control (C0 y C1), incluidos saltos de línea y tabuladores
+_TABLA_CONTROL = dict.fromkeys([*range(0x00, 0x20), *range(0x7F, 0xA0)])
+
+# Puntuación (ASCII y la habitual en español) que se reemplaza por espacios
+_TABLA_PUNTUACION = str.maketrans(dict.fromkeys(string.punctuation + "¿¡«»“”‘’´…–—·", " "))
+
+_LETRAS_LATINAS = frozenset(string.ascii_letters)
+_LETRAS_Y_DIGITOS = frozenset(string.ascii_letters + string.digits)
+
+
+def plegar_acentos(texto: str) -> str:
+    """
+    Quita acentos y diacríticos latinos ("São Paulo" -> "Sao Paulo", "Łódź" -> "Lodz")
+    
+    Args:
+        texto: Texto original
+    
+    Returns:
+        Texto con solo letras base (conserva mayúsculas)
+    """
+    if texto.isascii():
+        return texto
+    return unicodedata.normalize("NFKD", texto).translate(_TABLA_PLEGADO)
+
+
+def normalizar(texto: str, sin_puntuacion: bool = False) -> str:
+    """
+    Forma canónica para comparar texto: minúsculas, sin acentos y con espacios simples
+    
+    Args:
+        texto: Texto a normalizar
+        sin_puntuacion: Reemplazar también la puntuación por espacios
+    
+    Returns:
+        Texto normalizado ("  ¿Qué tal  París? " -> "¿que tal paris?")
+    """
+    if not texto:
+        return ""
+    texto = plegar_acentos(texto.lower())
+    if sin_puntuacion:
+        texto = texto.translate(_TABLA_PUNTUACION)
+    return " ".join(texto.split())
+
+
+def quitar_caracteres_control(texto: str) -> str:
+    """
+    Elimina los caracteres de control (U+0000-U+001F y U+007F-U+009F)
+    
+    Args:
+        texto: Texto original
+    
+    Returns:
+        Texto sin caracteres de control
+    """
+    return texto.translate(_TABLA_CONTROL)
+
+
+def tiene_letras_o_digitos(texto: str) -> bool:
+    """
+    Indica si el texto contiene al menos una letra latina (con o sin acento) o un dígito
+    
+    Args:
+        texto: Texto a verificar
+    
+    Returns:
+        True si hay alguna letra o dígito
+    """
+    return not _LETRAS_Y_DIGITOS.isdisjoint(plegar_acentos(texto))
+
+
+def solo_letras_latinas(texto: str, permitidos: str = "") -> bool:
+    """
+    Indica si el texto contiene solo letras latinas (con o sin acento) y los caracteres permitidos
+    
+    Args:
+        texto: Texto a verificar
+        permitidos: Caracteres adicionales aceptados (por ejemplo " '-")
+    
+    Returns:
+        True si todos los caracteres son válidos
+    """
+    return set(plegar_acentos(texto)) <= _LETRAS_LATINAS.union(permitidos)
+
@@ -6,8 +6,16 @@ para evitar superar los límites de tokens.
 """
 
 import os
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from logger_config import logger
+
+# tiktoken es opcional: sin él se usa una aproximación
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
 # Cargar variables de entorno
 load_dotenv()
@@ -29,52 +37,220 @@ MODEL_TOKEN_LIMITS = {
     "gpt-4o-mini": 128000,
 }
 
-# Tasa de aproximación: aproximadamente 4 caracteres = 1 token (para español)
-# Esto es una estimación, OpenAI usa un tokenizer más sofisticado
-CHARS_PER_TOKEN = 4
+# Límites de uso por minuto de cada modelo: (peticiones, tokens)
+# Valores del tier 1 de OpenAI; se pueden ajustar al tier de la cuenta con
+# OPENAI_LIMITES_POR_MINUTO="gpt-4=500:10000,gpt-4o=5000:800000"
+MODEL_RATE_LIMITS = {
+    "gpt-3.5-turbo": (3500, 200000),
+    "gpt-3.5-turbo-16k": (3500, 200000),
+    "gpt-4": (500, 10000),
+    "gpt-4-turbo": (500, 30000),
+    "gpt-4-turbo-preview": (500, 30000),
+    "gpt-4-32k": (500, 10000),
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+}
+
+
+def _leer_limites_por_minuto(valor: str) -> Dict[str, Tuple[int, int]]:
+    """Interpreta "modelo=rpm:tpm,..." (ignora modelos desconocidos y entradas mal formadas)"""
+    limites = {}
+    for par in valor.split(","):
+        modelo, _, valores = par.partition("=")
+        rpm, _, tpm = valores.partition(":")
+        if modelo.strip() in MODEL_TOKEN_LIMITS and rpm.strip().isdigit() and tpm.strip().isdigit():
+            limites[modelo.strip()] = (int(rpm), int(tpm))
+    return limites
+
+
+MODEL_RATE_LIMITS.update(_leer_limites_por_minuto(os.getenv("OPENAI_LIMITES_POR_MINUTO", "")))
+
+# Fracción de los límites por minuto que se usa, para quedar justo por debajo
+OPENAI_MARGEN_LIMITES = float(os.getenv("OPENAI_MARGEN_LIMITES", "0.9"))
+
+# Contador de tokens: "auto" (tiktoken si está disponible, si no aproximado),
+# "tiktoken" o "aproximado"
+OPENAI_TOKENIZER = os.getenv("OPENAI_TOKENIZER", "auto").lower()
+
+# Carpeta con las codificaciones BPE de tiktoken para usarlas sin conexión
+# (se rellena una vez con TIKTOKEN_CACHE_DIR apuntando a ella, ver GUIA_CONFIGURACION_OPENAI.md)
+OPENAI_TOKENIZER_DIR = os.getenv("OPENAI_TOKENIZER_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "tiktoken"
+)
+
+# Conteos de tokens guardados (el system prompt y el historial se cuentan una sola vez)
+OPENAI_TOKENS_CACHE_MAX = int(os.getenv("OPENAI_TOKENS_CACHE_MAX", "4096"))
+
+# Aproximación sin tokenizer: ~3 bytes UTF-8 por token. Con bytes en lugar de
+# caracteres, las letras acentuadas (2 bytes) y los emojis (4 bytes) cuentan más,
+# como ocurre con el tokenizer real
+BYTES_PER_TOKEN = 3
+
+
+class ContadorTokens:
+    """Interfaz de los contadores de tokens"""
+    
+    nombre = "base"
+    tokens_por_mensaje = 4  # role + separadores de cada mensaje
+    tokens_por_respuesta = 3  # Inicio de la respuesta del asistente
+    
+    def contar(self, texto: str) -> int:
+        """Número de tokens de un texto"""
+        raise NotImplementedError
+
+
+class ContadorAproximado(ContadorTokens):
+    """Estimación por tamaño en bytes, con margen (no necesita dependencias)"""
+    
+    nombre = "aproximado"
+    tokens_por_mensaje = 10
+    tokens_por_respuesta = 0
+    
+    def contar(self, texto: str) -> int:
+        if not texto:
+            return 0
+        return -(-len(texto.encode('utf-8')) // BYTES_PER_TOKEN)
+
+
+class ContadorTiktoken(ContadorTokens):
+    """Conteo exacto con la codificación BPE del modelo (tiktoken)"""
+    
+    def __init__(self, codificacion):
+        self._codificacion = codificacion
+        self.nombre = codificacion.name
+    
+    def contar(self, texto: str) -> int:
+        if not texto:
+            return 0
+        # disallowed_special=(): el texto del usuario puede contener "<|endoftext|>" literal
+        return len(self._codificacion.encode(texto, disallowed_special=()))
+
+
+def _cargar_contador_tiktoken(modelo: str) -> Optional[ContadorTokens]:
+    """Contador tiktoken del modelo o None si tiktoken o su codificación no están disponibles"""
+    if tiktoken is None:
+        return None
+    if os.path.isdir(OPENAI_TOKENIZER_DIR):
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", OPENAI_TOKENIZER_DIR)
+    try:
+        try:
+            codificacion = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            # Modelo que tiktoken no conoce: la codificación de los modelos de chat
+            codificacion = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"No se pudo cargar la codificación de tiktoken para {modelo}: {e}")
+        return None
+    return ContadorTiktoken(codificacion)
+
+
+_contador_aproximado = ContadorAproximado()
+_contadores: Dict[str, ContadorTokens] = {}
+
+
+def obtener_contador_tokens(modelo: Optional[str] = None) -> ContadorTokens:
+    """
+    Contador de tokens de un modelo (se crea una vez y se reutiliza)
+    
+    Args:
+        modelo: Modelo de OpenAI (por defecto, DEFAULT_MODEL)
+        
+    Returns:
+        ContadorTiktoken si OPENAI_TOKENIZER lo permite y la codificación está
+        disponible; si no, ContadorAproximado
+    """
+    modelo = modelo or DEFAULT_MODEL
+    contador = _contadores.get(modelo)
+    if contador is None:
+        if OPENAI_TOKENIZER != "aproximado":
+            contador = _cargar_contador_tiktoken(modelo)
+        if contador is None:
+            if OPENAI_TOKENIZER == "tiktoken":
+                logger.warning(f"Tokenizer tiktoken no disponible para {modelo}, se usa la aproximación")
+            contador = _contador_aproximado
+        _contadores[modelo] = contador
+    return contador
+
+
+def configurar_contador_tokens(contador: ContadorTokens, modelo: Optional[str] = None):
+    """
+    Reemplaza el contador de tokens de un modelo (o de todos si modelo es None)
+    
+    Args:
+        contador: Contador a usar (cualquier subclase de ContadorTokens)
+        modelo: Modelo al que se aplica
+    """
+    for nombre in ([modelo] if modelo else MODEL_TOKEN_LIMITS):
+        _contadores[nombre] = contador
+    _contar_con_cache.cache_clear()
+
 
+@lru_cache(maxsize=OPENAI_TOKENS_CACHE_MAX)
+def _contar_con_cache(contador: ContadorTokens, texto: str) -> int:
+    return contador.contar(texto)
 
-def estimar_tokens(texto: str) -> int:
+
+def estimar_tokens(texto: str, modelo: Optional[str] = None) -> int:
     """
-    Estima el número de tokens en un texto.
+    Cuenta los tokens de un texto.
     
-    Nota: Esta es una estimación aproximada. OpenAI usa un tokenizer más sofisticado,
-    pero esta aproximación es suficiente para limitar el historial.
+    Usa el tokenizer del modelo si está disponible (ver obtener_contador_tokens).
+    Los conteos se guardan en una caché LRU, así que un mismo texto (el system
+    prompt, los mensajes del historial) solo se tokeniza una vez.
     
     Args:
-        texto: Texto a estimar
+        texto: Texto a contar
+        modelo: Modelo de OpenAI (por defecto, DEFAULT_MODEL)
         
     Returns:
-        Número estimado de tokens
+        Número de tokens (exacto con tiktoken, estimado con margen sin él)
     """
     if not texto:
         return 0
-    
-    # Aproximación: 4 caracteres = 1 token (más preciso para español/inglés)
-    # Agregamos un pequeño buffer para ser conservadores
-    return len(texto) // CHARS_PER_TOKEN + 10  # +10 como buffer
+    return _contar_con_cache(obtener_contador_tokens(modelo), texto)
 
 
-def estimar_tokens_mensajes(mensajes: List[Dict[str, str]]) -> int:
+def _tokens_mensaje(contador: ContadorTokens, mensaje: Dict[str, str]) -> int:
+    """Tokens de un mensaje: overhead (role + estructura) más el contenido"""
+    contenido = mensaje.get("content", "")
+    if not contenido:
+        return contador.tokens_por_mensaje
+    return contador.tokens_por_mensaje + _contar_con_cache(contador, contenido)
+
+
+def estimar_tokens_mensajes(mensajes: List[Dict[str, str]], modelo: Optional[str] = None) -> int:
     """
-    Estima el número total de tokens en una lista de mensajes.
+    Cuenta el número total de tokens de una lista de mensajes.
     
     Args:
         mensajes: Lista de mensajes en formato OpenAI (con 'role' y 'content')
+        modelo: Modelo de OpenAI (por defecto, DEFAULT_MODEL)
         
     Returns:
-        Número total estimado de tokens
+        Número total de tokens, incluido el overhead de cada mensaje
+    """
+    if not mensajes:
+        return 0
+    contador = obtener_contador_tokens(modelo)
+    
+    return contador.tokens_por_respuesta + sum(_tokens_mensaje(contador, mensaje) for mensaje in mensajes)
+
+
+def estimar_tokens_mensaje(mensaje: Dict[str, str], modelo: Optional[str] = None) -> int:
     """
-    total_tokens = 0
+    Cuenta los tokens de un solo mensaje, sin el inicio de la respuesta.
     
-    for mensaje in mensajes:
-        # Cada mensaje tiene overhead: role + estructura JSON (~10 tokens)
-        total_tokens += 10
-        # Contar tokens del contenido
-        contenido = mensaje.get("content", "")
-        total_tokens += estimar_tokens(contenido)
+    La suma de varios mensajes más contador.tokens_por_respuesta es lo que
+    devuelve estimar_tokens_mensajes sobre todos ellos.
     
-    return total_tokens
+    Args:
+        mensaje: Mensaje en formato OpenAI (con 'role' y 'content')
+        modelo: Modelo de OpenAI (por defecto, DEFAULT_MODEL)
+        
+    Returns:
+        Tokens del mensaje, incluido su overhead
+    """
+    return _tokens_mensaje(obtener_contador_tokens(modelo), mensaje)
 
 
 def limitar_historial_por_tokens(
@@ -82,7 +258,7 @@ def limitar_historial_por_tokens(
     modelo: str = DEFAULT_MODEL,
     max_tokens_respuesta: int = DEFAULT_MAX_TOKENS,
     reservar_tokens_sistema: int = 500  # Tokens para system message y overhead
-) -> List[Dict[str, str]]:
+) -> Tuple[List[Dict[str, str]], int]:
     """
     Limita el historial de mensajes para que no supere el límite de tokens del modelo.
     
@@ -91,7 +267,10 @@ def limitar_historial_por_tokens(
     - El mensaje del usuario más reciente
     
     Luego agrega mensajes anteriores desde el más reciente hasta el más antiguo,
-    hasta que se alcance el límite.
+    hasta que se alcance el límite. Es una sola pasada hacia atrás que se
+    detiene en el primer mensaje que no cabe: los mensajes más antiguos ni
+    siquiera se cuentan, así que el costo depende de lo que cabe en el
+    contexto y no del largo del historial.
     
     Args:
         mensajes: Lista completa de mensajes (puede incluir system, user, assistant)
@@ -100,10 +279,11 @@ def limitar_historial_por_tokens(
         reservar_tokens_sistema: Tokens a reservar para system message y overhead
         
     Returns:
-        Lista de mensajes limitada que cabe dentro del límite de tokens
+        Tupla (mensajes_limitados, tokens) con la lista que cabe dentro del
+        límite y sus tokens (lo mismo que estimar_tokens_mensajes sobre ella)
     """
     if not mensajes:
-        return []
+        return [], 0
     
     # Obtener límite de tokens del modelo
     max_context_tokens = MODEL_TOKEN_LIMITS.get(modelo, 4096)
@@ -114,51 +294,41 @@ def limitar_historial_por_tokens(
     
     if tokens_disponibles < 0:
         # Si el límite es muy bajo, solo devolver el último mensaje
-        return mensajes[-1:] if mensajes else []
+        return mensajes[-1:], estimar_tokens_mensajes(mensajes[-1:], modelo)
     
-    # Separar mensaje del sistema (si existe) y otros mensajes
-    mensaje_sistema = None
-    otros_mensajes = []
+    contador = obtener_contador_tokens(modelo)
     
-    for mensaje in mensajes:
-        if mensaje.get("role") == "system":
-            mensaje_sistema = mensaje
-        else:
-            otros_mensajes.append(mensaje)
-    
-    # Si no hay otros mensajes, devolver solo el sistema
-    if not otros_mensajes:
-        return [mensaje_sistema] if mensaje_sistema else []
-    
-    # Asegurarnos de tener al menos el último mensaje del usuario
-    mensajes_limitados = []
-    
-    # Agregar mensaje del sistema primero (si existe)
+    # El mensaje del sistema (el último si hay varios) siempre se incluye
+    mensaje_sistema = next((m for m in reversed(mensajes) if m.get("role") == "system"), None)
+    tokens_usados = contador.tokens_por_respuesta
     if mensaje_sistema:
-        mensajes_limitados.append(mensaje_sistema)
-        tokens_usados = estimar_tokens_mensajes(mensajes_limitados)
-    else:
-        tokens_usados = 0
-    
-    # Agregar mensajes desde el más reciente hasta el más antiguo
-    # hasta alcanzar el límite
-    for mensaje in reversed(otros_mensajes):
-        tokens_mensaje = estimar_tokens_mensajes([mensaje])
-        
-        if tokens_usados + tokens_mensaje <= tokens_disponibles:
-            # Insertar al principio (para mantener orden cronológico)
-            mensajes_limitados.insert(1 if mensaje_sistema else 0, mensaje)
-            tokens_usados += tokens_mensaje
-        else:
+        tokens_usados += _tokens_mensaje(contador, mensaje_sistema)
+    
+    # Recorrer desde el más reciente; se agregan al final y se invierten una sola vez
+    seleccionados = []
+    mas_reciente = None
+    tokens_mas_reciente = 0
+    for mensaje in reversed(mensajes):
+        if mensaje.get("role") == "system":
+            continue
+        tokens_mensaje = _tokens_mensaje(contador, mensaje)
+        if mas_reciente is None:
+            mas_reciente, tokens_mas_reciente = mensaje, tokens_mensaje
+        if tokens_usados + tokens_mensaje > tokens_disponibles:
             # Si este mensaje no cabe, detener (ya tenemos los más recientes)
             break
+        seleccionados.append(mensaje)
+        tokens_usados += tokens_mensaje
     
-    # Si no pudimos agregar ningún mensaje (excepto system), al menos agregar el último
-    if len(mensajes_limitados) == (1 if mensaje_sistema else 0) and otros_mensajes:
-        # Agregar solo el último mensaje del usuario
-        mensajes_limitados.append(otros_mensajes[-1])
+    # Si no cupo ninguno, al menos el último mensaje del usuario
+    if not seleccionados and mas_reciente is not None:
+        seleccionados.append(mas_reciente)
+        tokens_usados += tokens_mas_reciente
     
-    return mensajes_limitados
+    seleccionados.reverse()
+    if mensaje_sistema:
+        seleccionados.insert(0, mensaje_sistema)
+    return seleccionados, tokens_usados
 
 
 def obtener_configuracion_openai(
@@ -185,7 +355,8 @@ def obtener_configuracion_openai(
 def validar_configuracion(
     modelo: str,
     max_tokens: int,
-    historial: Optional[List[Dict[str, str]]] = None
+    historial: Optional[List[Dict[str, str]]] = None,
+    tokens_historial: Optional[int] = None
 ) -> tuple[bool, Optional[str]]:
     """
     Valida que la configuración sea válida antes de hacer la llamada a OpenAI.
@@ -194,6 +365,7 @@ def validar_configuracion(
         modelo: Modelo a usar
         max_tokens: Máximo de tokens para la respuesta
         historial: Historial de mensajes (opcional)
+        tokens_historial: Tokens del historial si ya se contaron (ej: los de limitar_historial_por_tokens)
         
     Returns:
         Tupla (es_valido, mensaje_error)
@@ -213,7 +385,8 @@ def validar_configuracion(
     
     # Validar historial si se proporciona
     if historial:
-        tokens_historial = estimar_tokens_mensajes(historial)
+        if tokens_historial is None:
+            tokens_historial = estimar_tokens_mensajes(historial, modelo)
         tokens_totales = tokens_historial + max_tokens
         
         if tokens_totales > max_context:
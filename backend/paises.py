@@ -0,0 +1,92 @@
+"""
+Moneda y zona horaria de cada país, sin consultas externas
+
+Las tablas se cargan una sola vez al importar el módulo desde data/paises.tsv
+(todos los países ISO 3166-1 con su moneda ISO 4217 y su zona horaria IANA) y
+data/monedas.tsv (nombre en español de cada moneda), y quedan congeladas
+(solo lectura). Todas las búsquedas son O(1).
+
+El desfase respecto a UTC se calcula con zoneinfo para el momento actual,
+así que incluye el horario de verano.
+"""
+
+import os
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+_DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def _leer_tabla(nombre_archivo: str) -> List[List[str]]:
+    """Lee un archivo TSV de data/ (ignora comentarios y líneas vacías)"""
+    with open(os.path.join(_DIRECTORIO_DATOS, nombre_archivo), 'r', encoding='utf-8') as f:
+        return [
+            linea.rstrip('\n').split('\t')
+            for linea in f
+            if linea.strip() and not linea.startswith('#')
+        ]
+
+
+_PAISES = _leer_tabla("paises.tsv")
+
+# País (ISO 3166-1 alfa-2) -> código de moneda (ISO 4217)
+MONEDA_POR_PAIS: Mapping[str, str] = MappingProxyType({pais: moneda for pais, moneda, _ in _PAISES})
+
+# País -> zona horaria IANA (solo países con una zona o una zona principal clara)
+ZONA_HORARIA_POR_PAIS: Mapping[str, str] = MappingProxyType({pais: zona for pais, _, zona in _PAISES if zona})
+
+# Código de moneda -> nombre en español
+NOMBRE_MONEDA: Mapping[str, str] = MappingProxyType(dict(_leer_tabla("monedas.tsv")))
+
+del _PAISES
+
+
+def obtener_moneda(pais: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Obtiene la moneda de un país
+    
+    Args:
+        pais: Código ISO 3166-1 alfa-2 (ej: "FR", "mx")
+    
+    Returns:
+        Tupla (codigo_moneda, nombre_moneda) o (None, None) si el país no existe
+    """
+    codigo = MONEDA_POR_PAIS.get((pais or "").upper())
+    if not codigo:
+        return None, None
+    return codigo, NOMBRE_MONEDA.get(codigo, codigo)
+
+
+def zona_horaria(pais: str, zona_ciudad: str = "") -> Optional[str]:
+    """
+    Zona horaria IANA de un destino
+    
+    Args:
+        pais: Código ISO 3166-1 alfa-2
+        zona_ciudad: Zona de la ciudad, si se conoce (necesaria en países con varias zonas)
+    
+    Returns:
+        Zona IANA (ej: "Europe/Madrid") o None si no se puede determinar
+    """
+    return zona_ciudad or ZONA_HORARIA_POR_PAIS.get((pais or "").upper())
+
+
+def desfase_utc(zona: str, momento: Optional[datetime] = None) -> Optional[int]:
+    """
+    Desfase de una zona horaria respecto a UTC (con horario de verano)
+    
+    Args:
+        zona: Zona IANA (ej: "America/New_York")
+        momento: Instante para el que se calcula (por defecto, ahora)
+    
+    Returns:
+        Desfase en segundos o None si la zona no existe en la base de zonas horarias
+    """
+    try:
+        zona_info = ZoneInfo(zona)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    momento = momento or datetime.now(timezone.utc)
+    return int(momento.astimezone(zona_info).utcoffset().total_seconds())
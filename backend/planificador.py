@@ -0,0 +1,241 @@
+"""
+Control de admisión para las llamadas a OpenAI
+
+Limita cuántas llamadas hay en curso a la vez por modelo. Las que no caben
+esperan en una cola acotada, ordenada por prioridad (primero las consultas
+interactivas, después las de segundo plano) y por orden de llegada.
+
+Si la espera estimada supera lo que el cliente está dispuesto a esperar, o
+la cola está llena, la petición se rechaza de inmediato con ServicioSaturado
+(la API responde 503 con Retry-After) en lugar de acumularse hasta que
+OpenAI empiece a rechazarlas todas a la vez.
+
+La espera estimada sale de la duración media de las llamadas recientes
+(media móvil exponencial) y del número de peticiones por delante en la cola.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+# Prioridades (menor número = se atiende antes)
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_SEGUNDO_PLANO = 1
+
+# Peso de la última muestra en las medias móviles
+_PESO_MUESTRA = 0.2
+
+
+class ServicioSaturado(Exception):
+    """No hay capacidad para atender la llamada a tiempo"""
+    
+    def __init__(self, mensaje: str, reintentar_en: int):
+        """
+        Args:
+            mensaje: Motivo del rechazo
+            reintentar_en: Segundos recomendados antes de reintentar (para Retry-After)
+        """
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class _ColaModelo:
+    """Llamadas en curso y en espera de un modelo"""
+    
+    def __init__(self, limite: int):
+        self.limite = limite
+        self.en_curso = 0
+        # Montículo de [prioridad, orden de llegada, futuro]; los futuros ya resueltos se descartan al sacarlos
+        self.espera: List[list] = []
+        self.esperando = 0
+        self.duracion_media: Optional[float] = None
+        self.espera_media = 0.0
+        self.espera_maxima = 0.0
+        self.admitidas = 0
+        self.encoladas = 0
+        self.rechazadas = 0
+        self.vencidas = 0
+    
+    def espera_estimada(self, prioridad: int) -> float:
+        """Segundos que esperaría una llamada nueva con esta prioridad"""
+        if self.en_curso < self.limite and not self.esperando:
+            return 0.0
+        if self.duracion_media is None:
+            # Sin llamadas terminadas todavía no hay con qué estimar
+            return 0.0
+        por_delante = sum(1 for p, _, futuro in self.espera if p <= prioridad and not futuro.done())
+        return math.ceil((por_delante + 1) / self.limite) * self.duracion_media
+    
+    def registrar_espera(self, segundos: float):
+        self.espera_media += _PESO_MUESTRA * (segundos - self.espera_media)
+        self.espera_maxima = max(self.espera_maxima, segundos)
+    
+    def registrar_duracion(self, segundos: float):
+        if self.duracion_media is None:
+            self.duracion_media = segundos
+        else:
+            self.duracion_media += _PESO_MUESTRA * (segundos - self.duracion_media)
+
+
+class PlanificadorLlamadas:
+    """Limita la concurrencia por modelo con una cola de prioridad acotada"""
+    
+    def __init__(
+        self,
+        nombre: str,
+        max_concurrentes: int,
+        max_cola: int,
+        limites_por_modelo: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            nombre: Nombre del planificador (para estadísticas)
+            max_concurrentes: Llamadas simultáneas por modelo (si el modelo no tiene límite propio)
+            max_cola: Llamadas en espera por modelo antes de rechazar
+            limites_por_modelo: Llamadas simultáneas para modelos concretos
+        """
+        self.nombre = nombre
+        self.max_concurrentes = max_concurrentes
+        self.max_cola = max_cola
+        self.limites_por_modelo = dict(limites_por_modelo or {})
+        self._colas: Dict[str, _ColaModelo] = {}
+        self._orden = itertools.count()
+    
+    def _cola(self, modelo: str) -> _ColaModelo:
+        cola = self._colas.get(modelo)
+        if cola is None:
+            limite = max(1, self.limites_por_modelo.get(modelo, self.max_concurrentes))
+            cola = self._colas[modelo] = _ColaModelo(limite)
+        return cola
+    
+    def verificar_admision(
+        self,
+        modelo: str,
+        prioridad: int = PRIORIDAD_INTERACTIVA,
+        espera_maxima: Optional[float] = None
+    ):
+        """
+        Rechaza de antemano una llamada que no se podría atender a tiempo
+        
+        Args:
+            modelo: Modelo de OpenAI
+            prioridad: PRIORIDAD_INTERACTIVA o PRIORIDAD_SEGUNDO_PLANO
+            espera_maxima: Segundos que el cliente está dispuesto a esperar en la cola (None = sin límite)
+        
+        Raises:
+            ServicioSaturado: Si la cola está llena o la espera estimada supera espera_maxima
+        """
+        cola = self._cola(modelo)
+        if cola.en_curso < cola.limite and not cola.esperando:
+            return
+        estimada = cola.espera_estimada(prioridad)
+        reintentar_en = max(1, math.ceil(estimada or cola.duracion_media or 1))
+        if cola.esperando >= self.max_cola:
+            cola.rechazadas += 1
+            raise ServicioSaturado(f"Cola de {modelo} llena ({cola.esperando} en espera)", reintentar_en)
+        if espera_maxima is not None and estimada > espera_maxima:
+            cola.rechazadas += 1
+            raise ServicioSaturado(
+                f"Espera estimada para {modelo} de {estimada:.1f}s (máximo {espera_maxima:.1f}s)",
+                reintentar_en
+            )
+    
+    @asynccontextmanager
+    async def turno(
+        self,
+        modelo: str,
+        prioridad: int = PRIORIDAD_INTERACTIVA,
+        espera_maxima: Optional[float] = None
+    ) -> AsyncIterator[None]:
+        """
+        Espera un hueco para llamar al modelo y lo ocupa mientras dura el bloque
+        
+        Uso:
+            async with planificador.turno("gpt-4"):
+                respuesta = await client.chat.completions.create(...)
+        
+        Args:
+            modelo: Modelo de OpenAI
+            prioridad: PRIORIDAD_INTERACTIVA o PRIORIDAD_SEGUNDO_PLANO
+            espera_maxima: Segundos máximos en la cola (None = sin límite)
+        
+        Raises:
+            ServicioSaturado: Si se rechaza de antemano o vence espera_maxima en la cola
+        """
+        cola = self._cola(modelo)
+        self.verificar_admision(modelo, prioridad, espera_maxima)
+        
+        inicio = time.monotonic()
+        if cola.en_curso < cola.limite and not cola.esperando:
+            cola.en_curso += 1
+        else:
+            if len(cola.espera) > 2 * self.max_cola:
+                # Purgar los futuros descartados que se acumulan al vencer o cancelar esperas
+                cola.espera = [entrada for entrada in cola.espera if not entrada[2].done()]
+                heapq.heapify(cola.espera)
+            futuro = asyncio.get_running_loop().create_future()
+            heapq.heappush(cola.espera, [prioridad, next(self._orden), futuro])
+            cola.esperando += 1
+            cola.encoladas += 1
+            try:
+                await asyncio.wait_for(futuro, espera_maxima)
+            except asyncio.TimeoutError:
+                if futuro.done() and not futuro.cancelled():
+                    # El hueco llegó justo al vencer la espera: devolverlo
+                    self._liberar(cola)
+                cola.vencidas += 1
+                raise ServicioSaturado(
+                    f"Sin hueco para {modelo} tras {espera_maxima:.1f}s en la cola",
+                    max(1, math.ceil(cola.duracion_media or 1))
+                )
+            except asyncio.CancelledError:
+                if futuro.done() and not futuro.cancelled():
+                    self._liberar(cola)
+                raise
+            finally:
+                if not futuro.done() or futuro.cancelled():
+                    # Salió de la cola sin hueco (el futuro queda descartado en el montículo)
+                    cola.esperando -= 1
+        
+        cola.admitidas += 1
+        cola.registrar_espera(time.monotonic() - inicio)
+        inicio_llamada = time.monotonic()
+        try:
+            yield
+        finally:
+            cola.registrar_duracion(time.monotonic() - inicio_llamada)
+            self._liberar(cola)
+    
+    @staticmethod
+    def _liberar(cola: _ColaModelo):
+        """Pasa el hueco al siguiente en la cola o lo deja libre"""
+        while cola.espera:
+            _, _, futuro = heapq.heappop(cola.espera)
+            if not futuro.done():
+                cola.esperando -= 1
+                futuro.set_result(None)
+                return
+        cola.en_curso -= 1
+    
+    def estadisticas(self) -> Dict[str, Dict[str, float]]:
+        """Profundidad de la cola, tiempos de espera y contadores por modelo"""
+        return {
+            modelo: {
+                "en_curso": cola.en_curso,
+                "limite": cola.limite,
+                "en_cola": cola.esperando,
+                "max_cola": self.max_cola,
+                "espera_media_ms": round(cola.espera_media * 1000, 1),
+                "espera_maxima_ms": round(cola.espera_maxima * 1000, 1),
+                "duracion_media_ms": round((cola.duracion_media or 0) * 1000, 1),
+                "admitidas": cola.admitidas,
+                "encoladas": cola.encoladas,
+                "rechazadas": cola.rechazadas,
+                "vencidas": cola.vencidas
+            }
+            for modelo, cola in self._colas.items()
+        }
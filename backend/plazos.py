@@ -0,0 +1,164 @@
+"""
+Plazo (presupuesto de tiempo) de cada consulta
+
+El endpoint crea un Plazo al recibir la consulta y lo pasa a cada etapa:
+
+- Las etapas opcionales (clima, fotos) reciben como timeout lo que queda
+  del plazo, sin pasar de su propio timeout, y se omiten si ya no queda
+  tiempo suficiente: la respuesta sale sin ese dato. Al timeout propio se
+  le suma PLAZO_MARGEN_TRANSPORTE para que venza antes el de httpx y el
+  circuit breaker del servicio cuente el error.
+- El clima, que va antes de ChatGPT, deja libre una reserva para el modelo.
+- La espera en la cola de OpenAI y la respuesta del modelo se acotan con lo
+  que queda; al vencer el plazo se lanza PlazoAgotado (la API responde 504).
+- Si el cliente se desconecta, la consulta se cancela con todas sus
+  llamadas en curso (ejecutar_con_plazo).
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from logger_config import logger
+
+# Importar constantes de configuración
+try:
+    from config import PLAZO_MINIMO_OPCIONAL, PLAZO_MARGEN_TRANSPORTE
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    PLAZO_MINIMO_OPCIONAL = 1.0
+    PLAZO_MARGEN_TRANSPORTE = 0.5
+
+T = TypeVar("T")
+
+
+class PlazoAgotado(Exception):
+    """La consulta superó su plazo"""
+
+
+class ClienteDesconectado(Exception):
+    """El cliente cerró la conexión antes de recibir la respuesta"""
+
+
+class Plazo:
+    """Momento límite de una consulta y el tiempo que le queda"""
+    
+    def __init__(self, segundos: float):
+        """
+        Args:
+            segundos: Presupuesto total de la consulta
+        """
+        self.segundos = segundos
+        self.vence = time.monotonic() + segundos
+    
+    def restante(self) -> float:
+        """Segundos que quedan (0 si ya venció)"""
+        return max(0.0, self.vence - time.monotonic())
+    
+    @property
+    def vencido(self) -> bool:
+        return time.monotonic() >= self.vence
+    
+    def limitar(self, timeout: Optional[float] = None, reserva: float = 0.0) -> float:
+        """
+        Timeout de una etapa: lo que queda del plazo sin pasar del propio de la etapa
+        
+        Args:
+            timeout: Timeout propio de la etapa (None = sin límite propio)
+            reserva: Segundos que deben quedar libres para las etapas siguientes
+        
+        Returns:
+            Segundos disponibles para la etapa (0 si no queda nada)
+        """
+        disponible = max(0.0, self.restante() - reserva)
+        return disponible if timeout is None else min(timeout, disponible)
+    
+    async def cumplir(self, corrutina: Awaitable[T], etapa: str) -> T:
+        """
+        Espera una etapa obligatoria dentro de lo que queda del plazo
+        
+        Args:
+            corrutina: Etapa a esperar
+            etapa: Nombre de la etapa (para el error)
+        
+        Raises:
+            PlazoAgotado: Si el plazo vence antes de que termine (la etapa se cancela)
+        """
+        try:
+            return await asyncio.wait_for(corrutina, self.restante())
+        except asyncio.TimeoutError:
+            raise PlazoAgotado(f"Plazo de {self.segundos:g}s agotado en la etapa {etapa}")
+    
+    async def opcional(
+        self,
+        funcion: Callable[[], Awaitable[T]],
+        etapa: str,
+        timeout: Optional[float] = None,
+        reserva: float = 0.0
+    ) -> Optional[T]:
+        """
+        Espera una etapa opcional; si no hay tiempo suficiente o se agota, devuelve None
+        
+        Args:
+            funcion: Función sin argumentos que lanza la etapa (no se llama si se omite)
+            etapa: Nombre de la etapa (para el log)
+            timeout: Timeout propio de la etapa (el de su cliente HTTP)
+            reserva: Segundos que deben quedar libres para las etapas siguientes
+        
+        Returns:
+            El resultado de la etapa o None si se omitió o no terminó a tiempo
+        """
+        # Con tiempo de sobra, que corte el timeout del cliente HTTP y no la cancelación
+        limite = self.limitar(None if timeout is None else timeout + PLAZO_MARGEN_TRANSPORTE, reserva)
+        if limite < PLAZO_MINIMO_OPCIONAL:
+            logger.info(f"Etapa {etapa} omitida: quedan {self.restante():.1f}s del plazo")
+            return None
+        try:
+            return await asyncio.wait_for(funcion(), limite)
+        except asyncio.TimeoutError:
+            logger.info(f"Etapa {etapa} sin terminar en {limite:.1f}s, se responde sin ella")
+            return None
+
+
+async def _esperar_desconexion(request) -> None:
+    """Termina cuando el cliente cierra la conexión (el cuerpo de la petición ya se leyó)"""
+    while True:
+        mensaje = await request.receive()
+        if mensaje["type"] == "http.disconnect":
+            return
+
+
+async def ejecutar_con_plazo(corrutina: Awaitable[T], plazo: Plazo, request=None) -> T:
+    """
+    Ejecuta la atención de una consulta con su plazo y la cancela si el cliente se va
+    
+    Al cancelarla se ejecutan sus bloques finally (que cancelan las tareas de
+    clima, fotos y OpenAI) antes de volver.
+    
+    Args:
+        corrutina: Atención completa de la consulta
+        plazo: Plazo de la consulta
+        request: Petición de Starlette/FastAPI (None = no vigilar la desconexión)
+    
+    Returns:
+        El resultado de la corrutina
+    
+    Raises:
+        PlazoAgotado: Si el plazo vence antes de terminar
+        ClienteDesconectado: Si el cliente se desconecta antes de terminar
+    """
+    tarea = asyncio.ensure_future(corrutina)
+    vigia = asyncio.ensure_future(_esperar_desconexion(request)) if request is not None else None
+    try:
+        esperadas = [tarea] if vigia is None else [tarea, vigia]
+        hechas, _ = await asyncio.wait(esperadas, timeout=plazo.restante(), return_when=asyncio.FIRST_COMPLETED)
+        if tarea in hechas:
+            return tarea.result()
+        if vigia is not None and vigia in hechas:
+            raise ClienteDesconectado("Cliente desconectado")
+        raise PlazoAgotado(f"Plazo de {plazo.segundos:g}s agotado")
+    finally:
+        if vigia is not None:
+            vigia.cancel()
+        if not tarea.done():
+            tarea.cancel()
+            await asyncio.gather(tarea, return_exceptions=True)
@@ -6,6 +6,7 @@ Protege el asistente contra prompts maliciosos o fuera de contexto
 
 import re
 from typing import Tuple, List, Optional
+from normalizacion import normalizar, quitar_caracteres_control
 
 # Importar constantes de configuración
 try:
@@ -112,9 +113,55 @@ PALABRAS_VIAJES = [
     'país', 'country', 'continente', 'continent'
 ]
 
+# Indicadores de que la pregunta es claramente sobre otro tema
+INDICADORES_NO_VIAJES = [
+    'programming', 'código', 'code', 'software', 'aplicación',
+    'matemáticas', 'mathematics', 'física', 'physics',
+    'historia del mundo', 'world history', 'política', 'politics',
+    'medicina', 'medicine', 'salud', 'health', 'enfermedad'
+]
+
+def _compilar_alternativas(frases: List[str], palabras_completas: bool = False) -> re.Pattern:
+    """
+    Compila una lista de frases en un único patrón de alternativas
+    
+    Args:
+        frases: Frases a buscar
+        palabras_completas: Exigir límites de palabra (\\b) en cada frase
+        
+    Returns:
+        Patrón compilado sobre las frases normalizadas (las más largas se prueban primero)
+    """
+    alternativas = sorted({normalizar(frase) for frase in frases}, key=len, reverse=True)
+    if palabras_completas:
+        patron = "|".join(r'\b' + re.escape(frase) + r'\b' for frase in alternativas)
+        # Búsqueda anticipada de ancho cero: se prueba cada posición del texto,
+        # así también se detectan frases que se solapan
+        return re.compile(f"(?=({patron}))")
+    return re.compile("|".join(re.escape(frase) for frase in alternativas))
+
+# Patrones compilados una sola vez al importar el módulo
+_PATRON_PELIGROSAS = _compilar_alternativas(PALABRAS_PELIGROSAS, palabras_completas=True)
+_PATRON_VIAJES = _compilar_alternativas(PALABRAS_VIAJES)
+_PATRON_NO_VIAJES = _compilar_alternativas(INDICADORES_NO_VIAJES)
+
+_FRASE_PELIGROSA_POR_TEXTO = {normalizar(palabra): palabra for palabra in reversed(PALABRAS_PELIGROSAS)}
+
+# Frases peligrosas que coinciden siempre que coincide otra más larga que empieza
+# igual (por ejemplo 'act as' dentro de 'act as if'). Como el patrón solo devuelve
+# la más larga en cada posición, estas se añaden a partir de esta tabla.
+_PREFIJOS_PELIGROSOS = {
+    palabra: [
+        otra for otra in PALABRAS_PELIGROSAS
+        if len(otra) < len(palabra)
+        and re.match(r'\b' + re.escape(normalizar(otra)) + r'\b', normalizar(palabra))
+    ]
+    for palabra in PALABRAS_PELIGROSAS
+}
+
 def normalizar_texto(texto: str) -> str:
     """
-    Normaliza el texto para comparación (minúsculas, sin acentos básicos)
+    Normaliza el texto para comparación (minúsculas, sin acentos y con espacios simples)
     
     Args:
         texto: Texto a normalizar
@@ -122,50 +169,42 @@ def normalizar_texto(texto: str) -> str:
     Returns:
         Texto normalizado
     """
-    if not texto:
-        return ""
-    
-    texto = texto.lower().strip()
-    
-    # Reemplazar caracteres especiales comunes
-    reemplazos = {
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'ñ': 'n', 'ü': 'u'
-    }
-    
-    for original, reemplazo in reemplazos.items():
-        texto = texto.replace(original, reemplazo)
-    
-    return texto
+    return normalizar(texto)
 
-def detectar_palabras_peligrosas(texto: str) -> List[str]:
+def detectar_palabras_peligrosas(texto: str, texto_normalizado: Optional[str] = None) -> List[str]:
     """
     Detecta palabras o frases peligrosas en el texto
     
     Args:
         texto: Texto a analizar
+        texto_normalizado: normalizar_texto(texto), si ya se calculó
         
     Returns:
         Lista de palabras peligrosas encontradas
     """
-    texto_normalizado = normalizar_texto(texto)
-    palabras_encontradas = []
-    
-    for palabra_peligrosa in PALABRAS_PELIGROSAS:
-        # Buscar la palabra completa (no solo como substring)
-        # Usar regex para buscar palabras completas
-        pattern = r'\b' + re.escape(palabra_peligrosa.lower()) + r'\b'
-        if re.search(pattern, texto_normalizado, re.IGNORECASE):
-            palabras_encontradas.append(palabra_peligrosa)
-    
-    return palabras_encontradas
+    if texto_normalizado is None:
+        texto_normalizado = normalizar_texto(texto)
+    encontradas = set()
+    
+    # Una sola pasada: en cada posición el patrón devuelve la frase más larga que
+    # coincide como palabra completa; las frases contenidas en ella se añaden aparte
+    for coincidencia in _PATRON_PELIGROSAS.finditer(texto_normalizado):
+        frase = _FRASE_PELIGROSA_POR_TEXTO[coincidencia.group(1)]
+        encontradas.add(frase)
+        encontradas.update(_PREFIJOS_PELIGROSOS[frase])
+    
+    if not encontradas:
+        return []
+    # Mantener el orden de PALABRAS_PELIGROSAS
+    return [palabra for palabra in PALABRAS_PELIGROSAS if palabra in encontradas]
 
-def es_sobre_viajes(texto: str) -> Tuple[bool, Optional[str]]:
+def es_sobre_viajes(texto: str, texto_normalizado: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Verifica si el texto es sobre viajes
     
     Args:
         texto: Texto a verificar
+        texto_normalizado: normalizar_texto(texto), si ya se calculó
         
     Returns:
         Tupla (es_sobre_viajes, razon_si_no)
@@ -173,29 +212,18 @@ def es_sobre_viajes(texto: str) -> Tuple[bool, Optional[str]]:
     if not texto or len(texto.strip()) < 10:
         return False, "El texto es muy corto para determinar el tema"
     
-    texto_normalizado = normalizar_texto(texto)
-    
-    # Contar cuántas palabras relacionadas con viajes aparecen
-    coincidencias = 0
-    for palabra_viaje in PALABRAS_VIAJES:
-        if palabra_viaje.lower() in texto_normalizado:
-            coincidencias += 1
+    if texto_normalizado is None:
+        texto_normalizado = normalizar_texto(texto)
     
     # Si hay al menos 1 palabra relacionada con viajes, probablemente es sobre viajes
-    if coincidencias >= 1:
+    if _PATRON_VIAJES.search(texto_normalizado):
         return True, None
     
     # Si no hay palabras de viajes, verificar si es claramente sobre otra cosa
-    indicadores_no_viajes = [
-        'programming', 'código', 'code', 'software', 'aplicación',
-        'matemáticas', 'mathematics', 'física', 'physics',
-        'historia del mundo', 'world history', 'política', 'politics',
-        'medicina', 'medicine', 'salud', 'health', 'enfermedad'
-    ]
-    
-    for indicador in indicadores_no_viajes:
-        if indicador.lower() in texto_normalizado:
-            return False, f"Esta pregunta parece ser sobre '{indicador}', no sobre viajes"
+    if _PATRON_NO_VIAJES.search(texto_normalizado):
+        for indicador in INDICADORES_NO_VIAJES:
+            if normalizar_texto(indicador) in texto_normalizado:
+                return False, f"Esta pregunta parece ser sobre '{indicador}', no sobre viajes"
     
     # Si no hay indicadores claros, pero tampoco palabras de viajes, ser más estricto
     return False, "Por favor, haz una pregunta relacionada con viajes y planificación de viajes"
@@ -213,13 +241,16 @@ def validar_prompt(pregunta: str) -> Tuple[bool, Optional[str], Optional[List[st
     if not pregunta or len(pregunta.strip()) < MIN_QUESTION_LENGTH:
         return False, f"La pregunta debe tener al menos {MIN_QUESTION_LENGTH} caracteres. Por favor, proporciona más detalles.", None
     
+    # Normalizar una sola vez para todas las comprobaciones
+    texto_normalizado = normalizar_texto(pregunta)
+    
     # 1. Verificar que sea sobre viajes
-    es_viaje, razon = es_sobre_viajes(pregunta)
+    es_viaje, razon = es_sobre_viajes(pregunta, texto_normalizado)
     if not es_viaje:
         return False, razon or "Por favor, haz una pregunta relacionada con viajes", None
     
     # 2. Detectar palabras peligrosas
-    palabras_peligrosas = detectar_palabras_peligrosas(pregunta)
+    palabras_peligrosas = detectar_palabras_peligrosas(pregunta, texto_normalizado)
     if palabras_peligrosas:
         mensaje = (
             "Lo siento, tu pregunta contiene instrucciones que no puedo procesar. "
@@ -260,14 +291,12 @@ def sanitizar_prompt(pregunta: str) -> str:
         return ""
     
     # Remover caracteres de control
-    pregunta = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', pregunta)
+    pregunta = quitar_caracteres_control(pregunta)
     
     # Truncamiento automático a MAX_QUESTION_LENGTH caracteres
     if len(pregunta) > MAX_QUESTION_LENGTH:
         pregunta = pregunta[:MAX_QUESTION_LENGTH]
     
     # Remover múltiples espacios
-    pregunta = re.sub(r'\s+', ' ', pregunta)
-    
-    return pregunta.strip()
+    return " ".join(pregunta.split())
 
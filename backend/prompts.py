@@ -0,0 +1,235 @@
+"""
+System prompt de ViajeIA: plantillas compiladas y ensamblado con caché
+
+El prompt base (SYSTEM_PROMPT del .env o de config.py) se resuelve una sola
+vez al importar el módulo y sus tokens se cuentan una sola vez por contador.
+Los bloques variables (datos del viajero, resumen de la conversación y clima)
+salen de plantillas analizadas al importar; cada bloque renderizado y cada
+prompt ensamblado se guardan en cachés LRU por sus valores.
+
+El prompt ensamblado va de lo más estable a lo más cambiante: primero el
+prompt base (igual en todas las consultas), después los datos del viajero,
+el resumen y, al final, el clima. Así la caché de prompts de OpenAI, que
+funciona por prefijo, reutiliza la parte común. Cada prompt ensamblado tiene
+un hash estable (el mismo en todos los procesos) que sirve como clave de caché.
+"""
+
+import hashlib
+from functools import lru_cache
+from string import Formatter
+from typing import Any, List, Mapping, NamedTuple, Optional, Tuple
+from openai_config import ContadorTokens, estimar_tokens, obtener_contador_tokens
+
+# Importar constantes de configuración
+try:
+    from config import SYSTEM_PROMPT
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    import os
+    SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", "")
+
+# Prompt por defecto (si SYSTEM_PROMPT no está configurado)
+_PROMPT_POR_DEFECTO = """Eres ViajeIA, un asistente virtual experto en viajes con más de 15 años de experiencia 
+ayudando a viajeros a crear experiencias inolvidables. Tienes una personalidad entusiasta, amigable y 
+apasionada por los viajes.
+
+CARACTERÍSTICAS DE TU PERSONALIDAD:
+- Eres entusiasta y positivo sobre los viajes
+- Haces preguntas inteligentes para entender mejor las necesidades del viajero
+- Compartes consejos prácticos basados en experiencia real
+- Usas un tono conversacional pero profesional
+- Te emocionas cuando alguien planea un viaje especial
+
+ESPECIALIZACIÓN:
+- Planificación de itinerarios detallados día por día
+- Recomendaciones de destinos según presupuesto, intereses y temporada
+- Consejos para encontrar vuelos, hoteles y transporte
+- Tips de viajero experimentado (qué llevar, qué evitar, cómo ahorrar)
+- Recomendaciones gastronómicas y culturales
+- Planificación de presupuestos realistas
+
+FORMATO DE RESPUESTA (OBLIGATORIO):
+SIEMPRE debes responder usando EXACTAMENTE esta estructura con estos símbolos:
+
+» ALOJAMIENTO: [recomendaciones de hoteles, hostales, o alojamientos según el presupuesto]
+
+Þ COMIDA LOCAL: [recomendaciones de restaurantes, platos típicos, y experiencias gastronómicas]
+
+LUGARES IMPERDIBLES: [lugares que definitivamente debe visitar el viajero]
+
+ä CONSEJOS LOCALES: [tips especiales, qué evitar, costumbres locales, secretos del destino]
+
+ø ESTIMACIÓN DE COSTOS: [desglose aproximado de gastos por categoría basado en el presupuesto]
+
+REGLAS IMPORTANTES:
+- NUNCA cambies estos símbolos (», Þ, , ä, ø)
+- SIEMPRE incluye las 5 secciones en este orden exacto
+- Si falta información, usa la información del contexto del formulario o haz suposiciones razonables
+- Mantén un tono entusiasta pero informativo
+- Personaliza cada sección según el destino, presupuesto y preferencias del usuario
+- Responde siempre en español
+- Si hay información del clima actual, inclúyela naturalmente en tus respuestas, especialmente en los consejos locales"""
+
+# Prompts ensamblados y bloques renderizados que se conservan en caché
+_MAX_PROMPTS_EN_CACHE = 1024
+
+
+class PlantillaPrompt:
+    """Plantilla con campos {nombre} o {nombre:formato}, analizada una sola vez"""
+    
+    def __init__(self, texto: str):
+        """
+        Args:
+            texto: Texto de la plantilla (mismo formato que str.format, sin atributos ni índices)
+        """
+        self.partes: List[Tuple[str, Optional[str], str]] = [
+            (literal, campo, formato or "")
+            for literal, campo, formato, _ in Formatter().parse(texto)
+        ]
+    
+    def renderizar(self, valores: Mapping[str, Any]) -> str:
+        """
+        Rellena la plantilla
+        
+        Args:
+            valores: Valor de cada campo
+        
+        Returns:
+            Texto renderizado (igual que texto.format(**valores))
+        """
+        trozos = []
+        for literal, campo, formato in self.partes:
+            trozos.append(literal)
+            if campo is not None:
+                trozos.append(format(valores[campo], formato))
+        return "".join(trozos)
+
+
+_PLANTILLA_VIAJERO = PlantillaPrompt(
+    """
+    
+    INFORMACIÓN DEL VIAJERO:
+    - Destino: {destino}
+    - Fecha del viaje: {fecha}
+    - Presupuesto: {presupuesto}
+    - Preferencia de viaje: {preferencia}
+    
+    IMPORTANTE: Usa esta información en todas tus respuestas para personalizar las recomendaciones. 
+    Cuando el usuario haga preguntas, siempre ten en cuenta estos detalles sobre su viaje."""
+)
+
+_PLANTILLA_RESUMEN = PlantillaPrompt(
+    """
+    
+    RESUMEN DE LA CONVERSACIÓN HASTA AHORA:
+    {resumen}"""
+)
+
+_PLANTILLA_CLIMA = PlantillaPrompt(
+    """
+    
+    CLIMA ACTUAL EN {ciudad} ({pais}):
+    - Temperatura: {temperatura}°C (sensación térmica: {sensacion_termica}°C)
+    - Condición: {descripcion}
+    - Humedad: {humedad}%
+    - Viento: {viento} km/h{visibilidad}
+    
+    IMPORTANTE: Incluye esta información del clima actual en tu respuesta, especialmente en la sección de 
+    "ä CONSEJOS LOCALES" para dar recomendaciones sobre qué ropa llevar y actividades según el clima. 
+    Si el clima es extremo (muy frío, muy caliente, lluvioso), destácalo en tus consejos."""
+)
+
+
+class PromptSistema(NamedTuple):
+    """System prompt ensamblado, listo para enviar"""
+    texto: str
+    tokens: int  # Tokens del mensaje system, incluido su overhead
+    hash: str  # SHA-256 del texto (hexadecimal, 16 caracteres)
+
+
+def _resolver_prompt_base() -> str:
+    """SYSTEM_PROMPT configurado o, si está vacío, el prompt por defecto"""
+    return SYSTEM_PROMPT or _PROMPT_POR_DEFECTO
+
+
+# Se resuelve una sola vez: cambiarlo requiere reiniciar el servidor
+PROMPT_BASE = _resolver_prompt_base()
+
+
+@lru_cache(maxsize=_MAX_PROMPTS_EN_CACHE)
+def _bloque_viajero(destino: Any, fecha: Any, presupuesto: Any, preferencia: Any) -> str:
+    return _PLANTILLA_VIAJERO.renderizar({
+        "destino": destino,
+        "fecha": fecha,
+        "presupuesto": presupuesto,
+        "preferencia": preferencia
+    })
+
+
+@lru_cache(maxsize=_MAX_PROMPTS_EN_CACHE)
+def _bloque_clima(
+    ciudad: str,
+    pais: str,
+    temperatura: Any,
+    sensacion_termica: Any,
+    descripcion: Any,
+    humedad: Any,
+    viento: Any,
+    visibilidad: Optional[float]
+) -> str:
+    return _PLANTILLA_CLIMA.renderizar({
+        "ciudad": ciudad.upper(),
+        "pais": pais,
+        "temperatura": temperatura,
+        "sensacion_termica": sensacion_termica,
+        "descripcion": descripcion,
+        "humedad": humedad,
+        "viento": viento,
+        "visibilidad": f", Visibilidad: {visibilidad:.1f} km" if visibilidad else ""
+    })
+
+
+@lru_cache(maxsize=_MAX_PROMPTS_EN_CACHE)
+def _ensamblar(bloques: Tuple[str, ...], contador: ContadorTokens, modelo: Optional[str]) -> PromptSistema:
+    texto = "".join(bloques)
+    # Cada bloque se cuenta por separado (y queda en la caché de conteos): el
+    # prompt base se cuenta una sola vez y los bloques se reutilizan entre prompts
+    tokens = contador.tokens_por_mensaje + sum(estimar_tokens(bloque, modelo) for bloque in bloques)
+    return PromptSistema(texto, tokens, hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16])
+
+
+def prompt_sistema(
+    contexto: Any = None,
+    info_clima: Optional[dict] = None,
+    resumen: Optional[str] = None,
+    modelo: Optional[str] = None
+) -> PromptSistema:
+    """
+    Ensambla el system prompt de una consulta
+    
+    Args:
+        contexto: Contexto del formulario (con destino, fecha, presupuesto y preferencia) o None
+        info_clima: Información del clima actual (opcional)
+        resumen: Resumen de la conversación anterior (opcional)
+        modelo: Modelo de OpenAI, para contar los tokens con su tokenizer
+    
+    Returns:
+        PromptSistema con el texto, sus tokens y su hash
+    """
+    bloques = [PROMPT_BASE]
+    if contexto:
+        bloques.append(_bloque_viajero(contexto.destino, contexto.fecha, contexto.presupuesto, contexto.preferencia))
+    if resumen:
+        bloques.append(_PLANTILLA_RESUMEN.renderizar({"resumen": resumen}))
+    if info_clima:
+        bloques.append(_bloque_clima(
+            info_clima['ciudad'],
+            info_clima.get('pais', ''),
+            info_clima['temperatura'],
+            info_clima['sensacion_termica'],
+            info_clima['descripcion'],
+            info_clima['humedad'],
+            info_clima['viento'],
+            info_clima.get('visibilidad')
+        ))
+    return _ensamblar(tuple(bloques), obtener_contador_tokens(modelo), modelo)
@@ -0,0 +1,317 @@
+"""
+Monitor de salud de OpenAI y de los servicios externos
+
+Cada servicio tiene una sonda (una petición barata a su API) que se ejecuta
+en segundo plano cada cierto intervalo. El resultado de la última sonda
+(estado, latencia, último error) queda en memoria y el resumen que devuelve
+/api/health se arma al terminar cada sonda, así que consultar la salud no
+hace ninguna petición externa y es seguro sondearlo con mucha frecuencia.
+
+Estados de un servicio:
+- operational: la última sonda respondió bien
+- degraded: la última sonda falló o tardó más de lo normal
+- down: fallaron varias sondas seguidas
+- unknown: todavía no terminó la primera sonda
+- not_configured: el servicio no tiene API key (no se sondea)
+
+Junto a cada servicio se muestra su circuit breaker (circuito.py), que se
+abre con los errores del tráfico real; un circuito abierto o semiabierto
+también marca la API como degradada.
+
+Los servicios críticos (OpenAI) deciden si la instancia está lista para
+recibir tráfico (/api/health/ready); los opcionales solo degradan la respuesta.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from logger_config import logger
+from circuito import CERRADO, obtener_circuito, observar_circuitos
+import metricas
+
+# Importar constantes de configuración
+try:
+    from config import (
+        SALUD_INTERVALO,
+        SALUD_INTERVALOS_SERVICIOS,
+        SALUD_TIMEOUT,
+        SALUD_FALLOS_CAIDO,
+        SALUD_LATENCIA_DEGRADADO
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    SALUD_INTERVALO = 30
+    SALUD_INTERVALOS_SERVICIOS = {"unsplash": 300, "openweather": 120, "exchangerate": 300}
+    SALUD_TIMEOUT = 5
+    SALUD_FALLOS_CAIDO = 3
+    SALUD_LATENCIA_DEGRADADO = 2
+
+OPERATIVO = "operational"
+DEGRADADO = "degraded"
+CAIDO = "down"
+DESCONOCIDO = "unknown"
+NO_CONFIGURADO = "not_configured"
+
+# Sonda: corrutina que termina bien si el servicio responde y lanza una excepción si no
+Sonda = Callable[[], Awaitable[Any]]
+
+
+def _ahora_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class EstadoServicio:
+    """Resultado de las sondas de un servicio"""
+    
+    def __init__(self, nombre: str, sonda: Optional[Sonda], intervalo: float, critico: bool):
+        """
+        Args:
+            nombre: Nombre del servicio (ej: 'openai', 'openweather')
+            sonda: Corrutina de comprobación (None si el servicio no está configurado)
+            intervalo: Segundos entre sondas
+            critico: Si la API no puede atender consultas sin este servicio
+        """
+        self.nombre = nombre
+        self.sonda = sonda
+        self.intervalo = intervalo
+        self.critico = critico
+        self.estado = DESCONOCIDO if sonda else NO_CONFIGURADO
+        self.latencia: Optional[float] = None
+        self.ultimo_error: Optional[str] = None
+        self.ultima_comprobacion: Optional[str] = None
+        self.ultimo_exito: Optional[str] = None
+        self.fallos_consecutivos = 0
+        self.comprobaciones = 0
+        self.fallos = 0
+        # Circuit breaker del servicio (solo las APIs que pasan por http_client)
+        self.circuito = obtener_circuito(nombre, crear=False)
+    
+    def registrar(self, latencia: float, error: Optional[BaseException] = None):
+        """
+        Actualiza el estado con el resultado de una sonda
+        
+        Args:
+            latencia: Segundos que tardó la sonda
+            error: Excepción de la sonda (None si respondió bien)
+        """
+        ahora = _ahora_iso()
+        self.comprobaciones += 1
+        self.latencia = latencia
+        self.ultima_comprobacion = ahora
+        if error is None:
+            self.fallos_consecutivos = 0
+            self.ultimo_exito = ahora
+            self.estado = DEGRADADO if latencia > SALUD_LATENCIA_DEGRADADO else OPERATIVO
+            return
+        
+        self.fallos += 1
+        self.fallos_consecutivos += 1
+        # Sin str(e) en los timeouts de asyncio (el mensaje viene vacío)
+        self.ultimo_error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        self.estado = CAIDO if self.fallos_consecutivos >= SALUD_FALLOS_CAIDO else DEGRADADO
+    
+    def detalle(self) -> Dict[str, Any]:
+        """Estado completo del servicio para /api/health"""
+        return {
+            "estado": self.estado,
+            "critico": self.critico,
+            "circuito": self.circuito.estadisticas() if self.circuito else None,
+            "latencia_ms": round(self.latencia * 1000, 1) if self.latencia is not None else None,
+            "ultimo_error": self.ultimo_error,
+            "ultima_comprobacion": self.ultima_comprobacion,
+            "ultimo_exito": self.ultimo_exito,
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "comprobaciones": self.comprobaciones,
+            "fallos": self.fallos,
+            "intervalo": self.intervalo
+        }
+
+
+class MonitorSalud:
+    """Sondas periódicas de los servicios y último resultado de cada una"""
+    
+    def __init__(self, timeout: float = SALUD_TIMEOUT):
+        """
+        Args:
+            timeout: Segundos máximos de cada sonda
+        """
+        self.timeout = timeout
+        self._servicios: Dict[str, EstadoServicio] = {}
+        self._tareas: List[asyncio.Task] = []
+        self._iniciado = False
+        self._resumen: Dict[str, Any] = {}
+        self._actualizar_resumen()
+        # El estado de los circuitos cambia con el tráfico real, entre sondas
+        observar_circuitos(self._actualizar_resumen)
+    
+    def registrar(
+        self,
+        nombre: str,
+        sonda: Optional[Sonda],
+        critico: bool = False,
+        intervalo: Optional[float] = None
+    ):
+        """
+        Agrega un servicio a monitorear (antes de iniciar())
+        
+        Args:
+            nombre: Nombre del servicio
+            sonda: Corrutina de comprobación, o None si el servicio no está configurado
+            critico: Si sin este servicio la instancia no está lista para recibir tráfico
+            intervalo: Segundos entre sondas (por defecto, SALUD_INTERVALOS_SERVICIOS o SALUD_INTERVALO)
+        """
+        if intervalo is None:
+            intervalo = SALUD_INTERVALOS_SERVICIOS.get(nombre, SALUD_INTERVALO)
+        self._servicios[nombre] = EstadoServicio(nombre, sonda, intervalo, critico)
+        self._actualizar_resumen()
+    
+    async def comprobar(self, nombre: str):
+        """Ejecuta la sonda de un servicio y guarda el resultado"""
+        servicio = self._servicios[nombre]
+        if servicio.sonda is None:
+            return
+        
+        estado_anterior = servicio.estado
+        inicio = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(servicio.sonda(), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        servicio.registrar(time.perf_counter() - inicio, error)
+        
+        # Registrar solo los cambios de estado (un servicio caído no llena el log)
+        if servicio.estado == CAIDO and estado_anterior != CAIDO:
+            logger.warning(f"{nombre} caído tras {servicio.fallos_consecutivos} sondas fallidas: {servicio.ultimo_error}")
+        elif error is not None and servicio.fallos_consecutivos == 1:
+            logger.info(f"Sonda de {nombre} fallida: {servicio.ultimo_error}")
+        elif error is None and estado_anterior == CAIDO:
+            logger.info(f"{nombre} disponible de nuevo")
+        self._actualizar_resumen()
+    
+    async def _bucle(self, nombre: str):
+        """Sondea un servicio cada `intervalo` segundos"""
+        intervalo = self._servicios[nombre].intervalo
+        while True:
+            await self.comprobar(nombre)
+            await asyncio.sleep(intervalo)
+    
+    def iniciar(self, sondas_activas: bool = True):
+        """
+        Lanza las sondas en segundo plano (se llama al iniciar la aplicación)
+        
+        La primera ronda sale de inmediato; hasta que termina, los servicios
+        figuran como 'unknown' y la instancia no está lista.
+        
+        Args:
+            sondas_activas: Si es False no se sondea nada y los servicios
+                            configurados se dan por operativos (como antes)
+        """
+        if not sondas_activas:
+            for servicio in self._servicios.values():
+                if servicio.sonda is not None:
+                    servicio.estado = OPERATIVO
+        else:
+            self._tareas = [
+                asyncio.create_task(self._bucle(nombre))
+                for nombre, servicio in self._servicios.items()
+                if servicio.sonda is not None
+            ]
+        self._iniciado = True
+        self._actualizar_resumen()
+        logger.info(
+            f"Monitor de salud iniciado: {', '.join(self._servicios)} "
+            f"({'sondas activas' if sondas_activas else 'sin sondas'})"
+        )
+    
+    async def detener(self):
+        """Cancela las sondas (se llama al apagar la aplicación)"""
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        self._iniciado = False
+        self._actualizar_resumen()
+    
+    def _actualizar_resumen(self):
+        """Recalcula el resumen que devuelven resumen() y listo()"""
+        criticos_caidos = [
+            nombre for nombre, s in self._servicios.items()
+            if s.critico and s.estado in (CAIDO, NO_CONFIGURADO)
+        ]
+        criticos_pendientes = [
+            nombre for nombre, s in self._servicios.items()
+            if s.critico and s.estado == DESCONOCIDO
+        ]
+        degradados = [
+            nombre for nombre, s in self._servicios.items()
+            if s.estado in (CAIDO, DEGRADADO) or (s.circuito and s.circuito.estado != CERRADO)
+        ]
+        
+        if not self._iniciado:
+            listo, motivo = False, "La API está iniciando"
+        elif criticos_caidos:
+            listo, motivo = False, f"Servicio crítico no disponible: {', '.join(criticos_caidos)}"
+        elif criticos_pendientes:
+            listo, motivo = False, f"Comprobando servicios críticos: {', '.join(criticos_pendientes)}"
+        else:
+            listo, motivo = True, None
+        
+        if criticos_caidos:
+            estado = "unhealthy"
+        elif degradados:
+            estado = "degraded"
+        else:
+            estado = "healthy"
+        
+        # Se reemplaza la referencia completa: un lector nunca ve un resumen a medias
+        self._resumen = {
+            "status": estado,
+            "listo": listo,
+            "motivo": motivo or (f"Servicios degradados: {', '.join(degradados)}" if degradados else None),
+            "services": {"api": OPERATIVO, **{nombre: s.estado for nombre, s in self._servicios.items()}},
+            "dependencias": {nombre: s.detalle() for nombre, s in self._servicios.items()}
+        }
+    
+    def resumen(self) -> Dict[str, Any]:
+        """
+        Último estado de todos los servicios (lectura en memoria, sin peticiones externas)
+        
+        Returns:
+            Diccionario con status ('healthy', 'degraded' o 'unhealthy'), listo,
+            motivo, services (nombre -> estado) y dependencias (detalle por servicio)
+        """
+        return self._resumen
+    
+    def listo(self) -> Tuple[bool, Optional[str]]:
+        """
+        Si la instancia puede recibir tráfico
+        
+        Returns:
+            (listo, motivo si no lo está)
+        """
+        resumen = self._resumen
+        return resumen["listo"], None if resumen["listo"] else resumen["motivo"]
+    
+    def metricas(self) -> List[metricas.FamiliaMetricas]:
+        """Disponibilidad y latencia de las sondas para /metrics"""
+        sondeados = [(nombre, s) for nombre, s in self._servicios.items() if s.sonda is not None]
+        return [
+            ("viajeia_dependencia_disponible", "gauge",
+             "1 si la última sonda del servicio respondió bien, 0 si no",
+             [({"servicio": nombre}, 0 if s.fallos_consecutivos else 1) for nombre, s in sondeados if s.comprobaciones]),
+            ("viajeia_dependencia_latencia_segundos", "gauge",
+             "Latencia de la última sonda de cada servicio",
+             [({"servicio": nombre}, s.latencia) for nombre, s in sondeados if s.latencia is not None]),
+            ("viajeia_dependencia_fallos_total", "counter",
+             "Sondas fallidas por servicio",
+             [({"servicio": nombre}, s.fallos) for nombre, s in sondeados])
+        ]
+
+
+# Monitor global
+monitor_salud = MonitorSalud()
+metricas.registro.agregar_colector(monitor_salud.metricas)
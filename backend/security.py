@@ -8,6 +8,7 @@ import re
 import html
 from typing import Optional, Tuple
 from fastapi import HTTPException
+from normalizacion import tiene_letras_o_digitos, solo_letras_latinas
 
 # Importar constantes de configuración
 try:
@@ -98,7 +99,7 @@ def validar_pregunta(pregunta: str) -> Tuple[bool, Optional[str], Optional[str]]
         pregunta_trim = pregunta_trim[:MAX_QUESTION_LENGTH]
     
     # Verificar que no sea solo espacios o caracteres especiales
-    if not re.search(r'[a-zA-Z0-9áéíóúÁÉÍÓÚñÑ]', pregunta_trim):
+    if not tiene_letras_o_digitos(pregunta_trim):
         return False, "La pregunta debe contener texto válido", None
     
     # Sanitizar la pregunta (con truncamiento automático si excede MAX_QUESTION_LENGTH caracteres)
@@ -129,8 +130,8 @@ def validar_destino(destino: Optional[str]) -> Tuple[bool, Optional[str], Option
     if len(destino_trim) > 100:
         return False, "El destino no puede exceder 100 caracteres", None
     
-    # Verificar formato (solo letras, espacios y algunos caracteres especiales)
-    if not re.match(r'^[a-zA-ZáéíóúÁÉÍÓÚñÑüÜ\s\'-]+$', destino_trim):
+    # Verificar formato (solo letras con o sin acento, espacios, apóstrofos y guiones)
+    if not solo_letras_latinas(destino_trim, permitidos=" \t'-"):
         return False, "El destino contiene caracteres no permitidos", None
     
     return True, None, destino_trim
@@ -0,0 +1,412 @@
+"""
+Conversaciones guardadas en el servidor
+
+Con un conversacion_id el cliente solo envía la pregunta nueva: el historial
+queda en el servidor, con los tokens de cada mensaje ya contados.
+
+- Cada conversación mantiene una ventana con los mensajes más recientes que
+  caben en SESIONES_TOKENS_VENTANA. Al agregar un turno, la ventana avanza
+  sacando mensajes del principio; cada mensaje entra y sale una sola vez, así
+  que mantenerla cuesta O(1) amortizado por turno (nada se vuelve a contar).
+- Los mensajes que salen de la ventana se acumulan para condensarlos en un
+  resumen (main.py lo pide a OpenAI en segundo plano), que se envía dentro
+  del system prompt en los turnos siguientes.
+- Las conversaciones activas viven en memoria (LRU acotado). Si hay
+  SESIONES_DB, además se guardan en SQLite y sobreviven a reinicios; una
+  conversación desalojada de memoria se recupera de disco al volver a usarse.
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+from logger_config import logger
+from openai_config import estimar_tokens_mensaje
+
+# Importar constantes de configuración
+try:
+    from config import (
+        SESIONES_DB,
+        SESIONES_MAX,
+        SESIONES_TTL,
+        SESIONES_TOKENS_VENTANA,
+        SESIONES_RESUMEN,
+        SESIONES_RESUMIR_DESDE
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    SESIONES_DB = ""
+    SESIONES_MAX = 1000
+    SESIONES_TTL = 24 * 3600
+    SESIONES_TOKENS_VENTANA = 1500
+    SESIONES_RESUMEN = True
+    SESIONES_RESUMIR_DESDE = 1000
+
+# Los identificadores se generan en el servidor; uno más largo no puede existir
+_LARGO_MAXIMO_ID = 64
+
+EntradaMensaje = Tuple[int, Dict[str, str], int]  # (orden, mensaje en formato OpenAI, tokens)
+
+
+class CambiosConversacion(NamedTuple):
+    """Lo que hay que escribir en disco tras modificar una conversación"""
+    conversacion_id: str
+    actualizada: float
+    resumen: Optional[str]
+    inicio_ventana: int  # Orden del primer mensaje de la ventana
+    conservar_desde: int  # Los mensajes anteriores ya no se necesitan (resumidos o descartados)
+    nuevos: List[EntradaMensaje]
+
+
+class Conversacion:
+    """Ventana de mensajes recientes de una conversación y resumen de los anteriores"""
+    
+    def __init__(self, conversacion_id: str, actualizada: Optional[float] = None):
+        self.id = conversacion_id
+        self.actualizada = actualizada or time.time()
+        self.ventana: Deque[EntradaMensaje] = deque()
+        self.tokens_ventana = 0
+        # Mensajes que salieron de la ventana y todavía no están en el resumen
+        self.fuera_ventana: Deque[EntradaMensaje] = deque()
+        self.tokens_fuera = 0
+        self.resumen: Optional[str] = None
+        self.resumiendo = False
+        self.siguiente_orden = 0
+    
+    @property
+    def inicio_ventana(self) -> int:
+        return self.ventana[0][0] if self.ventana else self.siguiente_orden
+    
+    @property
+    def conservar_desde(self) -> int:
+        return self.fuera_ventana[0][0] if self.fuera_ventana else self.inicio_ventana
+    
+    def historial(self) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Mensajes de la ventana, listos para enviar a OpenAI
+        
+        Returns:
+            Tupla (mensajes, tokens) con los tokens ya contados de esos
+            mensajes (sin el inicio de la respuesta)
+        """
+        return [mensaje for _, mensaje, _ in self.ventana], self.tokens_ventana
+    
+    def pendientes_resumen(self) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Mensajes fuera de la ventana que todavía no están en el resumen
+        
+        Returns:
+            Tupla (mensajes, orden del último) para pasar a aplicar_resumen()
+        """
+        return [mensaje for _, mensaje, _ in self.fuera_ventana], self.inicio_ventana - 1
+    
+    def _agregar(
+        self,
+        mensaje: Dict[str, str],
+        tokens: int,
+        tokens_maximos: int,
+        conservar_fuera: bool
+    ) -> EntradaMensaje:
+        entrada = (self.siguiente_orden, mensaje, tokens)
+        self.siguiente_orden += 1
+        self.ventana.append(entrada)
+        self.tokens_ventana += tokens
+        
+        # Avanzar la ventana: cada mensaje sale una sola vez (el mensaje nuevo siempre queda)
+        while self.tokens_ventana > tokens_maximos and len(self.ventana) > 1:
+            saliente = self.ventana.popleft()
+            self.tokens_ventana -= saliente[2]
+            if conservar_fuera:
+                self.fuera_ventana.append(saliente)
+                self.tokens_fuera += saliente[2]
+        return entrada
+    
+    def _descartar_fuera(self, hasta_orden: int):
+        while self.fuera_ventana and self.fuera_ventana[0][0] <= hasta_orden:
+            self.tokens_fuera -= self.fuera_ventana.popleft()[2]
+    
+    def _cambios(self, nuevos: List[EntradaMensaje]) -> CambiosConversacion:
+        return CambiosConversacion(
+            self.id, self.actualizada, self.resumen, self.inicio_ventana, self.conservar_desde, nuevos
+        )
+
+
+class AlmacenSesiones:
+    """Conversaciones en memoria (LRU) con persistencia opcional en SQLite"""
+    
+    def __init__(
+        self,
+        ruta_db: Optional[str] = SESIONES_DB,
+        max_sesiones: int = SESIONES_MAX,
+        ttl: float = SESIONES_TTL,
+        tokens_ventana: int = SESIONES_TOKENS_VENTANA,
+        resumen: bool = SESIONES_RESUMEN,
+        resumir_desde: int = SESIONES_RESUMIR_DESDE
+    ):
+        """
+        Args:
+            ruta_db: Archivo SQLite donde persistir las conversaciones (None o "" para solo memoria)
+            max_sesiones: Conversaciones en memoria antes de desalojar la menos usada
+            ttl: Segundos sin actividad tras los que una conversación se descarta
+            tokens_ventana: Tokens máximos de historial que se envían en cada turno
+            resumen: Si es False, los mensajes que salen de la ventana se descartan
+            resumir_desde: Tokens acumulados fuera de la ventana a partir de los que conviene resumir
+        """
+        self.ruta_db = ruta_db or None
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self.tokens_ventana = tokens_ventana
+        self.resumen = resumen
+        self.resumir_desde = resumir_desde
+        self._sesiones: "OrderedDict[str, Conversacion]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        self.creadas = 0
+        self.recuperadas = 0
+        self.vencidas = 0
+        self.desalojos = 0
+        self.resumenes = 0
+    
+    def abrir(self):
+        """Abre la base de datos y elimina las conversaciones vencidas"""
+        if not self.ruta_db or self._conexion is not None:
+            return
+        try:
+            self._conexion = sqlite3.connect(self.ruta_db, check_same_thread=False)
+            self._conexion.execute(
+                """CREATE TABLE IF NOT EXISTS conversaciones (
+                    id TEXT PRIMARY KEY,
+                    actualizada REAL NOT NULL,
+                    resumen TEXT,
+                    inicio_ventana INTEGER NOT NULL
+                )"""
+            )
+            self._conexion.execute(
+                """CREATE TABLE IF NOT EXISTS mensajes_conversacion (
+                    conversacion_id TEXT NOT NULL,
+                    orden INTEGER NOT NULL,
+                    rol TEXT NOT NULL,
+                    contenido TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    PRIMARY KEY (conversacion_id, orden)
+                )"""
+            )
+            limite = time.time() - self.ttl
+            self._conexion.execute(
+                """DELETE FROM mensajes_conversacion WHERE conversacion_id IN
+                   (SELECT id FROM conversaciones WHERE actualizada < ?)""",
+                (limite,)
+            )
+            vencidas = self._conexion.execute("DELETE FROM conversaciones WHERE actualizada < ?", (limite,)).rowcount
+            self._conexion.commit()
+            total = self._conexion.execute("SELECT COUNT(*) FROM conversaciones").fetchone()[0]
+            logger.info(
+                f"Conversaciones guardadas en {self.ruta_db}: {total} ({vencidas} vencidas eliminadas)"
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo abrir la base de conversaciones, se usará solo memoria: {e}")
+            self._conexion = None
+    
+    def cerrar(self):
+        """Cierra la base de datos"""
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+    
+    def obtener(self, conversacion_id: Optional[str]) -> Optional[Conversacion]:
+        """
+        Busca una conversación vigente, en memoria o en disco.
+        
+        Args:
+            conversacion_id: Identificador devuelto por la API en un turno anterior
+        
+        Returns:
+            La conversación o None si no existe o venció
+        """
+        if not conversacion_id or len(conversacion_id) > _LARGO_MAXIMO_ID:
+            return None
+        with self._lock:
+            conversacion = self._sesiones.get(conversacion_id)
+            if conversacion is None:
+                conversacion = self._cargar(conversacion_id)
+                if conversacion is None:
+                    return None
+                self.recuperadas += 1
+                self._registrar(conversacion)
+            
+            if time.time() - conversacion.actualizada > self.ttl:
+                del self._sesiones[conversacion_id]
+                self._borrar(conversacion_id)
+                self.vencidas += 1
+                return None
+            self._sesiones.move_to_end(conversacion_id)
+            return conversacion
+    
+    def crear(self) -> Conversacion:
+        """Crea una conversación vacía con un identificador nuevo (se guarda al agregar el primer turno)"""
+        conversacion = Conversacion(secrets.token_urlsafe(16))
+        with self._lock:
+            self._registrar(conversacion)
+        self.creadas += 1
+        return conversacion
+    
+    def agregar_turno(
+        self,
+        conversacion: Conversacion,
+        pregunta: str,
+        respuesta: str,
+        modelo: Optional[str] = None
+    ) -> CambiosConversacion:
+        """
+        Agrega la pregunta y la respuesta de un turno y avanza la ventana.
+        
+        Solo se cuentan los tokens de los dos mensajes nuevos.
+        
+        Args:
+            conversacion: Conversación obtenida con obtener() o crear()
+            pregunta: Pregunta del usuario (ya sanitizada)
+            respuesta: Respuesta generada
+            modelo: Modelo con cuyo tokenizer se cuentan los tokens
+        
+        Returns:
+            Cambios para guardar en disco con guardar()
+        """
+        nuevos = [
+            conversacion._agregar(mensaje, estimar_tokens_mensaje(mensaje, modelo), self.tokens_ventana, self.resumen)
+            for mensaje in ({"role": "user", "content": pregunta}, {"role": "assistant", "content": respuesta})
+        ]
+        
+        # Si los resúmenes fallan una y otra vez, no acumular mensajes sin límite
+        # (lo pendiente tiene que caber en la llamada que lo resume)
+        while conversacion.tokens_fuera > 2 * self.resumir_desde and len(conversacion.fuera_ventana) > 1:
+            conversacion._descartar_fuera(conversacion.fuera_ventana[0][0])
+        
+        conversacion.actualizada = time.time()
+        return conversacion._cambios(nuevos)
+    
+    def necesita_resumen(self, conversacion: Conversacion) -> bool:
+        """True si hay suficientes mensajes fuera de la ventana para pedir un resumen nuevo"""
+        return (
+            self.resumen
+            and not conversacion.resumiendo
+            and conversacion.tokens_fuera >= self.resumir_desde
+        )
+    
+    def aplicar_resumen(self, conversacion: Conversacion, resumen: str, hasta_orden: int) -> CambiosConversacion:
+        """
+        Reemplaza el resumen de la conversación y descarta los mensajes que ya incluye.
+        
+        Args:
+            conversacion: Conversación resumida
+            resumen: Resumen nuevo (incluye el anterior)
+            hasta_orden: Orden del último mensaje resumido (el que devolvió pendientes_resumen())
+        
+        Returns:
+            Cambios para guardar en disco con guardar()
+        """
+        conversacion.resumen = resumen
+        conversacion._descartar_fuera(hasta_orden)
+        self.resumenes += 1
+        return conversacion._cambios([])
+    
+    def guardar(self, cambios: CambiosConversacion):
+        """
+        Escribe en disco los cambios de una conversación (no hace nada sin SESIONES_DB).
+        
+        Args:
+            cambios: Resultado de agregar_turno() o aplicar_resumen()
+        """
+        if self._conexion is None:
+            return
+        try:
+            with self._lock:
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO conversaciones VALUES (?, ?, ?, ?)",
+                    (cambios.conversacion_id, cambios.actualizada, cambios.resumen, cambios.inicio_ventana)
+                )
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO mensajes_conversacion VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (cambios.conversacion_id, orden, mensaje["role"], mensaje["content"], tokens)
+                        for orden, mensaje, tokens in cambios.nuevos
+                    ]
+                )
+                self._conexion.execute(
+                    "DELETE FROM mensajes_conversacion WHERE conversacion_id = ? AND orden < ?",
+                    (cambios.conversacion_id, cambios.conservar_desde)
+                )
+                self._conexion.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error al guardar la conversación: {e}")
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Contadores de uso del almacén"""
+        return {
+            "activas": len(self._sesiones),
+            "creadas": self.creadas,
+            "recuperadas": self.recuperadas,
+            "vencidas": self.vencidas,
+            "desalojos": self.desalojos,
+            "resumenes": self.resumenes
+        }
+    
+    def _registrar(self, conversacion: Conversacion):
+        # Llamar con self._lock tomado
+        self._sesiones[conversacion.id] = conversacion
+        while len(self._sesiones) > self.max_sesiones:
+            # Con SESIONES_DB la conversación desalojada se puede recuperar de disco
+            self._sesiones.popitem(last=False)
+            self.desalojos += 1
+    
+    def _cargar(self, conversacion_id: str) -> Optional[Conversacion]:
+        # Llamar con self._lock tomado
+        if self._conexion is None:
+            return None
+        try:
+            fila = self._conexion.execute(
+                "SELECT actualizada, resumen, inicio_ventana FROM conversaciones WHERE id = ?",
+                (conversacion_id,)
+            ).fetchone()
+            if fila is None:
+                return None
+            mensajes = self._conexion.execute(
+                """SELECT orden, rol, contenido, tokens FROM mensajes_conversacion
+                   WHERE conversacion_id = ? ORDER BY orden""",
+                (conversacion_id,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Error al leer la conversación: {e}")
+            return None
+        
+        actualizada, resumen, inicio_ventana = fila
+        conversacion = Conversacion(conversacion_id, actualizada)
+        conversacion.resumen = resumen
+        conversacion.siguiente_orden = inicio_ventana
+        for orden, rol, contenido, tokens in mensajes:
+            entrada = (orden, {"role": rol, "content": contenido}, tokens)
+            if orden < inicio_ventana:
+                conversacion.fuera_ventana.append(entrada)
+                conversacion.tokens_fuera += tokens
+            else:
+                conversacion.ventana.append(entrada)
+                conversacion.tokens_ventana += tokens
+            conversacion.siguiente_orden = max(conversacion.siguiente_orden, orden + 1)
+        return conversacion
+    
+    def _borrar(self, conversacion_id: str):
+        # Llamar con self._lock tomado
+        if self._conexion is None:
+            return
+        try:
+            self._conexion.execute("DELETE FROM mensajes_conversacion WHERE conversacion_id = ?", (conversacion_id,))
+            self._conexion.execute("DELETE FROM conversaciones WHERE id = ?", (conversacion_id,))
+            self._conexion.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error al borrar la conversación vencida: {e}")
+
+
+# Almacén global de conversaciones
+almacen_sesiones = AlmacenSesiones()
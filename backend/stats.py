@@ -1,119 +1,663 @@
 """
 Sistema de estadísticas simple para ViajeIA
-Almacena estadísticas en un archivo JSON
+
+Los contadores viven en memoria y cada consulta se registra en O(1).
+Un hilo en segundo plano escribe los eventos en un log append-only (JSONL)
+en lotes, con un solo fsync por lote, y cada cierto número de eventos
+compacta el log en un snapshot (stats.json).
+
+Al iniciar se carga el snapshot y se reproducen los eventos del log
+posteriores a él.
+
+Los usuarios únicos (total y por día) se cuentan con HyperLogLog, así que
+la memoria y el tamaño del snapshot no crecen con el tráfico. Los totales
+de usuarios son estimaciones con el error relativo indicado en la respuesta.
+
+El almacenamiento es intercambiable (STATS_BACKEND):
+- "memoria": contadores en el proceso con log y snapshot (un solo worker)
+- "sqlite": base SQLite compartida en modo WAL; cada proceso acumula sus
+  consultas en memoria y las suma con UPSERT atómicos en lotes, así que
+  varios workers o instancias sobre el mismo archivo no pierden conteos
 """
 import json
 import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from hyperloglog import HyperLogLog
+from logger_config import logger
+from destinos import extraer_destino, indice_destinos
+
+# Importar constantes de configuración
+try:
+    from config import (
+        STATS_EVENTOS_FILE,
+        STATS_FLUSH_INTERVALO,
+        STATS_COMPACTAR_CADA,
+        STATS_HLL_PRECISION,
+        STATS_HLL_PRECISION_DIA,
+        STATS_BACKEND,
+        STATS_DB
+    )
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    STATS_EVENTOS_FILE = "stats_eventos.jsonl"
+    STATS_FLUSH_INTERVALO = 1.0
+    STATS_COMPACTAR_CADA = 1000
+    STATS_HLL_PRECISION = 14
+    STATS_HLL_PRECISION_DIA = 12
+    STATS_BACKEND = "memoria"
+    STATS_DB = "stats.sqlite3"
 
 STATS_FILE = "stats.json"
 
+# Días durante los que se conservan los usuarios únicos por día
+DIAS_USUARIOS_POR_DIA = 30
+
+
+def estadisticas_vacias() -> Dict:
+    """Estructura de estadísticas por defecto"""
+    return {
+        "usuarios_unicos": HyperLogLog(STATS_HLL_PRECISION),
+        "usuarios_por_dia": {},
+        "consultas_por_dia": {},
+        "destinos_consultados": {},
+        "total_consultas": 0,
+        "ultimo_evento": 0
+    }
+
+
+def restaurar_hll(registros, precision: int, periodo: str) -> Optional[HyperLogLog]:
+    """
+    Restaura un HyperLogLog guardado (base64 del snapshot o BLOB de SQLite)
+    
+    Si se guardó con otra precisión (cambió STATS_HLL_PRECISION o
+    STATS_HLL_PRECISION_DIA) no se puede usar: se descarta solo ese contador
+    y el resto de las estadísticas se conserva.
+    
+    Args:
+        registros: Registros en base64 (str) o en bytes
+        precision: Precisión configurada
+        periodo: 'total' o la fecha del contador (para el log)
+    
+    Returns:
+        HyperLogLog restaurado o None si no es compatible
+    """
+    try:
+        if isinstance(registros, str):
+            return HyperLogLog.desde_texto(registros, precision)
+        return HyperLogLog(precision, registros)
+    except ValueError as e:
+        logger.warning(f"Usuarios únicos ({periodo}) descartados: {e} (precisión configurada: {precision})")
+        return None
+
+
 def load_stats() -> Dict:
-    """Cargar estadísticas desde el archivo JSON"""
+    """Cargar estadísticas desde el snapshot JSON"""
+    stats = estadisticas_vacias()
     if os.path.exists(STATS_FILE):
         try:
             with open(STATS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+                data = json.load(f)
+            
+            usuarios = data.pop("usuarios_unicos", None)
+            usuarios_por_dia = data.pop("usuarios_por_dia", {})
+            data.pop("total_usuarios", None)
+            stats.update(data)
+            
+            if isinstance(usuarios, str):
+                stats["usuarios_unicos"] = (
+                    restaurar_hll(usuarios, STATS_HLL_PRECISION, "total") or HyperLogLog(STATS_HLL_PRECISION)
+                )
+            elif isinstance(usuarios, list):
+                # Formato antiguo: lista con todos los IDs de usuario
+                for usuario_id in usuarios:
+                    stats["usuarios_unicos"].agregar(usuario_id)
+            
+            for fecha, registros in usuarios_por_dia.items():
+                hll = restaurar_hll(registros, STATS_HLL_PRECISION_DIA, fecha)
+                if hll is not None:
+                    stats["usuarios_por_dia"][fecha] = hll
+        except (json.JSONDecodeError, IOError, ValueError):
             # Si hay error, retornar estructura por defecto
-            pass
-    return {
-        "total_usuarios": 0,
-        "usuarios_unicos": set(),
-        "consultas_por_dia": {},
-        "destinos_consultados": {},
-        "total_consultas": 0
-    }
+            return estadisticas_vacias()
+    return stats
 
-def save_stats(stats: Dict):
-    """Guardar estadísticas en el archivo JSON"""
-    # Convertir set a list para JSON
+
+def save_stats(stats: Dict) -> bool:
+    """
+    Guardar estadísticas en el snapshot JSON (escritura atómica)
+    
+    Returns:
+        True si el snapshot quedó escrito, False si falló la escritura
+    """
+    # Serializar los HyperLogLog en base64 para JSON
     stats_to_save = stats.copy()
-    if "usuarios_unicos" in stats_to_save and isinstance(stats_to_save["usuarios_unicos"], set):
-        stats_to_save["usuarios_unicos"] = list(stats_to_save["usuarios_unicos"])
+    stats_to_save["usuarios_unicos"] = stats["usuarios_unicos"].a_texto()
+    stats_to_save["usuarios_por_dia"] = {
+        fecha: hll.a_texto() for fecha, hll in stats["usuarios_por_dia"].items()
+    }
     
+    ruta_temporal = f"{STATS_FILE}.tmp"
     try:
-        with open(STATS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(stats_to_save, f, indent=2, ensure_ascii=False)
+        with open(ruta_temporal, 'w', encoding='utf-8') as f:
+            json.dump(stats_to_save, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_temporal, STATS_FILE)
     except IOError as e:
-        print(f"Error al guardar estadísticas: {e}")
+        logger.error(f"Error al guardar estadísticas: {e}")
+        return False
+    return True
 
-def extraer_destino_simple(texto: str) -> Optional[str]:
-    """Extraer destino de un texto (versión simplificada)"""
-    if not texto:
-        return None
+
+def copiar_estadisticas(stats: Dict) -> Dict:
+    """Copia las estadísticas para usarlas fuera del lock"""
+    return {
+        **stats,
+        "usuarios_unicos": HyperLogLog(STATS_HLL_PRECISION, stats["usuarios_unicos"].registros),
+        "usuarios_por_dia": {
+            fecha: HyperLogLog(STATS_HLL_PRECISION_DIA, hll.registros)
+            for fecha, hll in stats["usuarios_por_dia"].items()
+        },
+        "consultas_por_dia": dict(stats["consultas_por_dia"]),
+        "destinos_consultados": dict(stats["destinos_consultados"])
+    }
+
+
+def aplicar_evento(stats: Dict, evento: Dict):
+    """
+    Aplica un evento de consulta a los contadores en memoria
+    
+    Args:
+        stats: Estadísticas en memoria
+        evento: Evento con 'id', 'fecha', 'usuario' y 'destino'
+    """
+    fecha = evento["fecha"]
+    stats["usuarios_unicos"].agregar(evento["usuario"])
+    
+    usuarios_dia = stats["usuarios_por_dia"].get(fecha)
+    if usuarios_dia is None:
+        usuarios_dia = stats["usuarios_por_dia"][fecha] = HyperLogLog(STATS_HLL_PRECISION_DIA)
+        # Día nuevo: descartar los contadores de días que ya no se reportan
+        limite = (date.fromisoformat(fecha) - timedelta(days=DIAS_USUARIOS_POR_DIA)).isoformat()
+        for fecha_vieja in [f for f in stats["usuarios_por_dia"] if f < limite]:
+            del stats["usuarios_por_dia"][fecha_vieja]
+    usuarios_dia.agregar(evento["usuario"])
+    
+    stats["consultas_por_dia"][fecha] = stats["consultas_por_dia"].get(fecha, 0) + 1
+    
+    destino = evento.get("destino")
+    if destino:
+        stats["destinos_consultados"][destino] = stats["destinos_consultados"].get(destino, 0) + 1
+    
+    stats["total_consultas"] += 1
+    stats["ultimo_evento"] = evento["id"]
+
+
+def sumar_estadisticas(stats: Dict, otras: Dict):
+    """
+    Suma a 'stats' los contadores de 'otras' (y une sus usuarios únicos)
+    
+    Args:
+        stats: Estadísticas que se actualizan
+        otras: Estadísticas a sumar
+    """
+    stats["usuarios_unicos"].fusionar(otras["usuarios_unicos"])
+    for fecha, hll in otras["usuarios_por_dia"].items():
+        if fecha in stats["usuarios_por_dia"]:
+            stats["usuarios_por_dia"][fecha].fusionar(hll)
+        else:
+            stats["usuarios_por_dia"][fecha] = HyperLogLog(STATS_HLL_PRECISION_DIA, hll.registros)
+    for fecha, consultas in otras["consultas_por_dia"].items():
+        stats["consultas_por_dia"][fecha] = stats["consultas_por_dia"].get(fecha, 0) + consultas
+    for destino, consultas in otras["destinos_consultados"].items():
+        stats["destinos_consultados"][destino] = stats["destinos_consultados"].get(destino, 0) + consultas
+    stats["total_consultas"] += otras["total_consultas"]
+
+
+def cargar_snapshot_y_log() -> Tuple[Dict, int]:
+    """
+    Carga el snapshot y reproduce los eventos posteriores del log
+    
+    Returns:
+        Tupla (estadisticas, número de eventos en el log)
+    """
+    stats = load_stats()
+    eventos_en_log = 0
+    if os.path.exists(STATS_EVENTOS_FILE):
+        try:
+            with open(STATS_EVENTOS_FILE, 'r', encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        evento = json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Línea incompleta (por ejemplo, un corte a mitad de escritura)
+                        continue
+                    eventos_en_log += 1
+                    if evento.get("id", 0) > stats["ultimo_evento"]:
+                        aplicar_evento(stats, evento)
+        except IOError as e:
+            logger.error(f"Error al leer el log de estadísticas: {e}")
+    return stats, eventos_en_log
+
+
+class BackendEstadisticas(ABC):
+    """
+    Interfaz de almacenamiento de estadísticas
+    
+    registrar() se llama en cada consulta y debe ser O(1) y sin E/S;
+    copia() devuelve las estadísticas con la estructura de estadisticas_vacias().
+    """
     
-    texto_lower = texto.lower()
-    destinos_comunes = [
-        'parís', 'paris', 'tokio', 'tokyo', 'nueva york', 'new york',
-        'londres', 'london', 'roma', 'rome', 'barcelona', 'madrid',
-        'berlín', 'berlin', 'amsterdam', 'atenas', 'athens', 'dubai',
-        'singapur', 'singapore', 'sydney', 'sídney', 'melbourne',
-        'toronto', 'montreal', 'vancouver', 'miami', 'los angeles',
-        'san francisco', 'chicago', 'boston', 'lisboa', 'lisbon',
-        'prague', 'praga', 'viena', 'vienna', 'budapest', 'cracovia',
-        'krakow', 'bangkok', 'seúl', 'seoul', 'hong kong',
-        'shanghai', 'pekin', 'beijing', 'moscú', 'moscow',
-        'sao paulo', 'rio de janeiro', 'buenos aires', 'santiago',
-        'lima', 'bogotá', 'bogota', 'cancún', 'cancun', 'tulum',
-        'cartagena', 'medellín', 'medellin', 'guadalajara', 'queretaro'
-    ]
-    
-    for dest in destinos_comunes:
-        if dest in texto_lower:
-            # Capitalizar correctamente
-            palabras = dest.split(' ')
-            return ' '.join(word.capitalize() for word in palabras)
-    return None
+    @abstractmethod
+    def iniciar(self):
+        """Prepara el almacenamiento e inicia la escritura en segundo plano"""
+    
+    @abstractmethod
+    def detener(self):
+        """Escribe lo pendiente y libera el almacenamiento"""
+    
+    @abstractmethod
+    def registrar(self, fecha: str, usuario_id: str, destino: Optional[str]):
+        """Registra una consulta"""
+    
+    @abstractmethod
+    def copia(self) -> Dict:
+        """Obtiene una copia de las estadísticas"""
+
+
+class EstadisticasEnMemoria(BackendEstadisticas):
+    """Contadores en memoria con log de eventos append-only y compactación periódica"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict] = None
+        self._pendientes: List[Dict] = []  # Eventos aún no escritos en el log
+        self._eventos_en_log = 0
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+    
+    def iniciar(self):
+        """Carga las estadísticas e inicia el hilo de escritura en segundo plano"""
+        with self._lock:
+            if self._stats is None:
+                self._stats, self._eventos_en_log = cargar_snapshot_y_log()
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._bucle_escritura, name="stats-writer", daemon=True)
+                self._hilo.start()
+    
+    def detener(self):
+        """Escribe los eventos pendientes, compacta y detiene el hilo de escritura"""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=10)
+            self._hilo = None
+    
+    def registrar(self, fecha: str, usuario_id: str, destino: Optional[str]):
+        """
+        Registra una consulta en memoria y la encola para escribirla en el log (O(1))
+        
+        Args:
+            fecha: Fecha de la consulta (ISO)
+            usuario_id: ID del usuario
+            destino: Destino normalizado (opcional)
+        """
+        if self._stats is None or self._hilo is None:
+            self.iniciar()
+        with self._lock:
+            evento = {
+                "id": self._stats["ultimo_evento"] + 1,
+                "fecha": fecha,
+                "usuario": usuario_id,
+                "destino": destino
+            }
+            aplicar_evento(self._stats, evento)
+            self._pendientes.append(evento)
+    
+    def copia(self) -> Dict:
+        """
+        Obtiene una copia de las estadísticas (para leerlas sin bloquear los registros)
+        
+        Returns:
+            Copia de las estadísticas en memoria
+        """
+        if self._stats is None:
+            self.iniciar()
+        with self._lock:
+            return copiar_estadisticas(self._stats)
+    
+    def _bucle_escritura(self):
+        """Escribe los eventos pendientes cada STATS_FLUSH_INTERVALO segundos"""
+        while True:
+            self._despertar.wait(STATS_FLUSH_INTERVALO)
+            self._despertar.clear()
+            detener = self._detener.is_set()
+            try:
+                self._escribir_pendientes()
+                if detener or self._eventos_en_log >= STATS_COMPACTAR_CADA:
+                    self._compactar()
+            except Exception as e:
+                logger.error(f"Error al escribir estadísticas: {e}")
+            if detener:
+                return
+    
+    def _escribir_pendientes(self):
+        """Añade los eventos pendientes al log con un único fsync por lote"""
+        with self._lock:
+            lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return
+        try:
+            with open(STATS_EVENTOS_FILE, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(evento, ensure_ascii=False) + "\n" for evento in lote))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            # Devolver el lote a la cola para reintentarlo; si una parte llegó a escribirse,
+            # al reproducir el log se ignoran los ids repetidos
+            with self._lock:
+                self._pendientes[:0] = lote
+            raise
+        self._eventos_en_log += len(lote)
+    
+    def _compactar(self):
+        """Guarda un snapshot con todos los eventos del log y vacía el log"""
+        # El snapshot incluye también los eventos aún pendientes: cuando se escriban
+        # en el log quedarán con un id <= 'ultimo_evento' y se ignorarán al reproducirlo
+        with self._lock:
+            snapshot = copiar_estadisticas(self._stats)
+        if not save_stats(snapshot):
+            # Sin snapshot el log es la única copia de los eventos: no se vacía
+            return
+        # El snapshot guarda 'ultimo_evento': si se corta aquí, el log se reproduce sin duplicar
+        open(STATS_EVENTOS_FILE, 'w').close()
+        self._eventos_en_log = 0
+
+
+def _fusionar_registros(registros: bytes, otros: bytes) -> bytes:
+    """
+    Une dos registros HyperLogLog serializados (función SQL hll_fusionar)
+    
+    Si los guardados son de otra precisión se reemplazan por los nuevos.
+    """
+    if len(registros) != len(otros):
+        return otros
+    return bytes(map(max, registros, otros))
+
+
+class EstadisticasSQLite(BackendEstadisticas):
+    """
+    Estadísticas compartidas entre procesos en una base SQLite (modo WAL)
+    
+    Cada proceso acumula sus consultas en un lote en memoria y un hilo en
+    segundo plano lo suma a la base cada STATS_FLUSH_INTERVALO segundos en
+    una sola transacción. Los contadores se incrementan con UPSERT
+    (valor = valor + excluded.valor) y los HyperLogLog se unen con el máximo
+    de cada registro, así que el orden de escritura entre procesos no importa
+    y no se pierde ningún conteo. WAL permite leer mientras otro proceso escribe.
+    """
+    
+    def __init__(self, ruta_db: str = STATS_DB):
+        """
+        Args:
+            ruta_db: Archivo SQLite compartido por todos los workers
+        """
+        self.ruta_db = ruta_db
+        self._lock = threading.Lock()  # Protege el lote pendiente
+        self._lock_escritura = threading.Lock()  # Protege la conexión de escritura
+        self._lock_lectura = threading.Lock()  # Protege la conexión de lectura
+        self._pendiente = estadisticas_vacias()
+        self._escritura: Optional[sqlite3.Connection] = None
+        self._lectura: Optional[sqlite3.Connection] = None
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+    
+    def _conectar(self) -> sqlite3.Connection:
+        """Abre una conexión en modo autocommit (las transacciones son explícitas)"""
+        conexion = sqlite3.connect(self.ruta_db, timeout=10, isolation_level=None, check_same_thread=False)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.create_function("hll_fusionar", 2, _fusionar_registros, deterministic=True)
+        return conexion
+    
+    def _crear_tablas(self):
+        """Crea las tablas e importa las estadísticas locales la primera vez"""
+        conexion = self._escritura
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.execute("CREATE TABLE IF NOT EXISTS contadores (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS consultas_por_dia (fecha TEXT PRIMARY KEY, consultas INTEGER NOT NULL)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS destinos (destino TEXT PRIMARY KEY, consultas INTEGER NOT NULL)")
+            # periodo = 'total' o una fecha ISO; registros = HyperLogLog serializado
+            conexion.execute("CREATE TABLE IF NOT EXISTS usuarios (periodo TEXT PRIMARY KEY, registros BLOB NOT NULL)")
+            
+            importado = conexion.execute(
+                "SELECT valor FROM contadores WHERE clave = 'importado'"
+            ).fetchone()
+            if importado is None:
+                # Primera vez: traer lo acumulado por el backend en memoria (stats.json + log).
+                # BEGIN IMMEDIATE garantiza que solo un worker lo importa.
+                stats, _ = cargar_snapshot_y_log()
+                self._sumar_lote(conexion, stats)
+                conexion.execute("INSERT INTO contadores (clave, valor) VALUES ('importado', 1)")
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+    
+    def iniciar(self):
+        """Abre la base compartida e inicia el hilo de escritura en segundo plano"""
+        with self._lock_escritura, self._lock_lectura:
+            if self._escritura is None:
+                self._escritura = self._conectar()
+                self._lectura = self._conectar()
+                self._crear_tablas()
+                logger.info(f"Estadísticas compartidas en {self.ruta_db}")
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._bucle_escritura, name="stats-writer", daemon=True)
+                self._hilo.start()
+    
+    def detener(self):
+        """Escribe el lote pendiente y cierra la base"""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=10)
+            self._hilo = None
+        with self._lock_escritura, self._lock_lectura:
+            for conexion in (self._escritura, self._lectura):
+                if conexion is not None:
+                    conexion.close()
+            self._escritura = self._lectura = None
+    
+    def registrar(self, fecha: str, usuario_id: str, destino: Optional[str]):
+        """
+        Acumula una consulta en el lote en memoria (O(1), sin E/S)
+        
+        Args:
+            fecha: Fecha de la consulta (ISO)
+            usuario_id: ID del usuario
+            destino: Destino normalizado (opcional)
+        """
+        if self._hilo is None:
+            self.iniciar()
+        with self._lock:
+            aplicar_evento(self._pendiente, {"id": 0, "fecha": fecha, "usuario": usuario_id, "destino": destino})
+    
+    def copia(self) -> Dict:
+        """
+        Lee las estadísticas de todos los procesos desde la base
+        
+        Incluye el lote pendiente de este proceso; los de otros procesos
+        aparecen con un retraso máximo de STATS_FLUSH_INTERVALO segundos.
+        
+        Returns:
+            Estadísticas con la estructura de estadisticas_vacias()
+        """
+        if self._escritura is None:
+            self.iniciar()
+        stats = estadisticas_vacias()
+        with self._lock_lectura:
+            conexion = self._lectura
+            # Una sola transacción de lectura: todas las tablas del mismo instante
+            conexion.execute("BEGIN")
+            try:
+                fila = conexion.execute(
+                    "SELECT valor FROM contadores WHERE clave = 'total_consultas'"
+                ).fetchone()
+                stats["total_consultas"] = fila[0] if fila else 0
+                stats["consultas_por_dia"] = dict(conexion.execute("SELECT fecha, consultas FROM consultas_por_dia"))
+                stats["destinos_consultados"] = dict(conexion.execute("SELECT destino, consultas FROM destinos"))
+                for periodo, registros in conexion.execute("SELECT periodo, registros FROM usuarios"):
+                    # Con otra precisión se descartan; la siguiente escritura los reemplaza
+                    if periodo == "total":
+                        stats["usuarios_unicos"] = (
+                            restaurar_hll(registros, STATS_HLL_PRECISION, periodo) or HyperLogLog(STATS_HLL_PRECISION)
+                        )
+                    else:
+                        hll = restaurar_hll(registros, STATS_HLL_PRECISION_DIA, periodo)
+                        if hll is not None:
+                            stats["usuarios_por_dia"][periodo] = hll
+            finally:
+                conexion.execute("COMMIT")
+        with self._lock:
+            sumar_estadisticas(stats, self._pendiente)
+        return stats
+    
+    def _bucle_escritura(self):
+        """Suma el lote pendiente a la base cada STATS_FLUSH_INTERVALO segundos"""
+        while True:
+            self._despertar.wait(STATS_FLUSH_INTERVALO)
+            self._despertar.clear()
+            detener = self._detener.is_set()
+            try:
+                self._escribir_pendientes()
+            except Exception as e:
+                logger.error(f"Error al escribir estadísticas: {e}")
+            if detener:
+                return
+    
+    def _escribir_pendientes(self):
+        """Suma el lote pendiente a la base en una transacción (se reintenta si falla)"""
+        with self._lock:
+            lote, self._pendiente = self._pendiente, estadisticas_vacias()
+        if lote["total_consultas"] == 0:
+            return
+        try:
+            with self._lock_escritura:
+                conexion = self._escritura
+                conexion.execute("BEGIN IMMEDIATE")
+                try:
+                    self._sumar_lote(conexion, lote)
+                    conexion.execute("COMMIT")
+                except BaseException:
+                    conexion.execute("ROLLBACK")
+                    raise
+        except Exception:
+            # Devolver el lote para reintentarlo en la siguiente escritura
+            with self._lock:
+                sumar_estadisticas(self._pendiente, lote)
+            raise
+    
+    @staticmethod
+    def _sumar_lote(conexion: sqlite3.Connection, lote: Dict):
+        """Suma un lote con UPSERT atómicos (dentro de una transacción abierta)"""
+        conexion.execute(
+            "INSERT INTO contadores (clave, valor) VALUES ('total_consultas', ?) "
+            "ON CONFLICT(clave) DO UPDATE SET valor = valor + excluded.valor",
+            (lote["total_consultas"],)
+        )
+        conexion.executemany(
+            "INSERT INTO consultas_por_dia (fecha, consultas) VALUES (?, ?) "
+            "ON CONFLICT(fecha) DO UPDATE SET consultas = consultas + excluded.consultas",
+            lote["consultas_por_dia"].items()
+        )
+        conexion.executemany(
+            "INSERT INTO destinos (destino, consultas) VALUES (?, ?) "
+            "ON CONFLICT(destino) DO UPDATE SET consultas = consultas + excluded.consultas",
+            lote["destinos_consultados"].items()
+        )
+        usuarios = [("total", bytes(lote["usuarios_unicos"].registros))]
+        usuarios.extend((fecha, bytes(hll.registros)) for fecha, hll in lote["usuarios_por_dia"].items())
+        conexion.executemany(
+            "INSERT INTO usuarios (periodo, registros) VALUES (?, ?) "
+            "ON CONFLICT(periodo) DO UPDATE SET registros = hll_fusionar(registros, excluded.registros)",
+            usuarios
+        )
+        if lote["usuarios_por_dia"]:
+            # Descartar los usuarios por día que ya no se reportan
+            limite = (date.fromisoformat(max(lote["usuarios_por_dia"])) - timedelta(days=DIAS_USUARIOS_POR_DIA)).isoformat()
+            conexion.execute("DELETE FROM usuarios WHERE periodo != 'total' AND periodo < ?", (limite,))
+
+
+def crear_backend_estadisticas(tipo: str = STATS_BACKEND) -> BackendEstadisticas:
+    """
+    Crea el backend de estadísticas configurado
+    
+    Args:
+        tipo: "memoria" (un solo proceso) o "sqlite" (compartido entre workers)
+        
+    Returns:
+        Backend de estadísticas
+    """
+    tipo = (tipo or "memoria").lower()
+    if tipo == "sqlite":
+        return EstadisticasSQLite(STATS_DB)
+    if tipo != "memoria":
+        logger.warning(f"STATS_BACKEND desconocido '{tipo}', se usará 'memoria'")
+    return EstadisticasEnMemoria()
+
+
+# Backend global de estadísticas
+backend_estadisticas = crear_backend_estadisticas()
+
+
+def iniciar_estadisticas():
+    """Carga las estadísticas e inicia la escritura en segundo plano (al iniciar la aplicación)"""
+    backend_estadisticas.iniciar()
+
+
+def detener_estadisticas():
+    """Escribe lo pendiente y compacta las estadísticas (al apagar la aplicación)"""
+    backend_estadisticas.detener()
+
+
+def nombre_destino(destino: str) -> str:
+    """Nombre para mostrar de un destino guardado en minúsculas ("nueva york" -> "Nueva York")"""
+    encontrado = indice_destinos.buscar_exacto(destino)
+    return encontrado.nombre if encontrado else destino.capitalize()
 
 def registrar_consulta(usuario_id: str = None, destino: str = None, pregunta: str = None):
     """
-    Registrar una nueva consulta en las estadísticas
+    Registrar una nueva consulta en las estadísticas (O(1), sin E/S en el camino de la petición)
     
     Args:
         usuario_id: ID único del usuario (opcional, se genera si no se proporciona)
         destino: Nombre del destino consultado (opcional)
         pregunta: Texto de la pregunta (opcional, para extraer destino)
     """
-    stats = load_stats()
-    
-    # Convertir set de usuarios únicos a list si es necesario
-    if isinstance(stats.get("usuarios_unicos"), list):
-        stats["usuarios_unicos"] = set(stats["usuarios_unicos"])
-    elif "usuarios_unicos" not in stats:
-        stats["usuarios_unicos"] = set()
-    
     # Generar ID de usuario si no se proporciona (basado en timestamp)
     if not usuario_id:
         usuario_id = f"user_{datetime.now().timestamp()}"
     
-    # Agregar usuario único
-    stats["usuarios_unicos"].add(usuario_id)
-    stats["total_usuarios"] = len(stats["usuarios_unicos"])
-    
-    # Registrar consulta por día
-    fecha_actual = date.today().isoformat()
-    if fecha_actual not in stats["consultas_por_dia"]:
-        stats["consultas_por_dia"][fecha_actual] = 0
-    stats["consultas_por_dia"][fecha_actual] += 1
-    
     # Intentar obtener destino si no se proporciona
     if not destino and pregunta:
-        destino = extraer_destino_simple(pregunta)
+        destino_encontrado = extraer_destino(pregunta)
+        destino = destino_encontrado.nombre if destino_encontrado else None
     
-    # Registrar destino consultado
-    if destino:
-        destino_normalizado = destino.lower().strip()
-        if destino_normalizado not in stats["destinos_consultados"]:
-            stats["destinos_consultados"][destino_normalizado] = 0
-        stats["destinos_consultados"][destino_normalizado] += 1
-    
-    # Incrementar total de consultas
-    stats["total_consultas"] = stats.get("total_consultas", 0) + 1
-    
-    # Guardar estadísticas
-    save_stats(stats)
+    backend_estadisticas.registrar(
+        fecha=date.today().isoformat(),
+        usuario_id=usuario_id,
+        destino=destino.lower().strip() if destino else None
+    )
 
 def obtener_estadisticas() -> Dict:
     """
@@ -122,14 +666,18 @@ def obtener_estadisticas() -> Dict:
     Returns:
         Diccionario con estadísticas formateadas
     """
-    stats = load_stats()
+    return formatear_estadisticas(backend_estadisticas.copia())
+
+def formatear_estadisticas(stats: Dict) -> Dict:
+    """
+    Formatea las estadísticas en memoria para la API
     
-    # Convertir set a list
-    if isinstance(stats.get("usuarios_unicos"), set):
-        usuarios_unicos_list = list(stats["usuarios_unicos"])
-    else:
-        usuarios_unicos_list = stats.get("usuarios_unicos", [])
+    Args:
+        stats: Estadísticas en memoria
     
+    Returns:
+        Diccionario con estadísticas formateadas
+    """
     # Obtener destinos más consultados (top 10)
     destinos_consultados = stats.get("destinos_consultados", {})
     destinos_ordenados = sorted(
@@ -151,18 +699,31 @@ def obtener_estadisticas() -> Dict:
     # Obtener consultas de hoy
     consultas_hoy = consultas_por_dia.get(fecha_actual.isoformat(), 0)
     
+    # Usuarios únicos estimados (HyperLogLog)
+    usuarios_por_dia = stats.get("usuarios_por_dia", {})
+    usuarios_hoy = usuarios_por_dia.get(fecha_actual.isoformat())
+    
     return {
-        "total_usuarios": len(usuarios_unicos_list),
+        "total_usuarios": stats["usuarios_unicos"].estimar(),
+        "usuarios_hoy": usuarios_hoy.estimar() if usuarios_hoy else 0,
+        # Error relativo típico de los conteos de usuarios (una desviación estándar)
+        "error_relativo_usuarios": {
+            "total": round(stats["usuarios_unicos"].error_relativo, 4),
+            "por_dia": round(HyperLogLog(STATS_HLL_PRECISION_DIA).error_relativo, 4)
+        },
         "total_consultas": stats.get("total_consultas", 0),
         "consultas_hoy": consultas_hoy,
         "destinos_mas_consultados": [
-            {"destino": destino.capitalize(), "consultas": count}
+            {"destino": nombre_destino(destino), "consultas": count}
             for destino, count in destinos_ordenados
         ],
         "consultas_por_dia": [
-            {"fecha": fecha, "consultas": count}
+            {
+                "fecha": fecha,
+                "consultas": count,
+                "usuarios": usuarios_por_dia[fecha].estimar() if fecha in usuarios_por_dia else None
+            }
             for fecha, count in sorted(consultas_recientes.items(), reverse=True)
             if count > 0
         ]
     }
-
@@ -0,0 +1,11 @@
+"""
+Configuración común de los tests
+
+Los módulos del backend se importan por su nombre (from config import ...),
+así que el directorio backend/ tiene que estar en sys.path.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+"""Tests de la agrupación de llamadas idénticas (single-flight)"""
+
+import asyncio
+
+import pytest
+
+from agrupador import AgrupadorLlamadas
+
+
+def test_llamadas_concurrentes_comparten_una_sola():
+    agrupador = AgrupadorLlamadas("test")
+    llamadas = []
+    
+    async def llamar():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return "respuesta"
+    
+    async def escenario():
+        return await asyncio.gather(*(agrupador.ejecutar("prompt", llamar) for _ in range(5)))
+    
+    assert asyncio.run(escenario()) == ["respuesta"] * 5
+    assert len(llamadas) == 1
+    assert agrupador.estadisticas()["agrupadas"] == 4
+    assert agrupador.estadisticas()["en_curso"] == 0
+
+
+def test_cancelar_un_suscriptor_no_cancela_a_los_demas():
+    agrupador = AgrupadorLlamadas("test")
+    
+    async def llamar():
+        await asyncio.sleep(0.05)
+        return "respuesta"
+    
+    async def escenario():
+        impaciente = asyncio.create_task(agrupador.ejecutar("prompt", llamar))
+        paciente = asyncio.create_task(agrupador.ejecutar("prompt", llamar))
+        await asyncio.sleep(0.01)
+        impaciente.cancel()
+        return await paciente
+    
+    assert asyncio.run(escenario()) == "respuesta"
+    assert agrupador.canceladas == 0
+
+
+def test_sin_suscriptores_la_llamada_se_cancela():
+    agrupador = AgrupadorLlamadas("test")
+    canceladas = []
+    
+    async def llamar():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            canceladas.append(1)
+            raise
+    
+    async def escenario():
+        tarea = asyncio.create_task(agrupador.ejecutar("prompt", llamar))
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        await asyncio.sleep(0)
+    
+    asyncio.run(escenario())
+    assert canceladas == [1]
+    assert agrupador.canceladas == 1
+
+
+def test_timeout_y_errores_llegan_a_todos():
+    agrupador = AgrupadorLlamadas("test")
+    
+    async def lenta():
+        await asyncio.sleep(10)
+    
+    async def fallida():
+        raise RuntimeError("error de OpenAI")
+    
+    async def escenario():
+        lentas = await asyncio.gather(
+            *(agrupador.ejecutar("lenta", lenta, timeout=0.02) for _ in range(2)), return_exceptions=True
+        )
+        fallidas = await asyncio.gather(
+            *(agrupador.ejecutar("fallida", fallida) for _ in range(2)), return_exceptions=True
+        )
+        return lentas, fallidas
+    
+    lentas, fallidas = asyncio.run(escenario())
+    assert all(isinstance(e, asyncio.TimeoutError) for e in lentas)
+    assert all(isinstance(e, RuntimeError) for e in fallidas)
+    assert agrupador.tiempos_agotados == 1
+
+
+def test_stream_compartido_llega_completo_a_quien_se_une_tarde():
+    agrupador = AgrupadorLlamadas("test")
+    producidos = []
+    
+    async def productor():
+        for fragmento in ["Lisboa ", "es ", "genial"]:
+            producidos.append(fragmento)
+            yield fragmento
+            await asyncio.sleep(0.01)
+    
+    async def leer():
+        return [evento async for evento in agrupador.difundir("stream", productor)]
+    
+    async def escenario():
+        primero = asyncio.create_task(leer())
+        await asyncio.sleep(0.015)
+        return await asyncio.gather(primero, leer())
+    
+    assert asyncio.run(escenario()) == [["Lisboa ", "es ", "genial"]] * 2
+    assert len(producidos) == 3
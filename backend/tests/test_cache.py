@@ -0,0 +1,89 @@
+"""Tests de la caché en memoria con TTL, LRU y agrupación de peticiones"""
+
+import asyncio
+import time
+
+import pytest
+
+from cache import CacheTTL
+
+
+def test_ttl_y_cache_negativa(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: ahora[0])
+    cache = CacheTTL("test_ttl", max_entradas=10, ttl=60, ttl_negativo=5)
+    cache.guardar("lisboa", {"temperatura": 20})
+    cache.guardar("atlantida", None)
+    
+    assert cache.obtener("lisboa") == (True, {"temperatura": 20})
+    assert cache.obtener("atlantida") == (True, None)
+    ahora[0] += 10
+    assert cache.obtener("atlantida") == (False, None)
+    assert cache.obtener("lisboa") == (True, {"temperatura": 20})
+    ahora[0] += 60
+    assert cache.obtener("lisboa") == (False, None)
+
+
+def test_sin_ttl_negativo_no_guarda_none():
+    cache = CacheTTL("test_sin_negativo", max_entradas=10, ttl=60)
+    cache.guardar("atlantida", None)
+    
+    assert cache.obtener("atlantida") == (False, None)
+
+
+def test_desalojo_lru():
+    cache = CacheTTL("test_lru", max_entradas=2, ttl=60)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    cache.obtener("a")
+    cache.guardar("c", 3)
+    
+    assert cache.obtener("b") == (False, None)
+    assert cache.obtener("a") == (True, 1)
+    assert cache.desalojos == 1
+
+
+def test_peticiones_concurrentes_hacen_una_llamada():
+    cache = CacheTTL("test_agrupadas", max_entradas=10, ttl=60)
+    llamadas = []
+    
+    async def calcular():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return "soleado"
+    
+    async def escenario():
+        return await asyncio.gather(*(cache.obtener_o_calcular("roma", calcular) for _ in range(5)))
+    
+    assert asyncio.run(escenario()) == ["soleado"] * 5
+    assert len(llamadas) == 1
+    assert cache.agrupadas == 4
+
+
+def test_cancelar_una_peticion_no_cancela_la_llamada_compartida():
+    cache = CacheTTL("test_cancelada", max_entradas=10, ttl=60)
+    
+    async def calcular():
+        await asyncio.sleep(0.05)
+        return "nublado"
+    
+    async def escenario():
+        impaciente = asyncio.create_task(cache.obtener_o_calcular("oslo", calcular))
+        paciente = asyncio.create_task(cache.obtener_o_calcular("oslo", calcular))
+        await asyncio.sleep(0.01)
+        impaciente.cancel()
+        return await paciente
+    
+    assert asyncio.run(escenario()) == "nublado"
+    assert cache.obtener("oslo") == (True, "nublado")
+
+
+def test_error_se_propaga_y_no_se_guarda():
+    cache = CacheTTL("test_error", max_entradas=10, ttl=60)
+    
+    async def calcular():
+        raise RuntimeError("sin servicio")
+    
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.obtener_o_calcular("quito", calcular))
+    assert cache.obtener("quito") == (False, None)
@@ -0,0 +1,45 @@
+"""Tests de la caché persistente de fotos"""
+
+import threading
+
+from cache_fotos import CacheFotos
+
+CLAVE = ("lisboa", 3, "landscape")
+FOTOS = ["https://images.unsplash.com/a", "https://images.unsplash.com/b"]
+
+
+def test_las_fotos_sobreviven_a_un_reinicio(tmp_path):
+    ruta = str(tmp_path / "fotos.sqlite3")
+    cache = CacheFotos(ruta, ttl=60)
+    cache.abrir()
+    cache.guardar(CLAVE, FOTOS)
+    cache.cerrar()
+    
+    reabierta = CacheFotos(ruta, ttl=60)
+    reabierta.abrir()
+    assert reabierta.obtener(CLAVE) == (FOTOS, True)
+    reabierta.cerrar()
+
+
+def test_guardar_mientras_se_cierra_no_falla(tmp_path):
+    cache = CacheFotos(str(tmp_path / "fotos.sqlite3"), ttl=60)
+    cache.abrir()
+    
+    class LockQueCierra:
+        """Simula que cerrar() toma el lock justo antes que guardar()"""
+        
+        def __init__(self):
+            self._lock = threading.Lock()
+        
+        def __enter__(self):
+            self._lock.acquire()
+            if cache._conexion is not None:
+                cache._conexion.close()
+                cache._conexion = None
+        
+        def __exit__(self, *excepcion):
+            self._lock.release()
+    
+    cache._lock = LockQueCierra()
+    cache.guardar(CLAVE, FOTOS)
+    assert cache.obtener(CLAVE) == (FOTOS, True)
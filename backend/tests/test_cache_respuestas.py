@@ -0,0 +1,74 @@
+"""Tests de la caché de respuestas (coincidencia exacta y aproximada)"""
+
+from cache_respuestas import CacheRespuestas
+from destinos import extraer_destino
+
+MODELO = "gpt-3.5-turbo"
+PREGUNTA_PARIS = "¿Qué lugares puedo visitar en París durante una semana con mi familia?"
+
+
+def clave(cache, pregunta, contexto=None):
+    """Clave de la pregunta como la arma main.clave_cache_respuesta"""
+    destino = extraer_destino(pregunta)
+    return cache.clave_contexto(
+        contexto, MODELO, 0.7, destino_pregunta=f"{destino.nombre}|{destino.pais}" if destino else None
+    )
+
+
+def cache_con_paris():
+    cache = CacheRespuestas(activa=True, ttl=60, max_entradas=10, similitud_minima=0.8)
+    cache.guardar(PREGUNTA_PARIS, clave(cache, PREGUNTA_PARIS), {"respuesta": "París"})
+    return cache
+
+
+def test_coincidencia_exacta_y_aproximada():
+    cache = cache_con_paris()
+    
+    assert cache.buscar(PREGUNTA_PARIS, clave(cache, PREGUNTA_PARIS)) == {"respuesta": "París"}
+    parecida = "Qué lugares puedo visitar en París durante una semana con mi familia, por favor"
+    assert cache.buscar(parecida, clave(cache, parecida)) == {"respuesta": "París"}
+    assert cache.aciertos_exactos == 1
+    assert cache.aciertos_aproximados == 1
+
+
+def test_destino_de_la_pregunta_forma_parte_de_la_clave():
+    cache = cache_con_paris()
+    roma = "¿Qué lugares puedo visitar en Roma durante una semana con mi familia?"
+    
+    assert clave(cache, roma) != clave(cache, PREGUNTA_PARIS)
+    assert cache.buscar(roma, clave(cache, roma)) is None
+
+
+def test_aproximada_rechaza_otro_destino_en_el_mismo_contexto():
+    cache = cache_con_paris()
+    # Misma clave (sin destino resuelto), pero la pregunta nombra otra ciudad
+    pregunta_roma = "¿Qué lugares puedo visitar en Roma durante una semana con mi familia?"
+    
+    assert cache.buscar(pregunta_roma, clave(cache, PREGUNTA_PARIS)) is None
+
+
+def test_aproximada_rechaza_negaciones_distintas():
+    cache = cache_con_paris()
+    negada = "¿Qué lugares no recomiendas visitar en París durante una semana con mi familia?"
+    
+    assert cache.buscar(negada, clave(cache, negada)) is None
+
+
+def test_aproximada_rechaza_numeros_distintos():
+    cache = CacheRespuestas(activa=True, ttl=60, max_entradas=10, similitud_minima=0.5)
+    pregunta = "Plan de 5 días en Lisboa con presupuesto medio"
+    cache.guardar(pregunta, clave(cache, pregunta), {"respuesta": "5"})
+    otra = "Plan de 7 días en Lisboa con presupuesto medio"
+    
+    assert cache.buscar(otra, clave(cache, otra)) is None
+
+
+def test_desalojo_lru():
+    cache = CacheRespuestas(activa=True, ttl=60, max_entradas=2, similitud_minima=0.8)
+    preguntas = ["Hoteles baratos en Lisboa", "Restaurantes típicos en Oporto", "Museos gratis en Madrid"]
+    for i, pregunta in enumerate(preguntas):
+        cache.guardar(pregunta, clave(cache, pregunta), {"respuesta": i})
+    
+    assert cache.buscar(preguntas[0], clave(cache, preguntas[0])) is None
+    assert cache.buscar(preguntas[2], clave(cache, preguntas[2])) == {"respuesta": 2}
+    assert cache.desalojos == 1
@@ -0,0 +1,130 @@
+"""Tests del circuit breaker y de su uso en el transporte HTTP"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from circuito import ABIERTO, CERRADO, SEMIABIERTO, Circuito, CircuitoAbierto
+from http_client import _TransporteServicio
+
+
+def circuito(**kwargs):
+    opciones = dict(ventana=10, min_peticiones=4, umbral_errores=0.5,
+                    latencia_lenta=1.0, umbral_lentas=0.8, espera_apertura=60)
+    opciones.update(kwargs)
+    return Circuito("test", **opciones)
+
+
+def test_se_abre_con_errores_y_rechaza_al_instante():
+    c = circuito()
+    for error in (False, True, False, True):
+        c.registrar(0.1, error, c.permitir())
+    
+    assert c.estado == ABIERTO
+    with pytest.raises(CircuitoAbierto):
+        c.permitir()
+    assert c.rechazadas == 1
+
+
+def test_no_se_abre_sin_el_minimo_de_peticiones():
+    c = circuito()
+    for _ in range(3):
+        c.registrar(0.1, True, c.permitir())
+    
+    assert c.estado == CERRADO
+
+
+def test_se_abre_con_respuestas_lentas():
+    c = circuito()
+    for _ in range(4):
+        c.registrar(2.0, False, c.permitir())
+    
+    assert c.estado == ABIERTO
+
+
+def test_semiabierto_deja_una_sola_prueba_y_se_cierra_si_responde():
+    c = circuito(espera_apertura=0)
+    for _ in range(4):
+        c.registrar(0.1, True, c.permitir())
+    
+    prueba = c.permitir()
+    assert prueba is True
+    assert c.estado == SEMIABIERTO
+    with pytest.raises(CircuitoAbierto):
+        c.permitir()
+    c.registrar(0.1, False, prueba)
+    assert c.estado == CERRADO
+    assert c.permitir() is False
+
+
+def test_prueba_fallida_vuelve_a_abrir():
+    c = circuito(espera_apertura=0)
+    for _ in range(4):
+        c.registrar(0.1, True, c.permitir())
+    
+    c.registrar(0.1, True, c.permitir())
+    assert c.estado == ABIERTO
+    assert c.aperturas == 2
+
+
+def test_cancelada_despues_de_latencia_lenta_cuenta_como_lenta():
+    c = circuito()
+    for _ in range(4):
+        c.cancelar(1.5, c.permitir())
+    
+    assert c.estado == ABIERTO
+    # Las canceladas no entran en el p95 de las respuestas reales
+    assert c.p95(min_muestras=1) is None
+
+
+def test_cancelada_pronto_no_cuenta_y_libera_la_prueba():
+    c = circuito(espera_apertura=0)
+    for _ in range(4):
+        c.registrar(0.1, True, c.permitir())
+    
+    c.cancelar(0.1, c.permitir())
+    assert c.estado == SEMIABIERTO
+    assert c.permitir() is True
+
+
+def test_transporte_cuenta_las_peticiones_cortadas_por_quien_llama(monkeypatch):
+    async def lenta(self, request):
+        await asyncio.sleep(10)
+    
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", lenta)
+    transporte = _TransporteServicio("test_transporte_lento")
+    transporte.circuito = circuito(latencia_lenta=0.02)
+    
+    async def escenario():
+        async with httpx.AsyncClient(transport=transporte, base_url="http://servicio") as cliente:
+            for _ in range(4):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(cliente.get("/"), 0.05)
+            with pytest.raises(CircuitoAbierto):
+                await cliente.get("/")
+    
+    asyncio.run(escenario())
+    assert transporte.circuito.estado == ABIERTO
+
+
+def test_transporte_cuenta_429_y_5xx_pero_no_404(monkeypatch):
+    estados = iter([404, 404, 404, 404, 503, 429])
+    
+    async def responder(self, request):
+        return httpx.Response(next(estados), request=request)
+    
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", responder)
+    transporte = _TransporteServicio("test_transporte_estados")
+    transporte.circuito = circuito(ventana=4)
+    
+    async def escenario():
+        async with httpx.AsyncClient(transport=transporte, base_url="http://servicio") as cliente:
+            for _ in range(4):
+                await cliente.get("/")
+            assert transporte.circuito.estado == CERRADO
+            for _ in range(2):
+                await cliente.get("/")
+    
+    asyncio.run(escenario())
+    assert transporte.circuito.estado == ABIERTO
@@ -0,0 +1,52 @@
+"""Tests del estimador HyperLogLog"""
+
+import pytest
+
+from hyperloglog import HyperLogLog
+
+
+def llenar(hll, inicio, fin):
+    for i in range(inicio, fin):
+        hll.agregar(f"usuario_{i}")
+    return hll
+
+
+def test_estimacion_dentro_del_error():
+    hll = llenar(HyperLogLog(12), 0, 20000)
+    
+    assert abs(hll.estimar() - 20000) / 20000 < 4 * hll.error_relativo
+
+
+def test_cardinalidad_pequena_y_duplicados():
+    hll = HyperLogLog(14)
+    for _ in range(3):
+        llenar(hll, 0, 50)
+    
+    assert hll.estimar() == 50
+    assert HyperLogLog(14).estimar() == 0
+
+
+def test_fusionar_es_la_union():
+    a = llenar(HyperLogLog(12), 0, 6000)
+    b = llenar(HyperLogLog(12), 4000, 10000)
+    union = llenar(HyperLogLog(12), 0, 10000)
+    
+    a.fusionar(b)
+    
+    assert a.registros == union.registros
+
+
+def test_fusionar_con_otra_precision_falla():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).fusionar(HyperLogLog(14))
+
+
+def test_serializacion_y_precision():
+    hll = llenar(HyperLogLog(10), 0, 300)
+    
+    restaurado = HyperLogLog.desde_texto(hll.a_texto(), 10)
+    assert restaurado.registros == hll.registros
+    with pytest.raises(ValueError):
+        HyperLogLog.desde_texto(hll.a_texto(), 12)
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
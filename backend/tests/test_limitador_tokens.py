@@ -0,0 +1,101 @@
+"""Tests del límite de peticiones y tokens por minuto de OpenAI"""
+
+import asyncio
+import time
+
+import pytest
+
+from limitador_tokens import LimitadorTokens
+from planificador import ServicioSaturado
+
+MODELO = "gpt-test"
+
+
+def limitador(rpm=600, tpm=60000):
+    # 60000 TPM = 1000 tokens por segundo: las esperas de los tests son de milisegundos
+    return LimitadorTokens({MODELO: (rpm, tpm)})
+
+
+def disponibles(limitador_tokens):
+    datos = limitador_tokens.estadisticas()[MODELO]
+    return datos["rpm_disponibles"], datos["tpm_disponibles"]
+
+
+def test_reserva_inmediata_y_ajuste_con_el_uso_real():
+    lim = limitador()
+    
+    reserva = asyncio.run(lim.reservar(MODELO, 2000))
+    assert disponibles(lim)[1] == pytest.approx(58000, abs=50)
+    lim.ajustar(reserva, 500)
+    assert disponibles(lim)[1] == pytest.approx(59500, abs=50)
+    # Solo cuenta el primer ajuste
+    lim.ajustar(reserva, 0)
+    assert disponibles(lim)[1] == pytest.approx(59500, abs=50)
+
+
+def test_espera_a_que_se_recargue_el_presupuesto():
+    lim = limitador()
+    
+    async def escenario():
+        await lim.reservar(MODELO, 60000)
+        inicio = time.monotonic()
+        await lim.reservar(MODELO, 100, espera_maxima=1)
+        return time.monotonic() - inicio
+    
+    espera = asyncio.run(escenario())
+    assert 0.08 <= espera < 0.5
+    assert lim.estadisticas()[MODELO]["esperas"] == 1
+
+
+def test_rechaza_si_la_espera_supera_la_maxima():
+    lim = limitador()
+    
+    async def escenario():
+        await lim.reservar(MODELO, 60000)
+        await lim.reservar(MODELO, 30000, espera_maxima=1)
+    
+    with pytest.raises(ServicioSaturado) as error:
+        asyncio.run(escenario())
+    assert error.value.reintentar_en >= 30
+    with pytest.raises(ServicioSaturado):
+        asyncio.run(lim.reservar(MODELO, 70000))
+    assert lim.estadisticas()[MODELO]["rechazadas"] == 2
+
+
+def test_cancelar_la_espera_devuelve_la_reserva():
+    lim = limitador()
+    
+    async def escenario():
+        await lim.reservar(MODELO, 60000)
+        tarea = asyncio.create_task(lim.reservar(MODELO, 5000))
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+    
+    asyncio.run(escenario())
+    # Solo queda descontada la primera reserva (más lo recargado mientras tanto)
+    assert 0 <= disponibles(lim)[1] < 1000
+    assert disponibles(lim)[0] == 599
+
+
+def test_liberar_devuelve_peticion_y_tokens_una_sola_vez():
+    lim = limitador(rpm=10)
+    reserva = asyncio.run(lim.reservar(MODELO, 3000))
+    
+    lim.liberar(reserva)
+    lim.liberar(reserva)
+    assert disponibles(lim) == (10, 60000)
+    
+    otra = asyncio.run(lim.reservar(MODELO, 3000))
+    lim.ajustar(otra, 1000)
+    lim.liberar(otra)
+    assert disponibles(lim)[1] == pytest.approx(59000, abs=50)
+
+
+def test_modelo_sin_limites_no_se_limita():
+    lim = limitador()
+    
+    reserva = asyncio.run(lim.reservar("otro-modelo", 10 ** 9))
+    lim.liberar(reserva)
+    assert "otro-modelo" not in lim.estadisticas()
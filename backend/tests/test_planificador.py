@@ -0,0 +1,97 @@
+"""Tests del control de admisión de las llamadas a OpenAI"""
+
+import asyncio
+
+import pytest
+
+from planificador import PRIORIDAD_INTERACTIVA, PRIORIDAD_SEGUNDO_PLANO, PlanificadorLlamadas, ServicioSaturado
+
+MODELO = "gpt-test"
+
+
+def test_limita_las_llamadas_simultaneas():
+    planificador = PlanificadorLlamadas("test", max_concurrentes=2, max_cola=10)
+    en_curso, maximo = [0], [0]
+    
+    async def llamada():
+        async with planificador.turno(MODELO):
+            en_curso[0] += 1
+            maximo[0] = max(maximo[0], en_curso[0])
+            await asyncio.sleep(0.01)
+            en_curso[0] -= 1
+    
+    async def escenario():
+        await asyncio.gather(*(llamada() for _ in range(6)))
+    
+    asyncio.run(escenario())
+    assert maximo[0] == 2
+    assert planificador._colas[MODELO].en_curso == 0
+
+
+def test_las_interactivas_pasan_antes_que_las_de_segundo_plano():
+    planificador = PlanificadorLlamadas("test", max_concurrentes=1, max_cola=10)
+    orden = []
+    
+    async def llamada(nombre, prioridad):
+        async with planificador.turno(MODELO, prioridad):
+            orden.append(nombre)
+            await asyncio.sleep(0.01)
+    
+    async def escenario():
+        primera = asyncio.create_task(llamada("primera", PRIORIDAD_INTERACTIVA))
+        await asyncio.sleep(0)
+        resto = [
+            asyncio.create_task(llamada("fondo", PRIORIDAD_SEGUNDO_PLANO)),
+            asyncio.create_task(llamada("interactiva", PRIORIDAD_INTERACTIVA)),
+        ]
+        await asyncio.gather(primera, *resto)
+    
+    asyncio.run(escenario())
+    assert orden == ["primera", "interactiva", "fondo"]
+
+
+def test_rechaza_con_la_cola_llena_y_al_vencer_la_espera():
+    planificador = PlanificadorLlamadas("test", max_concurrentes=1, max_cola=1)
+    
+    async def ocupar(segundos):
+        async with planificador.turno(MODELO):
+            await asyncio.sleep(segundos)
+    
+    async def escenario():
+        ocupada = asyncio.create_task(ocupar(0.1))
+        await asyncio.sleep(0)
+        en_espera = asyncio.create_task(planificador.turno(MODELO, espera_maxima=0.02).__aenter__())
+        await asyncio.sleep(0)
+        with pytest.raises(ServicioSaturado):
+            async with planificador.turno(MODELO):
+                pass
+        with pytest.raises(ServicioSaturado):
+            await en_espera
+        await ocupada
+    
+    asyncio.run(escenario())
+    cola = planificador._colas[MODELO]
+    assert cola.rechazadas == 1
+    assert cola.vencidas == 1
+    assert cola.en_curso == 0
+    assert cola.esperando == 0
+
+
+def test_cancelar_en_la_cola_no_pierde_el_hueco():
+    planificador = PlanificadorLlamadas("test", max_concurrentes=1, max_cola=10)
+    
+    async def ocupar():
+        async with planificador.turno(MODELO):
+            await asyncio.sleep(0.02)
+    
+    async def escenario():
+        ocupada = asyncio.create_task(ocupar())
+        await asyncio.sleep(0)
+        cancelada = asyncio.create_task(ocupar())
+        await asyncio.sleep(0)
+        cancelada.cancel()
+        await asyncio.gather(ocupada, cancelada, return_exceptions=True)
+        await asyncio.wait_for(ocupar(), 1)
+    
+    asyncio.run(escenario())
+    assert planificador._colas[MODELO].en_curso == 0
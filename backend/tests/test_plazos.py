@@ -0,0 +1,138 @@
+"""Tests del plazo por consulta y de su uso en /api/planificar"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import plazos
+from plazos import ClienteDesconectado, Plazo, PlazoAgotado, ejecutar_con_plazo
+
+
+def test_limitar_reparte_lo_que_queda():
+    plazo = Plazo(10)
+    
+    assert plazo.limitar() == pytest.approx(10, abs=0.1)
+    assert plazo.limitar(5) == 5
+    assert plazo.limitar(5, reserva=8) == pytest.approx(2, abs=0.1)
+    assert plazo.limitar(reserva=20) == 0
+    assert not plazo.vencido
+
+
+def test_cumplir_lanza_plazo_agotado_y_cancela_la_etapa():
+    canceladas = []
+    
+    async def etapa():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            canceladas.append("openai")
+            raise
+    
+    with pytest.raises(PlazoAgotado):
+        asyncio.run(Plazo(0.05).cumplir(etapa(), "openai"))
+    assert canceladas == ["openai"]
+
+
+def test_opcional_se_omite_sin_tiempo_suficiente(monkeypatch):
+    monkeypatch.setattr(plazos, "PLAZO_MINIMO_OPCIONAL", 1)
+    llamadas = []
+    
+    async def etapa():
+        llamadas.append(1)
+        return "soleado"
+    
+    assert asyncio.run(Plazo(5).opcional(etapa, "clima", 5, reserva=4.5)) is None
+    assert llamadas == []
+    assert asyncio.run(Plazo(5).opcional(etapa, "clima", 5)) == "soleado"
+
+
+def test_opcional_devuelve_none_si_no_termina_a_tiempo(monkeypatch):
+    monkeypatch.setattr(plazos, "PLAZO_MINIMO_OPCIONAL", 0.01)
+    monkeypatch.setattr(plazos, "PLAZO_MARGEN_TRANSPORTE", 0)
+    
+    async def etapa():
+        await asyncio.sleep(10)
+    
+    inicio = time.monotonic()
+    assert asyncio.run(Plazo(5).opcional(etapa, "fotos", 0.05)) is None
+    assert time.monotonic() - inicio < 1
+
+
+def test_opcional_deja_que_venza_antes_el_timeout_del_cliente(monkeypatch):
+    monkeypatch.setattr(plazos, "PLAZO_MINIMO_OPCIONAL", 0.01)
+    monkeypatch.setattr(plazos, "PLAZO_MARGEN_TRANSPORTE", 0.2)
+    
+    async def etapa_con_timeout_propio():
+        # Como httpx: falla por su cuenta al pasar su timeout (0.05s)
+        await asyncio.sleep(0.05)
+        raise httpx.ReadTimeout("timeout del cliente HTTP")
+    
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(Plazo(5).opcional(etapa_con_timeout_propio, "clima", 0.05))
+
+
+class PeticionFalsa:
+    """Petición ASGI cuyo cliente se desconecta a los `segundos`"""
+    
+    def __init__(self, segundos):
+        self.segundos = segundos
+    
+    async def receive(self):
+        await asyncio.sleep(self.segundos)
+        return {"type": "http.disconnect"}
+
+
+def test_ejecutar_con_plazo_cancela_al_desconectarse_el_cliente():
+    canceladas = []
+    
+    async def consulta():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            canceladas.append("consulta")
+            raise
+    
+    with pytest.raises(ClienteDesconectado):
+        asyncio.run(ejecutar_con_plazo(consulta(), Plazo(5), PeticionFalsa(0.05)))
+    assert canceladas == ["consulta"]
+
+
+def test_ejecutar_con_plazo_al_vencer_y_a_tiempo():
+    async def consulta(segundos):
+        await asyncio.sleep(segundos)
+        return "respuesta"
+    
+    with pytest.raises(PlazoAgotado):
+        asyncio.run(ejecutar_con_plazo(consulta(10), Plazo(0.05), PeticionFalsa(10)))
+    assert asyncio.run(ejecutar_con_plazo(consulta(0), Plazo(5), PeticionFalsa(10))) == "respuesta"
+
+
+def test_planificar_responde_504_al_agotar_el_plazo(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.chdir(tmp_path)
+    import main
+    
+    async def openai_lento(**kwargs):
+        await asyncio.sleep(10)
+    
+    monkeypatch.setattr(main, "PLAZO_PLANIFICAR", 0.2)
+    monkeypatch.setattr(main, "openweather_api_key", None)
+    monkeypatch.setattr(main, "unsplash_api_key", None)
+    monkeypatch.setattr(main.client.chat.completions, "create", openai_lento)
+    monkeypatch.setattr(main.cache_respuestas, "activa", False)
+    
+    async def escenario():
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            return await cliente.post(
+                "/api/planificar",
+                json={"pregunta": "¿Qué lugares puedo visitar en Lisboa en tres días?"},
+                headers={"X-Forwarded-For": "10.0.0.25"}
+            )
+    
+    inicio = time.monotonic()
+    respuesta = asyncio.run(escenario())
+    assert respuesta.status_code == 504
+    assert time.monotonic() - inicio < 2
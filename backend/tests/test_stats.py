@@ -0,0 +1,191 @@
+"""Tests de las estadísticas (snapshot, log de eventos y backend SQLite)"""
+
+import pytest
+
+import stats
+
+
+@pytest.fixture(autouse=True)
+def directorio_temporal(tmp_path, monkeypatch):
+    """Cada test escribe stats.json, el log y la base en un directorio propio"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stats, "STATS_EVENTOS_FILE", str(tmp_path / "stats_eventos.jsonl"))
+    return tmp_path
+
+
+def estadisticas_con_consultas(consultas):
+    datos = stats.estadisticas_vacias()
+    for i, (fecha, usuario, destino) in enumerate(consultas, start=1):
+        stats.aplicar_evento(datos, {"id": i, "fecha": fecha, "usuario": usuario, "destino": destino})
+    return datos
+
+
+CONSULTAS = [
+    ("2026-10-17", "ana", "paris"),
+    ("2026-10-18", "ana", "roma"),
+    ("2026-10-18", "luis", "paris"),
+]
+
+
+def test_cambio_de_precision_conserva_el_snapshot(monkeypatch):
+    stats.save_stats(estadisticas_con_consultas(CONSULTAS))
+    monkeypatch.setattr(stats, "STATS_HLL_PRECISION", 12)
+    monkeypatch.setattr(stats, "STATS_HLL_PRECISION_DIA", 10)
+    
+    cargadas = stats.load_stats()
+    
+    assert cargadas["total_consultas"] == 3
+    assert cargadas["destinos_consultados"] == {"paris": 2, "roma": 1}
+    assert cargadas["consultas_por_dia"] == {"2026-10-17": 1, "2026-10-18": 2}
+    assert cargadas["usuarios_unicos"].precision == 12
+    assert cargadas["usuarios_unicos"].estimar() == 0
+    assert cargadas["usuarios_por_dia"] == {}
+
+
+def test_cambio_de_precision_en_sqlite(monkeypatch, directorio_temporal):
+    ruta = str(directorio_temporal / "stats.sqlite3")
+    backend = stats.EstadisticasSQLite(ruta)
+    backend.iniciar()
+    for fecha, usuario, destino in CONSULTAS:
+        backend.registrar(fecha, usuario, destino)
+    backend.detener()
+    
+    monkeypatch.setattr(stats, "STATS_HLL_PRECISION", 12)
+    backend = stats.EstadisticasSQLite(ruta)
+    copia = backend.copia()
+    assert copia["total_consultas"] == 3
+    assert copia["destinos_consultados"] == {"paris": 2, "roma": 1}
+    assert copia["usuarios_unicos"].estimar() == 0
+    assert copia["usuarios_por_dia"]["2026-10-18"].estimar() == 2
+    
+    # La siguiente escritura reemplaza el contador guardado con la precisión anterior
+    backend.registrar("2026-10-18", "eva", "roma")
+    backend.detener()
+    backend = stats.EstadisticasSQLite(ruta)
+    copia = backend.copia()
+    backend.detener()
+    assert copia["total_consultas"] == 4
+    assert copia["usuarios_unicos"].precision == 12
+    assert copia["usuarios_unicos"].estimar() == 1
+
+
+def test_sqlite_suma_las_consultas_de_varios_procesos(directorio_temporal):
+    ruta = str(directorio_temporal / "stats.sqlite3")
+    workers = [stats.EstadisticasSQLite(ruta), stats.EstadisticasSQLite(ruta)]
+    for worker in workers:
+        worker.iniciar()
+    for i in range(50):
+        workers[i % 2].registrar("2026-10-18", f"usuario_{i % 10}", "lisboa")
+    
+    # Cada worker ve sus consultas pendientes aunque aún no estén en la base
+    assert workers[0].copia()["total_consultas"] == 25
+    for worker in workers:
+        worker.detener()
+    
+    lector = stats.EstadisticasSQLite(ruta)
+    copia = lector.copia()
+    lector.detener()
+    assert copia["total_consultas"] == 50
+    assert copia["destinos_consultados"] == {"lisboa": 50}
+    assert copia["usuarios_unicos"].estimar() == 10
+    assert copia["usuarios_por_dia"]["2026-10-18"].estimar() == 10
+
+
+def test_memoria_recupera_el_log_tras_un_corte(monkeypatch, directorio_temporal):
+    monkeypatch.setattr(stats, "STATS_FLUSH_INTERVALO", 60)
+    backend = stats.EstadisticasEnMemoria()
+    backend.iniciar()
+    for fecha, usuario, destino in CONSULTAS:
+        backend.registrar(fecha, usuario, destino)
+    # Escribir el log sin compactar, como si el proceso muriera después
+    backend._escribir_pendientes()
+    
+    recuperadas, eventos_en_log = stats.cargar_snapshot_y_log()
+    assert eventos_en_log == 3
+    assert recuperadas["total_consultas"] == 3
+    assert recuperadas["destinos_consultados"] == {"paris": 2, "roma": 1}
+    backend.detener()
+
+
+def test_memoria_compacta_sin_duplicar(monkeypatch, directorio_temporal):
+    monkeypatch.setattr(stats, "STATS_FLUSH_INTERVALO", 60)
+    backend = stats.EstadisticasEnMemoria()
+    backend.iniciar()
+    for fecha, usuario, destino in CONSULTAS:
+        backend.registrar(fecha, usuario, destino)
+    backend._escribir_pendientes()
+    backend._compactar()
+    backend.registrar("2026-10-18", "eva", "lisboa")
+    backend.detener()
+    
+    # detener() deja todo en el snapshot y el log vacío
+    assert (directorio_temporal / "stats_eventos.jsonl").read_text() == ""
+    recuperadas, _ = stats.cargar_snapshot_y_log()
+    assert recuperadas["total_consultas"] == 4
+    assert recuperadas["ultimo_evento"] == 4
+    assert recuperadas["usuarios_unicos"].estimar() == 3
+    assert recuperadas["usuarios_por_dia"]["2026-10-18"].estimar() == 3
+    
+    # Un evento que quedó en el log y ya está en el snapshot no se cuenta dos veces
+    with open(directorio_temporal / "stats_eventos.jsonl", "w", encoding="utf-8") as f:
+        f.write('{"id": 4, "fecha": "2026-10-18", "usuario": "eva", "destino": "lisboa"}\n{"id": 5, "fec')
+    recuperadas, _ = stats.cargar_snapshot_y_log()
+    assert recuperadas["total_consultas"] == 4
+
+
+def test_memoria_no_vacia_el_log_si_falla_el_snapshot(monkeypatch, directorio_temporal):
+    monkeypatch.setattr(stats, "STATS_FLUSH_INTERVALO", 60)
+    backend = stats.EstadisticasEnMemoria()
+    backend.iniciar()
+    for fecha, usuario, destino in CONSULTAS:
+        backend.registrar(fecha, usuario, destino)
+    backend._escribir_pendientes()
+    
+    # El snapshot no se puede escribir: su ruta es un directorio
+    monkeypatch.setattr(stats, "STATS_FILE", str(directorio_temporal / "sin_permiso"))
+    (directorio_temporal / "sin_permiso.tmp").mkdir()
+    backend._compactar()
+    
+    assert not (directorio_temporal / "sin_permiso").exists()
+    recuperadas, eventos_en_log = stats.cargar_snapshot_y_log()
+    assert eventos_en_log == 3
+    assert recuperadas["total_consultas"] == 3
+    backend.detener()
+
+
+def test_memoria_reintenta_el_lote_si_falla_el_log(monkeypatch, directorio_temporal):
+    monkeypatch.setattr(stats, "STATS_FLUSH_INTERVALO", 60)
+    backend = stats.EstadisticasEnMemoria()
+    backend.iniciar()
+    backend.registrar(*CONSULTAS[0])
+    
+    ruta_log = stats.STATS_EVENTOS_FILE
+    monkeypatch.setattr(stats, "STATS_EVENTOS_FILE", str(directorio_temporal / "no_existe" / "eventos.jsonl"))
+    with pytest.raises(OSError):
+        backend._escribir_pendientes()
+    
+    monkeypatch.setattr(stats, "STATS_EVENTOS_FILE", ruta_log)
+    for consulta in CONSULTAS[1:]:
+        backend.registrar(*consulta)
+    backend._escribir_pendientes()
+    
+    recuperadas, eventos_en_log = stats.cargar_snapshot_y_log()
+    assert eventos_en_log == 3
+    assert recuperadas["total_consultas"] == 3
+    assert recuperadas["ultimo_evento"] == 3
+    backend.detener()
+
+
+def test_un_backend_incompleto_falla_al_crearse():
+    class SinCopia(stats.BackendEstadisticas):
+        def iniciar(self):
+            pass
+        
+        def detener(self):
+            pass
+        
+        def registrar(self, fecha, usuario_id, destino):
+            pass
+    
+    with pytest.raises(TypeError):
+        SinCopia()
@@ -0,0 +1,163 @@
+"""
+Almacén de Tipos de Cambio para ViajeIA
+
+Mantiene en memoria la tabla de tipos de cambio respecto al USD
+(exchangerate-api.io) y la refresca en segundo plano cada cierto intervalo.
+Las consultas son lecturas O(1) de un diccionario: si la tabla está vieja se
+devuelve igualmente el último valor y se lanza un refresco (stale-while-revalidate).
+
+Opcionalmente guarda un snapshot en disco para que un arranque en frío no
+dependa de que la API externa esté disponible.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional
+from logger_config import logger
+from http_client import obtener_cliente_http
+from metricas import LATENCIA_ETAPAS
+
+# Importar constantes de configuración
+try:
+    from config import TIPO_CAMBIO_INTERVALO, TIPO_CAMBIO_SNAPSHOT
+except ImportError:
+    # Valores por defecto si config.py no está disponible
+    TIPO_CAMBIO_INTERVALO = 3600
+    TIPO_CAMBIO_SNAPSHOT = "tipos_cambio.json"
+
+
+class AlmacenTiposCambio:
+    """Tabla de tipos de cambio en memoria con refresco periódico en segundo plano"""
+    
+    def __init__(self, intervalo: float = TIPO_CAMBIO_INTERVALO, ruta_snapshot: Optional[str] = TIPO_CAMBIO_SNAPSHOT):
+        """
+        Args:
+            intervalo: Segundos entre refrescos de la tabla
+            ruta_snapshot: Archivo donde guardar/cargar la última tabla (None o "" lo desactiva)
+        """
+        self.intervalo = intervalo
+        self.ruta_snapshot = ruta_snapshot or None
+        self._tasas: Dict[str, float] = {}
+        self._actualizado_en: float = 0.0
+        self._tarea_periodica: Optional[asyncio.Task] = None
+        self._tarea_refresco: Optional[asyncio.Task] = None
+    
+    @property
+    def obsoleto(self) -> bool:
+        """True si la tabla nunca se cargó o tiene más antigüedad que el intervalo"""
+        return time.time() - self._actualizado_en > self.intervalo
+    
+    def obtener_tasa(self, codigo_moneda: str) -> Optional[float]:
+        """
+        Obtiene cuántas unidades de la moneda equivalen a 1 USD.
+        
+        Args:
+            codigo_moneda: Código ISO 4217 de la moneda (ej: EUR, GBP, JPY)
+            
+        Returns:
+            Tasa de la moneda o None si no está en la tabla
+        """
+        if self.obsoleto:
+            self._refrescar_en_segundo_plano()
+        return self._tasas.get(codigo_moneda)
+    
+    async def actualizar(self) -> bool:
+        """
+        Descarga la tabla completa de tipos de cambio y la reemplaza en memoria.
+        
+        Returns:
+            True si la tabla se actualizó correctamente
+        """
+        try:
+            http = obtener_cliente_http("exchangerate")
+            with LATENCIA_ETAPAS.medir("tipo_cambio"):
+                response = await http.get("/v4/latest/USD")
+            
+            if response.status_code != 200:
+                logger.warning(f"Error al actualizar tipos de cambio: {response.status_code}")
+                return False
+            
+            tasas = response.json().get("rates", {})
+            if not tasas:
+                return False
+            
+            # Reemplazar la referencia completa: los lectores nunca ven una tabla a medias
+            self._tasas = tasas
+            self._actualizado_en = time.time()
+            logger.info(f"Tipos de cambio actualizados ({len(tasas)} monedas)")
+            
+            if self.ruta_snapshot:
+                await asyncio.to_thread(self._guardar_snapshot)
+            return True
+        
+        except Exception as e:
+            logger.warning(f"Error al actualizar tipos de cambio: {str(e)}")
+            return False
+    
+    def _refrescar_en_segundo_plano(self):
+        """Lanza un refresco si no hay uno en curso (requiere un event loop activo)"""
+        if self._tarea_refresco and not self._tarea_refresco.done():
+            return
+        try:
+            self._tarea_refresco = asyncio.get_running_loop().create_task(self.actualizar())
+        except RuntimeError:
+            # Sin event loop (por ejemplo, desde un script síncrono): usar la tabla actual
+            pass
+    
+    def _cargar_snapshot(self):
+        """Carga la última tabla guardada en disco (si existe)"""
+        if not self.ruta_snapshot or not os.path.exists(self.ruta_snapshot):
+            return
+        try:
+            with open(self.ruta_snapshot, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._tasas = data.get("rates", {})
+            self._actualizado_en = float(data.get("actualizado_en", 0))
+            logger.info(f"Tipos de cambio cargados desde {self.ruta_snapshot} ({len(self._tasas)} monedas)")
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            logger.warning(f"No se pudo cargar el snapshot de tipos de cambio: {e}")
+    
+    def _guardar_snapshot(self):
+        """Guarda la tabla actual en disco de forma atómica"""
+        ruta_temporal = f"{self.ruta_snapshot}.tmp"
+        try:
+            with open(ruta_temporal, 'w', encoding='utf-8') as f:
+                json.dump({"actualizado_en": self._actualizado_en, "rates": self._tasas}, f)
+            os.replace(ruta_temporal, self.ruta_snapshot)
+        except IOError as e:
+            logger.warning(f"Error al guardar el snapshot de tipos de cambio: {e}")
+    
+    async def _bucle_actualizacion(self):
+        """Refresca la tabla cada `intervalo` segundos"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.actualizar()
+    
+    async def iniciar(self):
+        """
+        Carga la tabla (snapshot en disco o API) e inicia el refresco periódico.
+        Se llama al iniciar la aplicación.
+        """
+        self._cargar_snapshot()
+        if self.obsoleto:
+            if self._tasas:
+                # Hay datos viejos del snapshot: arrancar con ellos y refrescar en paralelo
+                self._refrescar_en_segundo_plano()
+            else:
+                await self.actualizar()
+        self._tarea_periodica = asyncio.create_task(self._bucle_actualizacion())
+    
+    async def detener(self):
+        """Detiene el refresco periódico. Se llama al apagar la aplicación."""
+        for tarea in (self._tarea_periodica, self._tarea_refresco):
+            if tarea and not tarea.done():
+                tarea.cancel()
+                await asyncio.gather(tarea, return_exceptions=True)
+        self._tarea_periodica = None
+        self._tarea_refresco = None
+
+
+# Almacén global de tipos de cambio
+almacen_tipos_cambio = AlmacenTiposCambio()
@@ -29,6 +29,7 @@ function Asistente() {
   const [respuesta, setRespuesta] = useState('')
   const [cargando, setCargando] = useState(false)
   const [historial, setHistorial] = useState([])
+  const [conversacionId, setConversacionId] = useState(null)
   const [vistaActual, setVistaActual] = useState('principal')
   const [favoritos, setFavoritos] = useState([])
   const [estadisticas, setEstadisticas] = useState(null)
@@ -259,9 +260,13 @@ function Asistente() {
     try {
       const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000'
       const response = await axios.post(`${apiUrl}/api/planificar`, {
-        pregunta: preguntaActual
+        pregunta: preguntaActual,
+        conversacion_id: conversacionId
       })
       
+      // El historial queda en el servidor: basta con reenviar el id en la próxima pregunta
+      setConversacionId(response.data.conversacion_id || null)
+      
       const nuevaRespuesta = response.data.respuesta
       setRespuesta(nuevaRespuesta)
       